@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Fixture setup and teardown benchmarks, run through benchmarks/run.py.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pytest_containers import timing
+
+# overlay networks need a swarm
+pytestmark = pytest.mark.usefixtures('swarm')
+
+THROUGHPUT = int(os.getenv('BENCHMARK_THROUGHPUT', '20'))
+
+
+class TestContainer:
+
+    def test_container(self, container):
+        assert container.id
+
+
+class TestClientContainer:
+
+    def test_client_container(self, client_container):
+        assert client_container.id
+
+
+class TestDataContainer:
+
+    def test_data_container(self, data_container):
+        assert data_container.id
+
+
+class TestService:
+
+    def test_service(self, service):
+        assert service.id
+
+
+@pytest.mark.parametrize('network', ['default'], indirect=True)
+@pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+def test_container_throughput(container_factory, image, service_name, network, volumes, environment):
+    def start(_):
+        return container_factory(image=image, service_name=service_name, network=network, volumes=volumes,
+                                 environment=environment)
+    with timing.span('containers x{}'.format(THROUGHPUT), category='benchmark'):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            containers = list(executor.map(start, range(THROUGHPUT)))
+    assert len(containers) == THROUGHPUT
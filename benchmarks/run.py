@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark fixture setup and teardown against a fake Docker Engine and save the results as a baseline.
+
+The fixtures of bench_fixtures.py are run in process against
+:py:class:`pytest_containers.testing.engine.FakeEngine` listening on a unix socket,
+so no Docker daemon or network access is needed. Every request to the engine is
+delayed by ``--latency`` seconds to approximate a real daemon.
+
+Example:
+    python benchmarks/run.py --latency 0.005 --compare benchmarks/results/0.1.0-0.005.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from pytest_containers import timing
+from pytest_containers.testing.engine import FakeEngine
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+FIXTURES = ['container', 'client_container', 'network', 'volumes', 'data_container', 'service']
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import get_distribution
+        return get_distribution('pytest-containers').version
+    return version('pytest-containers')
+
+
+def _stats(durations):
+    durations = sorted(durations)
+
+    def percentile(fraction):
+        return durations[int(round(fraction * (len(durations) - 1)))]
+    return {'count': len(durations), 'mean': sum(durations) / len(durations), 'p50': percentile(0.5),
+            'p95': percentile(0.95), 'max': durations[-1]}
+
+
+def summarise(spans):
+    """Return the benchmark results of the recorded timing spans.
+    """
+    fixtures = {}
+    for phase, category in [('setup', timing.FIXTURE_SETUP), ('teardown', timing.FIXTURE_TEARDOWN)]:
+        for fixture in FIXTURES:
+            durations = [span['duration'] for span in spans if span['category'] == category and span['name'] == fixture]
+            if durations:
+                fixtures.setdefault(fixture, {})[phase] = _stats(durations)
+    operations = {}
+    for span in spans:
+        if span['category'] == timing.DOCKER:
+            operations.setdefault(span['name'], []).append(span['duration'])
+    throughput = {}
+    for span in spans:
+        if span['category'] == 'benchmark':
+            containers = int(span['name'].rpartition('x')[2])
+            throughput[span['name']] = {'containers': containers, 'seconds': span['duration'],
+                                        'per_second': containers / span['duration']}
+    return {'fixtures': fixtures, 'operations': dict((name, _stats(durations)) for name, durations in operations.items()),
+            'throughput': throughput}
+
+
+def compare(current, baseline):
+    """Return report lines comparing the p50 latencies and throughput of two results.
+    """
+    def change(new, old):
+        return '{:+.1f}%'.format((new - old) / old * 100) if old else 'n/a'
+    lines = []
+    for fixture, phases in sorted(current['fixtures'].items()):
+        for phase, stats in sorted(phases.items()):
+            old = baseline['fixtures'].get(fixture, {}).get(phase)
+            if old is not None:
+                lines.append('{} {} p50 {:.1f}ms -> {:.1f}ms ({})'.format(
+                    fixture, phase, old['p50'] * 1000, stats['p50'] * 1000, change(stats['p50'], old['p50'])))
+    for name, stats in sorted(current['throughput'].items()):
+        old = baseline['throughput'].get(name)
+        if old is not None:
+            lines.append('{} {:.1f}/s -> {:.1f}/s ({})'.format(
+                name, old['per_second'], stats['per_second'], change(stats['per_second'], old['per_second'])))
+    return lines
+
+
+def run(latency, throughput, latencies=None, pytest_args=None):
+    """Run the benchmarks and return the results, or None when a benchmark failed.
+    """
+    directory = tempfile.mkdtemp(prefix='pytest-containers-bench')
+    environ = dict(os.environ)
+    try:
+        with FakeEngine(os.path.join(directory, 'docker.sock'), latency=latency, latencies=latencies) as engine:
+            os.environ['DOCKER_HOST'] = engine.base_url
+            os.environ['BENCHMARK_THROUGHPUT'] = str(throughput)
+            for name in ['DOCKER_TLS_VERIFY', 'DOCKER_CERT_PATH']:
+                os.environ.pop(name, None)
+            spans_path = os.path.join(directory, 'spans.json')
+            code = pytest.main([os.path.join(HERE, 'bench_fixtures.py'), '-q', '-p', 'no:cacheprovider',
+                                '-o', 'log_cli=false', '--containers-durations=0',
+                                '--containers-timing-json', spans_path] + list(pytest_args or []))
+            requests = engine.requests
+        if code != 0:
+            return None
+        with open(spans_path) as spans_file:
+            results = summarise(json.load(spans_file))
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        shutil.rmtree(directory, ignore_errors=True)
+    results.update({'version': _version(), 'python': platform.python_version(), 'latency': latency,
+                    'latencies': latencies or {}, 'requests': requests})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every engine request')
+    parser.add_argument('--latencies', default=None,
+                        help='JSON file of seconds added to requests keyed by endpoint, e.g. "POST /containers/create"')
+    parser.add_argument('--throughput', type=int, default=20, help='containers created at once')
+    parser.add_argument('--output', default=None, help='baseline file, defaults to results/<version>-<latency>.json')
+    parser.add_argument('--compare', default=None, help='baseline file to compare the results with')
+    parser.add_argument('pytest_args', nargs='*', help='extra pytest arguments, e.g. --containers-pool-size=2')
+    args = parser.parse_args(argv)
+    latencies = None
+    if args.latencies is not None:
+        with open(args.latencies) as latencies_file:
+            latencies = json.load(latencies_file)
+    results = run(args.latency, args.throughput, latencies, args.pytest_args)
+    if results is None:
+        sys.stderr.write('benchmarks failed\n')
+        return 1
+    output = args.output or os.path.join(HERE, 'results', '{}-{}.json'.format(results['version'], args.latency))
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+    print('wrote {}'.format(output))
+    for fixture, phases in sorted(results['fixtures'].items()):
+        for phase, stats in sorted(phases.items()):
+            print('{} {}: {} runs, p50 {:.1f}ms, p95 {:.1f}ms'.format(
+                fixture, phase, stats['count'], stats['p50'] * 1000, stats['p95'] * 1000))
+    for name, stats in sorted(results['throughput'].items()):
+        print('{}: {:.1f} containers/s'.format(name, stats['per_second']))
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print('compared with {} ({}):'.format(args.compare, baseline['version']))
+        for line in compare(results, baseline):
+            print('  ' + line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
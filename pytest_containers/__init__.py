@@ -1,14 +1,39 @@
+import json
 import logging
 import os
 import time
 import random
 import re
+import threading
 
 import pytest
 
 import docker
 
+from . import apistats
+from . import capabilities
+from . import cassette
+from . import cleanup
 from . import dockerx
+from . import endpoints
+from . import execsession
+from . import images
+from . import kube
+from . import logs
+from . import networks
+from . import pool
+from . import provision
+from . import readiness
+from . import scheduling
+from . import shared
+from . import snapshots
+from . import templates
+from . import timing
+
+try:
+    from _pytest.skipping import evaluate_skip_marks
+except ImportError:
+    evaluate_skip_marks = None
 
 log = logging.getLogger(__name__)
 
@@ -22,17 +47,608 @@ def pytest_addoption(parser):
         default='2018',
         help='Set the value for the fixture "bar".'
     )
+    group.addoption(
+        '--containers-ready-timeout',
+        action='store',
+        dest='containers_ready_timeout',
+        type=float,
+        default=60,
+        help='Maximum number of seconds to wait for a container to become ready.'
+    )
+    group.addoption(
+        '--containers-ready-backoff',
+        action='store',
+        dest='containers_ready_backoff',
+        type=readiness.parse_backoff,
+        default=readiness.DEFAULT_BACKOFF,
+        help='Delay between container readiness checks as "initial,factor,maximum" seconds.'
+    )
+    group.addoption(
+        '--containers-network-timeout',
+        action='store',
+        dest='containers_network_timeout',
+        type=float,
+        default=30,
+        help='Maximum number of seconds to wait for a created network to be confirmed.'
+    )
+    group.addoption(
+        '--containers-network-start-period',
+        action='store',
+        dest='containers_network_start_period',
+        type=float,
+        default=5,
+        help='Seconds to sleep when a created network can not be confirmed by inspection.'
+    )
+    group.addoption(
+        '--containers-pool-size',
+        action='store',
+        dest='containers_pool_size',
+        type=int,
+        default=0,
+        help='Number of warm containers kept for each container configuration (0 disables the pool).'
+    )
+    group.addoption(
+        '--containers-teardown-workers',
+        action='store',
+        dest='containers_teardown_workers',
+        type=int,
+        default=8,
+        help='Number of containers removed concurrently during teardown.'
+    )
+    group.addoption(
+        '--containers-lookahead',
+        action='store',
+        dest='containers_lookahead',
+        type=int,
+        default=0,
+        help='Number of network and volume fixture instances provisioned ahead of the running test (0 disables).'
+    )
+    group.addoption(
+        '--containers-pull-parallelism',
+        action='store',
+        dest='containers_pull_parallelism',
+        type=int,
+        default=4,
+        help='Number of images of the collected modules pulled concurrently ahead of the tests (0 disables).'
+    )
+    group.addoption(
+        '--containers-reorder',
+        action='store_true',
+        dest='containers_reorder',
+        default=False,
+        help='Reorder tests to minimise the estimated setup cost of docker fixtures.'
+    )
+    group.addoption(
+        '--containers-cost-model',
+        action='store',
+        dest='containers_cost_model',
+        default=None,
+        help='JSON file of fixture setup seconds keyed by "fixture" or "fixture[param]" used by --containers-reorder.'
+    )
+    group.addoption(
+        '--containers-durations',
+        action='store',
+        dest='containers_durations',
+        type=int,
+        default=5,
+        help='Number of slowest fixtures and docker operations shown in the terminal summary (0 disables).'
+    )
+    group.addoption(
+        '--containers-timing-json',
+        action='store',
+        dest='containers_timing_json',
+        default=None,
+        help='Write the timed fixture, test and docker operation spans to this JSON file.'
+    )
+    group.addoption(
+        '--containers-trace',
+        action='store',
+        dest='containers_trace',
+        default=None,
+        help='Write the timed spans to this file in the Chrome trace event format.'
+    )
+    group.addoption(
+        '--containers-api-stats',
+        action='store_true',
+        dest='containers_api_stats',
+        default=False,
+        help='Count docker API requests by endpoint, test and fixture and report them in the terminal summary.'
+    )
+    group.addoption(
+        '--containers-api-budget',
+        action='store',
+        dest='containers_api_budget',
+        type=int,
+        default=None,
+        help='Fail tests whose setup and call make more docker API requests, see the containers_api_budget marker.'
+    )
+    group.addoption(
+        '--containers-record',
+        action='store',
+        dest='containers_record',
+        default=None,
+        help='Record the docker API exchanges of the plugin to this cassette file.'
+    )
+    group.addoption(
+        '--containers-replay',
+        action='store',
+        dest='containers_replay',
+        default=None,
+        help='Answer docker API requests from this cassette file instead of the docker daemon.'
+    )
+    group.addoption(
+        '--containers-volume-clone',
+        action='store',
+        dest='containers_volume_clone',
+        choices=templates.STRATEGIES,
+        default='tar',
+        help='How volumes are cloned from volume templates, auto picks overlay or reflink when the docker daemon '
+             'is reached over a unix socket and supports them and falls back to a tar copy. Only use overlay, '
+             'reflink or auto when the daemon sees the filesystem of this process, which it does not when the '
+             'tests run in a container with the docker socket mounted.'
+    )
+    group.addoption(
+        '--containers-stale-after',
+        action='store',
+        dest='containers_stale_after',
+        type=float,
+        default=24,
+        help='Hours after which resources left behind by earlier sessions are pruned when docker is first used, '
+             '0 disables the sweep.'
+    )
+    group.addoption(
+        '--containers-log-buffer',
+        action='store',
+        dest='containers_log_buffer',
+        type=int,
+        default=64,
+        help='Kilobytes of each container log kept in memory and attached to the reports of failing tests, '
+             '0 disables log capture.'
+    )
+    group.addoption(
+        '--containers-log-tail',
+        action='store',
+        dest='containers_log_tail',
+        type=int,
+        default=100,
+        help='Lines of each container log attached to the reports of failing tests.'
+    )
+    group.addoption(
+        '--containers-log-dir',
+        action='store',
+        dest='containers_log_dir',
+        default=None,
+        help='Directory the whole log of every container is written to.'
+    )
+    group.addoption(
+        '--containers-network-range',
+        action='store',
+        dest='containers_network_range',
+        default=None,
+        help='Address range in CIDR notation the subnets of bridge and overlay networks are taken from, '
+             'by default docker picks them from its default address pools.'
+    )
+    group.addoption(
+        '--containers-network-prefix',
+        action='store',
+        dest='containers_network_prefix',
+        type=int,
+        default=24,
+        help='Prefix length of the subnets taken from --containers-network-range.'
+    )
+    group.addoption(
+        '--containers-network-pool-size',
+        action='store',
+        dest='containers_network_pool_size',
+        type=int,
+        default=0,
+        help='Number of idle bridge and overlay networks kept for reuse by the network fixture, 0 disables the pool.'
+    )
+    group.addoption(
+        '--containers-exec-timeout',
+        action='store',
+        dest='containers_exec_timeout',
+        type=float,
+        default=60,
+        help='Seconds a command run by the client_session fixture may take before it is killed.'
+    )
+    group.addoption(
+        '--containers-capabilities',
+        action='store',
+        dest='containers_capabilities',
+        choices=capabilities.MODES,
+        default='skip',
+        help='Skip or deselect parametrizations which the docker daemon, kubernetes and installed tools of this host '
+             'can not run, off runs them all.'
+    )
+    group.addoption(
+        '--containers-capabilities-max-age',
+        action='store',
+        dest='containers_capabilities_max_age',
+        type=float,
+        default=1,
+        help='Hours the capabilities of this host are cached for, 0 probes them in every session.'
+    )
+    group.addoption(
+        '--containers-snapshot',
+        action='store_true',
+        dest='containers_snapshot',
+        default=False,
+        help='Commit containers after their container_init hook and start later containers from the snapshot.'
+    )
+    group.addoption(
+        '--containers-snapshot-max-age',
+        action='store',
+        dest='containers_snapshot_max_age',
+        type=float,
+        default=168,
+        help='Hours after which snapshots are removed at the end of the session.'
+    )
+    group.addoption(
+        '--containers-snapshot-max-size',
+        action='store',
+        dest='containers_snapshot_max_size',
+        type=int,
+        default=10240,
+        help='Megabytes of snapshots kept at the end of the session, the oldest beyond are removed.'
+    )
 
     parser.addini('HELLO', 'Dummy pytest.ini setting')
 
 
+def pytest_configure(config):
+    config._containers_readiness = readiness.ReadinessReport()
+    config._containers_timeline = timing.Timeline()
+    timing.activate(config._containers_timeline)
+    config.addinivalue_line('markers', 'containers_api_budget(requests): fail the test when its setup and call '
+                                       'make more docker API requests.')
+    config._containers_api = None
+    if config.getoption('containers_api_stats') or config.getoption('containers_api_budget') is not None:
+        config._containers_api = apistats.ApiStats(config._containers_timeline)
+    config._containers_cassette = None
+    record, replay = config.getoption('containers_record'), config.getoption('containers_replay')
+    if record is not None and replay is not None:
+        raise pytest.UsageError('--containers-record and --containers-replay are mutually exclusive')
+    if record is not None:
+        config._containers_cassette = cassette.Cassette(timing.output_path(record, shared.worker_id()))
+    elif replay is not None:
+        config._containers_cassette = cassette.Cassette(timing.output_path(replay, shared.worker_id()), replaying=True)
+    config._containers_logs = None
+    # replayed sessions have no daemon whose logs could be followed
+    if config.getoption('containers_log_buffer') > 0 and replay is None:
+        log_dir = config.getoption('containers_log_dir')
+        config._containers_logs = logs.LogCollector(
+            config.getoption('containers_log_buffer') * 1024,
+            timing.output_path(log_dir, shared.worker_id()) if log_dir is not None else None)
+    config._containers_session = random_name('session')
+    config._containers_swept = False
+    config._containers_templates = templates.TemplateStore(config.getoption('containers_volume_clone'))
+    config._containers_shared = None
+    # pre-pulls take the lock of the image fixture, so only one xdist worker pulls each image
+    config._containers_images = images.ImageRegistry(client_factory=lambda: _docker_client(config),
+                                                     parallelism=config.getoption('containers_pull_parallelism'),
+                                                     lock=lambda name: _shared_resources(config).lock(name))
+    config._containers_subnets = None
+    network_range = config.getoption('containers_network_range')
+    if network_range is not None:
+        try:
+            config._containers_subnets = networks.SubnetAllocator(
+                networks.worker_range(network_range, shared.worker_id(),
+                                      int(os.getenv('PYTEST_XDIST_WORKER_COUNT', '1'))),
+                config.getoption('containers_network_prefix'))
+        except ValueError as err:
+            raise pytest.UsageError('--containers-network-range: {}'.format(err))
+    config._containers_provisioner = None
+    lookahead = config.getoption('containers_lookahead')
+    if lookahead > 0 and shared.worker_id() != 'master':
+        # each worker runs only part of the collected items
+        log.info('lookahead provisioning is disabled on pytest-xdist workers')
+    elif lookahead > 0:
+        provisioner = provision.Provisioner(lookahead, client_factory=lambda: _docker_client(config))
+        if config.getoption('containers_network_pool_size') <= 0:
+            # pooled networks are reused rather than created ahead of time
+            provisioner.register('network', lambda client, spec: _create_network(client, config, *spec),
+                                 lambda client, network: _remove_network(config, network))
+        provisioner.register('volumes', lambda client, spec: _provision_named_volumes(client, config, spec),
+                             _remove_named_volumes)
+        config._containers_provisioner = provisioner
+    config._containers_costs = None
+    config._containers_schedule = None
+    if config.getoption('containers_reorder'):
+        cache = getattr(config, 'cache', None)
+        measured = cache.get(FIXTURE_COSTS_KEY, {}) if cache is not None else {}
+        cost_model = config.getoption('containers_cost_model')
+        if cost_model is not None:
+            with open(cost_model) as cost_model_file:
+                measured.update(json.load(cost_model_file))
+        config._containers_costs = scheduling.CostModel(measured)
+
+
+FIXTURE_COSTS_KEY = 'pytest_containers/fixture_costs'
+
+
+def pytest_unconfigure(config):
+    timing.activate(None)
+
+
+def _docker_client(config):
+    recorded = config._containers_cassette
+    if recorded is not None and recorded.replaying:
+        # the recorded api version saves the version request, which has no daemon to answer it
+        client = recorded.install(dockerx.from_env(version=recorded.api_version))
+    elif recorded is not None:
+        client = recorded.install(dockerx.from_env())
+    else:
+        client = dockerx.from_env()
+    if config._containers_api is not None:
+        config._containers_api.instrument(client)
+    with _sweep_lock:
+        if not config._containers_swept:
+            config._containers_swept = True
+            # in the background, so the requests are not attributed to the fixture which made the first client
+            config._containers_sweeper = threading.Thread(target=_prune_stale, args=(config,),
+                                                          name='containers-stale-prune')
+            config._containers_sweeper.daemon = True
+            config._containers_sweeper.start()
+    return client
+
+
+_sweep_lock = threading.Lock()
+
+
+def _labels(config):
+    return {'pytest_fixture': '', cleanup.SESSION_LABEL: config._containers_session}
+
+
+def _label_options(labels):
+    return ' '.join('--label {}{}'.format(key, '=' + value if value else '') for key, value in sorted(labels.items()))
+
+
+def _prune_stale(config):
+    stale_after = config.getoption('containers_stale_after')
+    if stale_after <= 0:
+        return
+    # resources of crashed sessions, younger ones may belong to sessions still running on this host
+    until = time.time() - stale_after * 3600
+    client = _docker_client(config)
+    try:
+        with timing.span('stale prune'):
+            cleanup.prune(client, ['pytest_fixture'], until=until,
+                          max_workers=config.getoption('containers_teardown_workers'))
+    except (cleanup.TeardownError, docker.errors.APIError) as err:
+        log.warning('resources left behind by earlier sessions could not be pruned: {}'.format(err))
+    finally:
+        client.close()
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    _prune_unsatisfiable(config, items)
+    if config._containers_costs is not None:
+        config._containers_schedule = scheduling.reorder(items, config._containers_costs)
+    if config._containers_api is None and any(item.get_closest_marker('containers_api_budget') for item in items):
+        config._containers_api = apistats.ApiStats(config._containers_timeline)
+    modules = set(item.module for item in items if isinstance(item, pytest.Function) and 'image' in item.fixturenames)
+    registry = os.getenv('DOCKER_REGISTRY', '')
+    config._containers_images.prefetch(
+        _image_repo_tag(registry, getattr(module, 'service_name', 'python-hello')) for module in modules)
+    if config._containers_provisioner is not None:
+        # skipped tests, including the ones this host can not run, never take their fixtures
+        config._containers_provisioner.plan([item for item in items if not _skipped(item)], _lookahead_needs)
+
+
+def _skipped(item):
+    if evaluate_skip_marks is None:
+        return item.get_closest_marker('skip') is not None or item.get_closest_marker('skipif') is not None
+    try:
+        # the skip and skipif markers evaluated like pytest does when the test is set up
+        return evaluate_skip_marks(item) is not None
+    except Exception:
+        # pytest fails the test on a broken condition
+        return True
+
+
+CAPABILITIES_KEY = 'pytest_containers/capabilities'
+
+
+def _needs_capabilities(item):
+    if {'service', 'kubernetes_client'} & set(item.fixturenames):
+        return True
+    return bool(set(getattr(getattr(item, 'callspec', None), 'params', {})) & {'orchestrator', 'network'})
+
+
+def _prune_unsatisfiable(config, items):
+    mode = config.getoption('containers_capabilities')
+    # replayed sessions have no daemon to probe
+    if mode == 'off' or (config._containers_cassette is not None and config._containers_cassette.replaying):
+        return
+    candidates = [item for item in items if isinstance(item, pytest.Function) and _needs_capabilities(item)]
+    if not candidates:
+        return
+    found = capabilities.cached_probe(getattr(config, 'cache', None), CAPABILITIES_KEY, dockerx.from_env,
+                                      config.getoption('containers_capabilities_max_age') * 3600)
+    deselected = []
+    for item in candidates:
+        params = item.callspec.params if hasattr(item, 'callspec') else {}
+        reason = capabilities.unsatisfiable(params, item.fixturenames, found)
+        if reason is None:
+            continue
+        log.info('{} can not run here: {}'.format(item.nodeid, reason))
+        if mode == 'deselect':
+            deselected.append(item)
+        else:
+            item.add_marker(pytest.mark.skip(reason=reason))
+    if deselected:
+        items[:] = [item for item in items if item not in deselected]
+        config.hook.pytest_deselected(items=deselected)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item):
+    if item.config._containers_provisioner is not None:
+        item.config._containers_provisioner.advance(item)
+    if item.config._containers_logs is not None:
+        item.config._containers_logs.discard_finished()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    timeline = item.config._containers_timeline
+    timeline.test = item.nodeid
+    with timeline.span(item.nodeid, timing.TEST):
+        yield
+    timeline.test = None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if item.config._containers_api is not None and call.when == 'call' and report.passed:
+        _check_api_budget(item, report)
+    if item.config._containers_logs is not None and report.failed:
+        for title, text in item.config._containers_logs.sections(item.config.getoption('containers_log_tail')):
+            report.sections.append((title, text))
+
+
+def _check_api_budget(item, report):
+    api = item.config._containers_api
+    marker = item.get_closest_marker('containers_api_budget')
+    budget = marker.args[0] if marker is not None else item.config.getoption('containers_api_budget')
+    if budget is None:
+        return
+    requests = api.requests(item.nodeid)
+    if sum(requests.values()) > budget:
+        lines = ['  {} {}'.format(count, name) for name, count in sorted(requests.items(), key=lambda x: -x[1])]
+        report.outcome = 'failed'
+        report.longrepr = 'docker API budget exceeded: {} requests made during setup and call, {} allowed\n{}'.format(
+            sum(requests.values()), budget, '\n'.join(lines))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    timeline = request.config._containers_timeline
+    started = time.time()
+    with timeline.fixture(fixturedef.argname):
+        yield
+    timeline.record(fixturedef.argname, timing.FIXTURE_SETUP, started, time.time() - started)
+    # runs after the finalizers of dependent fixtures, right before the fixture's own teardown
+    fixturedef.addfinalizer(lambda: timeline.begin_teardown(fixturedef.argname, id(fixturedef)))
+    costs = request.config._containers_costs
+    if costs is not None and fixturedef.scope != 'function':
+        param = getattr(request, 'param', None)
+        costs.observe(fixturedef.argname, None if param is None else str(param), time.time() - started)
+
+
+def pytest_fixture_post_finalizer(fixturedef, request):
+    request.config._containers_timeline.end_teardown(fixturedef.argname, id(fixturedef))
+
+
+def pytest_sessionfinish(session):
+    cache = getattr(session.config, 'cache', None)
+    if session.config._containers_costs is not None and cache is not None:
+        cache.set(FIXTURE_COSTS_KEY, session.config._containers_costs.measured)
+    if session.config._containers_provisioner is not None:
+        session.config._containers_provisioner.close()
+    session.config._containers_images.close()
+    session.config._containers_templates.close()
+    if session.config._containers_logs is not None:
+        session.config._containers_logs.close()
+    if session.config._containers_swept:
+        session.config._containers_sweeper.join()
+        # removes whatever the fixture teardowns of this session left behind
+        client = _docker_client(session.config)
+        try:
+            with timing.span('session prune'):
+                cleanup.prune(client, ['{}={}'.format(cleanup.SESSION_LABEL, session.config._containers_session)],
+                              max_workers=session.config.getoption('containers_teardown_workers'))
+        except (cleanup.TeardownError, docker.errors.APIError) as err:
+            log.warning('resources of this session could not be pruned: {}'.format(err))
+        client.close()
+    timeline = session.config._containers_timeline
+    for option, data in [('containers_timing_json', timeline.to_json), ('containers_trace', timeline.to_trace)]:
+        path = session.config.getoption(option)
+        if path is not None:
+            timing.write(timing.output_path(path, shared.worker_id()), data())
+    if session.config._containers_cassette is not None and not session.config._containers_cassette.replaying:
+        session.config._containers_cassette.save()
+
+
+def _lookahead_needs(item):
+    if not isinstance(item, pytest.Function):
+        return []
+    # mirror the scope and parameters which the class scoped network and volumes fixtures will see
+    params = getattr(item, 'callspec', None)
+    params = params.params if params is not None else {}
+    # class scoped fixtures of functions outside of a class are cached on the function itself
+    scope = item.getparent(pytest.Class) or item
+    service_name = getattr(item.module, 'service_name', 'python-hello')
+    needs = []
+    if 'network' in item.fixturenames and params.get('network') in ['bridge', 'overlay']:
+        needs.append(('network', (scope.nodeid, params['network']), (service_name, params['network'])))
+    if 'volumes' in item.fixturenames and params.get('volumes') == 'named':
+        repo_tag = _image_repo_tag(os.getenv('DOCKER_REGISTRY', ''), service_name)
+        needs.append(('volumes', (scope.nodeid, 'named'), (service_name, repo_tag)))
+    return needs
+
+
+def pytest_terminal_summary(terminalreporter):
+    lines = terminalreporter.config._containers_readiness.summary()
+    if lines:
+        terminalreporter.write_sep('-', 'containers readiness waits')
+        for line in lines:
+            terminalreporter.write_line(line)
+    durations = terminalreporter.config.getoption('containers_durations')
+    lines = terminalreporter.config._containers_timeline.summary(durations) if durations > 0 else []
+    if lines:
+        terminalreporter.write_sep('-', 'containers slowest durations')
+        for line in lines:
+            terminalreporter.write_line(line)
+    api = terminalreporter.config._containers_api
+    lines = api.summary(max(durations, 1)) if api is not None else []
+    if lines:
+        terminalreporter.write_sep('-', 'containers api requests')
+        for line in lines:
+            terminalreporter.write_line(line)
+    schedule = terminalreporter.config._containers_schedule
+    if schedule is not None:
+        terminalreporter.write_sep('-', 'containers test order')
+        if schedule.applied:
+            terminalreporter.write_line('reordered tests: {} fixture setups instead of {}, estimated {:.1f}s saved'.format(
+                schedule.setups_after, schedule.setups_before, schedule.cost_before - schedule.cost_after))
+        else:
+            terminalreporter.write_line('kept default order: {} fixture setups (~{:.1f}s)'.format(
+                schedule.setups_before, schedule.cost_before))
+
+
 @pytest.fixture
 def bar(request):
     return request.config.option.dest_foo
 
 
+def _shared_resources(config):
+    if config._containers_shared is None:
+        # pytest 3.9 replaced the tmpdir handler by the tmp_path factory
+        factory = getattr(config, '_tmp_path_factory', None) or config._tmpdirhandler
+        basetemp = str(factory.getbasetemp())
+        # every xdist worker has its own basetemp below the basetemp of the test run
+        directory = basetemp if shared.worker_id() == 'master' else os.path.dirname(basetemp)
+        config._containers_shared = shared.SharedResources(directory)
+    return config._containers_shared
+
+
 @pytest.fixture(scope='session')
-def docker_client():
+def shared_resources(request):
+    """Return coordinator used to share session resources between pytest-xdist workers.
+
+    The swarm and image pulls are shared so that only one worker creates them and the
+    swarm is only left once the last worker using it has finished.
+    """
+    return _shared_resources(request.config)
+
+
+@pytest.fixture(scope='session')
+def docker_client(request):
     """Return session scoped docker client used to communicate with docker daemon via api or cli.
 
     Example:
@@ -42,7 +658,7 @@ def docker_client():
         >>>     assert 'Version' in ressult
 
     """
-    client = dockerx.from_env()
+    client = _docker_client(request.config)
     yield client
     client.close()
 
@@ -68,23 +684,41 @@ def service_name(request):
     return service_name
 
 
+@pytest.fixture(scope='module')
+def service_port(request):
+    """Return port the service under test listens on.
+    """
+    return getattr(request.module, 'service_port', 8080)
+
+
 def random_name(name = None):
     name = '' if name == None else '_' + name
     return u'pytest{0}_{1:x}'.format(name, random.getrandbits(64))
 
 
+def _image_repo_tag(docker_registry, service_name):
+    docker_image_name = service_name if service_name != 'python-hello' else 'google/python-hello'
+    docker_image_tag = os.getenv('DOCKER_IMAGE_TAG', 'latest')
+    return '{}{}{}:{}'.format(docker_registry, '/' if docker_registry != '' else '', docker_image_name, docker_image_tag)
+
+
+@pytest.fixture(scope='session')
+def image_registry(request):
+    """Return session cache of images indexed by repo:tag and digest.
+
+    Images of every collected module are pulled concurrently after collection,
+    see ``--containers-pull-parallelism``.
+    """
+    return request.config._containers_images
+
+
 @pytest.fixture(scope='module')
-def image(request, docker_client, docker_registry, service_name):
+def image(request, docker_client, docker_registry, service_name, shared_resources, image_registry):
     """Return image under test.
     """
-    docker_image_name = service_name if service_name != 'python-hello' else 'google/python-hello'
-    docker_image_tag = os.getenv('DOCKER_IMAGE_TAG', 'latest')
-    docker_image_repo_tag ='{}{}{}:{}'.format(docker_registry, '/' if docker_registry != '' else '', docker_image_name, docker_image_tag)
-    try:
-        image = docker_client.images.get(docker_image_repo_tag)
-    except docker.errors.ImageNotFound:
-        image = docker_client.images.pull(docker_image_repo_tag)
-    return image
+    docker_image_repo_tag = _image_repo_tag(docker_registry, service_name)
+    # only one xdist worker pulls, the others find the image once the lock is released
+    return image_registry.get(docker_client, docker_image_repo_tag, lock=shared_resources.lock)
 
 
 @pytest.fixture(scope='session', params=[None, "swarm", "kubernetes", "compose", "maestro"])
@@ -97,23 +731,33 @@ def orchestrator(request):
 
 
 @pytest.fixture(scope='session')
-def swarm(request, docker_client):
+def swarm(request, docker_client, shared_resources):
     """Setup Docker Swarm used during test session.
+
+    With pytest-xdist the swarm is initialized by the first worker and only left
+    when the last worker using it has finished.
     """
-    swarm_preexist = False
-    try:
-        log.info('docker swarm init')
-        if docker_client.swarm.init():
-            log.info('Swarm initialized: current node is now a manager.')
-    except docker.errors.APIError as err:
-        log.info(err.explanation)
-        swarm_preexist = True
+    def _init():
+        try:
+            log.info('docker swarm init')
+            with timing.span('swarm init'):
+                initialized = docker_client.swarm.init()
+            if initialized:
+                log.info('Swarm initialized: current node is now a manager.')
+        except docker.errors.APIError as err:
+            log.info(err.explanation)
+            return {'preexist': True}
+        return {'preexist': False}
+    def _leave(state):
+        if state['preexist'] is not True:
+            log.info('docker swarm leave --force')
+            with timing.span('swarm leave'):
+                docker_client.swarm.leave(force=True)
+            log.info('Node left the swarm.')
+    shared_resources.acquire('swarm', _init)
     swarm = True
     yield swarm
-    if swarm_preexist is not True:
-        log.info('docker swarm leave --force')
-        docker_client.swarm.leave(force=True)
-        log.info('Node left the swarm.')
+    shared_resources.release('swarm', _leave)
 
 
 @pytest.fixture(scope='session', params=["none", "named"])
@@ -138,24 +782,44 @@ def log_handler(request):
 
 
 @pytest.fixture(scope='class')
-def data_container(docker_client, image, service_name):
+def data_container(request, docker_client, image, service_name):
     """Return docker volume container.
+
+    The container is created but never started, its volumes exist for as long as the container does.
     """
     log.info('setup data container')
     data_container_name = random_name(service_name + '_data')
-    command = 'sleep 30'
-    labels = ['pytest_fixture']
-    log.info('docker container run -d --name {} --label {} {} {}'.format(data_container_name, labels[0], image.attrs['RepoTags'][0], command))
-    container = docker_client.containers.run(image=image, name=data_container_name, labels=labels, command=command, detach=True)
+    labels = _labels(request.config)
+    log.info('docker container create --name {} {} {}'.format(data_container_name, _label_options(labels), image.attrs['RepoTags'][0]))
+    with timing.span('container create'):
+        container = docker_client.containers.create(image=image, name=data_container_name, labels=labels)
     log.info('data container id = {}'.format(container.short_id))
     yield container
     log.info('teardown data container')
     log.info('docker container rm --volumes --force {}'.format(container.id))
-    container.remove(v=True, force=True)
+    with timing.span('container rm'):
+        container.remove(v=True, force=True)
+
+
+@pytest.fixture(scope='class')
+def volume_templates(request):
+    """ Return dict of volume target paths to the directory or tar file each volume is seeded from.
+
+    Templates are prepared once per session and cloned for every volume, see ``--containers-volume-clone``.
+    Relative paths are relative to the test module. Anonymous volumes are not seeded.
+
+    Example:
+        >>> @pytest.fixture(scope='class')
+        >>> def volume_templates():
+        >>>     return {'/data': 'data/fixtures.tar.gz'}
+
+    """
+    volume_templates = {}
+    yield volume_templates
 
 
 @pytest.fixture(scope='class', params=['bind', 'anonymous', 'named', 'container'])
-def volumes(request, docker_client, service_name, image):
+def volumes(request, docker_client, service_name, image, volume_templates):
     """Return docker volume based on parameter.
 
     Parameters:
@@ -163,19 +827,27 @@ def volumes(request, docker_client, service_name, image):
         anonymous: volume is created and handled by docker engine
         named: volume is created and handled by docker engine using name provided
         container: volume shared from data container
+
+    Volumes whose target has a template in ``volume_templates`` are seeded with a clone of it.
     """
     log.info('setup volumes')
-    volumes = []
-    # discover volume target paths by inspecting image
-    image_volumes = image.attrs['Config']['Volumes'] or []
-    for image_volume in image_volumes:
-        volumes.append({'type': request.param, 'source': '', 'target': image_volume})
-    if request.param == 'named':
+    volumes = _image_volumes(image, request.param)
+    module_dir = os.path.dirname(str(request.fspath))
+    sources = dict((target, os.path.join(module_dir, source)) for target, source in volume_templates.items())
+    store = request.config._containers_templates
+    provisioner = request.config._containers_provisioner
+    provisioned = None
+    if request.param == 'named' and provisioner is not None:
+        provisioned = provisioner.take('volumes', (request.node.nodeid, 'named'))
+    if provisioned is not None:
+        volumes = provisioned
+        # provisioned volumes are created empty
         for volume in volumes:
-            volume['source'] = random_name(service_name + '_' + os.path.basename(volume['target']))
-            labels = ['pytest_fixture']
-            log.info('docker volume create --label {} {}'.format(labels, volume['source']))
-            docker_client.volumes.create(name=volume['source'], driver='local', labels=labels)
+            if volume['target'] in sources:
+                store.populate_volume(docker_client, sources[volume['target']], volume['source'],
+                                      _labels(request.config), image, volume['target'])
+    elif request.param == 'named':
+        _create_named_volumes(docker_client, volumes, service_name, _labels(request.config), sources, store, image)
     elif request.param == 'bind':
         tmpdir_factory = request.getfixturevalue('tmpdir_factory')
         name = request.node.name
@@ -184,27 +856,89 @@ def volumes(request, docker_client, service_name, image):
         for volume in volumes:
             datadir = tmpdir.mkdir(service_name + '_' + os.path.basename(volume['target']))
             log.info('mkdir {}'.format(datadir))
+            if volume['target'] in sources:
+                log.info('cp -a {}/. {}'.format(sources[volume['target']], datadir))
+                store.clone_directory(sources[volume['target']], str(datadir))
             volume['source'] = datadir
     elif request.param == 'container':
         data_container = request.getfixturevalue('data_container')
         for volume in volumes:
             volume['source'] = '{}'.format(data_container.id)
+            if volume['target'] in sources:
+                log.info('docker container cp {} {}:{}'.format(sources[volume['target']], data_container.short_id,
+                                                               volume['target']))
+                store.populate_container(data_container, sources[volume['target']], volume['target'])
     else:
         log.info('anonymous volume will be created with docker container')
     yield volumes
     log.info('teardown volumes')
     if request.param == 'named':
         # named volumes are not automatically removed by docker
-        for volume in volumes:
-            log.info('docker volume rm {}'.format(volume['source']))
-            volume = docker_client.volumes.get(volume['source'])
-            volume.remove()
+        _remove_named_volumes(docker_client, volumes)
     elif request.param == 'anonymous':
         log.info('anonymous volumes will be removed with container')
 
 
+def _image_volumes(image, volume_type):
+    # discover volume target paths by inspecting image
+    image_volumes = image.attrs['Config']['Volumes'] or []
+    return [{'type': volume_type, 'source': '', 'target': image_volume} for image_volume in image_volumes]
+
+
+def _create_named_volumes(docker_client, volumes, service_name, labels, sources=None, store=None, image=None):
+    for volume in volumes:
+        volume['source'] = random_name(service_name + '_' + os.path.basename(volume['target']))
+        if sources and volume['target'] in sources:
+            store.clone_volume(docker_client, sources[volume['target']], volume['source'], labels, image,
+                               volume['target'])
+            continue
+        log.info('docker volume create {} {}'.format(_label_options(labels), volume['source']))
+        with timing.span('volume create'):
+            docker_client.volumes.create(name=volume['source'], driver='local', labels=labels)
+
+
+def _remove_named_volumes(docker_client, volumes):
+    for volume in volumes:
+        log.info('docker volume rm {}'.format(volume['source']))
+        with timing.span('volume rm'):
+            volume = docker_client.volumes.get(volume['source'])
+            volume.remove()
+
+
+def _provision_named_volumes(docker_client, config, spec):
+    service_name, repo_tag = spec
+    try:
+        image = docker_client.images.get(repo_tag)
+    except docker.errors.ImageNotFound:
+        # leave pulling to the image fixture
+        return None
+    volumes = _image_volumes(image, 'named')
+    _create_named_volumes(docker_client, volumes, service_name, _labels(config))
+    return volumes
+
+
+@pytest.fixture(scope='session')
+def network_pool(request, docker_client):
+    """ Return pool of bridge and overlay networks shared by network fixtures, or None when disabled.
+
+    Enabled with ``--containers-network-pool-size`` which sets the number of idle networks kept for each
+    driver. Networks are detached from leftover containers when they are returned and reused.
+    """
+    size = request.config.getoption('containers_network_pool_size')
+    if size <= 0:
+        yield None
+        return
+    log.info('setup network pool of size {}'.format(size))
+    network_pool = networks.NetworkPool(
+        size, lambda driver: _create_network(docker_client, request.config, 'pool', driver),
+        lambda network: _remove_network(request.config, network))
+    yield network_pool
+    log.info('teardown network pool')
+    network_pool.close()
+
+
 @pytest.fixture(scope='class', params=['host', 'default', 'bridge', 'overlay'])
-def network(request, docker_client, service_name):
+def network(request, docker_client, service_name, network_pool):
     """Return docker network based on parameter.
 
     Parameters:
@@ -225,19 +959,21 @@ def network(request, docker_client, service_name):
 
     """
     log.info('setup network')
-    network_name = random_name(service_name)
-    if request.param not in ['host', 'default']:
-        labels = {'pytest_fixture': ''}
-        log.info('docker network create --label {} --driver {} --attachable {}'.format(labels, request.param, network_name))
-        network = docker_client.networks.create(name=network_name, driver=request.param, labels=labels, attachable=True)
-        network_start_period = 5
-        log.info('waiting {} seconds for network creation to complete'.format(network_start_period))
-        time.sleep(network_start_period)
+    if request.param not in ['host', 'default'] and network_pool is not None:
+        network = network_pool.acquire(request.param)
+    elif request.param not in ['host', 'default']:
+        provisioner = request.config._containers_provisioner
+        network = None
+        if provisioner is not None:
+            network = provisioner.take('network', (request.node.nodeid, request.param))
+        if network is None:
+            network = _create_network(docker_client, request.config, service_name, request.param)
     else:
         network_name = request.param if request.param != 'default' else 'bridge'
         log.info('docker network ls --filter type=builtin --filter name={}'.format(network_name))
-        networks = docker_client.networks.list(names=[network_name])
-        for possible_network in networks:
+        with timing.span('network ls'):
+            builtin_networks = docker_client.networks.list(names=[network_name])
+        for possible_network in builtin_networks:
             if possible_network.name == network_name:
                 network = possible_network
                 break
@@ -246,9 +982,64 @@ def network(request, docker_client, service_name):
     log.info('teardown network')
     if network.name in ['host', 'bridge']:
         log.info('no need to remove builtin network named "{}"'.format(network.name))
+    elif network_pool is not None and network_pool.owns(network):
+        log.info('returning network {} to the pool'.format(network.name))
+        with timing.span('network release'):
+            network_pool.release(network)
     else:
-        log.info('docker network rm {}'.format(network.name))
-        network.remove()
+        _remove_network(request.config, network)
+
+
+def _create_network(docker_client, config, service_name, driver):
+    network_name = random_name(service_name)
+    labels = _labels(config)
+    subnets = config._containers_subnets
+    while True:
+        subnet = subnets.allocate(docker_client) if subnets is not None else None
+        ipam = None
+        if subnet is not None:
+            ipam = docker.types.IPAMConfig(pool_configs=[docker.types.IPAMPool(subnet=subnet)])
+        log.info('docker network create {} --driver {} --attachable {}{}'.format(
+            _label_options(labels), driver, '' if subnet is None else '--subnet {} '.format(subnet), network_name))
+        try:
+            with timing.span('network create'):
+                network = docker_client.networks.create(name=network_name, driver=driver, labels=labels,
+                                                        attachable=True, ipam=ipam)
+            break
+        except docker.errors.APIError as err:
+            if subnet is None or not networks.overlaps(err):
+                if subnet is not None:
+                    subnets.release(subnet)
+                raise
+            log.info('subnet {} is used outside of this test run, trying the next one'.format(subnet))
+            subnets.exclude(subnet)
+    network_timeout = config.getoption('containers_network_timeout')
+    log.info('waiting up to {} seconds for network creation to complete'.format(network_timeout))
+    network_started = time.time()
+    try:
+        with timing.span('network ready wait'):
+            waited = readiness.wait_for_network(network, timeout=network_timeout)
+        config._containers_readiness.record('network ' + driver, waited)
+    except readiness.NetworkNotReady as err:
+        network_start_period = config.getoption('containers_network_start_period')
+        log.warning('{}, falling back to waiting {} seconds'.format(err, network_start_period))
+        with timing.span('network start period sleep'):
+            time.sleep(network_start_period)
+        config._containers_readiness.record('network {} (fallback)'.format(driver), time.time() - network_started)
+    return network
+
+
+def _remove_network(config, network):
+    log.info('docker network rm {}'.format(network.name))
+    try:
+        with timing.span('network rm'):
+            network.remove()
+    finally:
+        # should the network stay, creating one with its subnet fails with an overlap and excludes the subnet
+        if config._containers_subnets is not None:
+            subnet = networks.subnet_of(network)
+            if subnet is not None:
+                config._containers_subnets.release(subnet)
 
 
 @pytest.fixture(scope='class')
@@ -259,14 +1050,144 @@ def environment(request):
     yield environment
 
 
+@pytest.fixture(scope='class')
+def readiness_probes(request):
+    """ Return list of callables which must all return true before a container is ready.
+
+    Example:
+        >>> @pytest.fixture(scope='class')
+        >>> def readiness_probes():
+        >>>     return [lambda container: container.exec_run('pg_isready').exit_code == 0]
+
+    """
+    readiness_probes = []
+    yield readiness_probes
+
+
+@pytest.fixture(scope='session')
+def wait_for_ports(request):
+    """ Return callable which blocks until the ports of one or more containers accept connections.
+
+    It takes a container or a list of containers and optionally the ports, by default the exposed ports,
+    given as a list or a dict of port to timeout. Every port is probed at once.
+
+    Example:
+        >>> def test_web(container, client_container, wait_for_ports):
+        >>>     wait_for_ports([container, client_container], [8080])
+
+    """
+    config = request.config
+    def _wait_for_ports(containers, ports=None, timeout=None):
+        with timing.span('ports ready wait'):
+            waited = endpoints.wait_for_ports(
+                containers, ports, timeout=config.getoption('containers_ready_timeout') if timeout is None else timeout,
+                backoff=config.getoption('containers_ready_backoff'))
+        config._containers_readiness.record('ports', waited)
+        return waited
+    return _wait_for_ports
+
+
+@pytest.fixture(scope='session')
+def wait_for_http(request):
+    """ Return callable which blocks until a HTTP endpoint of one or more containers answers successfully.
+
+    Example:
+        >>> def test_web(container, wait_for_http):
+        >>>     wait_for_http(container, 8080, '/health')
+
+    """
+    config = request.config
+    def _wait_for_http(containers, port, path='/', timeout=None, statuses=endpoints.DEFAULT_STATUSES):
+        with timing.span('http ready wait'):
+            waited = endpoints.wait_for_http(
+                containers, port, path, timeout=config.getoption('containers_ready_timeout') if timeout is None else timeout,
+                backoff=config.getoption('containers_ready_backoff'), statuses=statuses)
+        config._containers_readiness.record('http', waited)
+        return waited
+    return _wait_for_http
+
+
+@pytest.fixture(scope='class')
+def container_reset(request):
+    """ Return callable used to reset a pooled container so it can be reused, or None to discard it.
+
+    Example:
+        >>> @pytest.fixture(scope='class')
+        >>> def container_reset():
+        >>>     return lambda container: container.exec_run('rm -rf /var/lib/app/*')
+
+    """
+    container_reset = None
+    yield container_reset
+
+
+@pytest.fixture(scope='class')
+def container_init(request):
+    """ Return callable run on a new container once it is ready, or None.
+
+    With ``--containers-snapshot`` the first container which passes the hook is committed to a local image
+    and later containers with the same image and environment start from it without running the hook. The
+    snapshot is identified by the source of the hook, or its ``snapshot_key`` attribute when set. Data
+    written to volumes is not part of the snapshot.
+
+    Example:
+        >>> @pytest.fixture(scope='class')
+        >>> def container_init():
+        >>>     return lambda container: container.exec_run('manage.py migrate')
+
+    """
+    container_init = None
+    yield container_init
+
+
+@pytest.fixture(scope='session')
+def snapshot_cache(request, docker_client, shared_resources):
+    """ Return cache of container snapshots, or None when disabled.
+
+    Enabled with ``--containers-snapshot``. Snapshots older than ``--containers-snapshot-max-age`` hours and
+    the oldest beyond ``--containers-snapshot-max-size`` megabytes are removed at the end of the session,
+    with pytest-xdist by the last worker to finish.
+    """
+    if not request.config.getoption('containers_snapshot'):
+        yield None
+        return
+    snapshot_cache = snapshots.SnapshotCache(max_age=request.config.getoption('containers_snapshot_max_age') * 3600,
+                                             max_size=request.config.getoption('containers_snapshot_max_size') * 1024 * 1024)
+    # other pytest-xdist workers may still be starting containers from snapshots
+    shared_resources.acquire('snapshots', lambda: True)
+    yield snapshot_cache
+    log.info('teardown snapshot cache, {} hits and {} misses'.format(snapshot_cache.hits, snapshot_cache.misses))
+    shared_resources.release('snapshots', lambda value: snapshot_cache.evict(docker_client))
+
+
+@pytest.fixture(scope='session')
+def container_pool(request):
+    """ Return pool of warm containers shared by container factories, or None when disabled.
+
+    Enabled with ``--containers-pool-size`` which sets the number of warm containers kept for each
+    container configuration. Only containers on builtin networks with anonymous volumes are pooled.
+    """
+    size = request.config.getoption('containers_pool_size')
+    if size <= 0:
+        yield None
+        return
+    log.info('setup container pool of size {}'.format(size))
+    container_pool = pool.ContainerPool(size)
+    yield container_pool
+    log.info('teardown container pool')
+    container_pool.close()
+
+
 @pytest.fixture(scope='module')
-def container_factory(docker_client):
+def container_factory(request, docker_client, container_pool, snapshot_cache):
     """ Return factory used to make container fixtures.
     """
     log.info('setup container factory')
     created_containers = []
-    def _container_factory(image=image, service_name=None, network=None, volumes=None, environment=None):
-        container_name = random_name(service_name)
+    ready_timeout = request.config.getoption('containers_ready_timeout')
+    ready_backoff = request.config.getoption('containers_ready_backoff')
+    def _container_factory(image=image, service_name=None, network=None, volumes=None, environment=None, probes=None,
+                           init=None):
         # https://forums.docker.com/t/docker-for-mac-does-not-add-docker-hostname-to-etc-hosts/8620/8
         hostname = 'localhost' if network.name == 'host' else None
         volumes_option = ''
@@ -282,45 +1203,104 @@ def container_factory(docker_client):
         environment_option = ''
         for key, value in environment.items() :
             environment_option += '-e {}={} '.format(key, value)
-        labels = ['pytest_fixture']
-        log.info('docker container run -d --name {} --label {} {}{} {} {} {}'.format(
-            container_name, labels[0],
-            '' if network.name == 'bridge' else ' --network ' + network.name,
-            '' if hostname == None else ' --hostname ' + hostname,
-            volumes_option, environment_option, image.attrs['RepoTags'][0]))
-        container = docker_client.containers.run(
-            image=image, name=container_name,
-            network=network.name, hostname=hostname,
-            volumes=volumes_dict, volumes_from=volumes_from,
-            environment=environment, labels=labels, detach=True)
-        # need to use low level api as network alias is not supported in high level api
-        # https://github.com/docker/docker-py/issues/982
-        #ccontainer = docker_client.api.create_container(
-        #    image=image, name=container_name,
-        #    network=network.name, hostname=hostname,
-        #    networking_config=client.create_networking_config(
-        #        endpoints_config={network.name: docker_client.api.create_endpoint_config(aliases=['foo', 'bar'])},
-        #    volumes=volumes_dict, volumes_from=volumes_from,
-        #    environment=environment, detach=True)
-        log.info('container id = {}'.format(container.short_id))
-        try:
-            health_start_period = int(image.attrs['ContainerConfig']['Healthcheck']['StartPeriod'] / 1000000000)
-        except KeyError:
-            health_start_period = 1
-        log.info("waiting {} seconds for service to start".format(health_start_period))
-        time.sleep(health_start_period)
+        labels = _labels(request.config)
+        def _run_container(image):
+            container_name = random_name(service_name)
+            log.info('docker container run -d --name {} {} {}{} {} {} {}'.format(
+                container_name, _label_options(labels),
+                '' if network.name == 'bridge' else ' --network ' + network.name,
+                '' if hostname == None else ' --hostname ' + hostname,
+                volumes_option, environment_option, image.attrs['RepoTags'][0]))
+            with timing.span('container run'):
+                container = docker_client.containers.run(
+                    image=image, name=container_name,
+                    network=network.name, hostname=hostname,
+                    volumes=volumes_dict, volumes_from=volumes_from,
+                    environment=environment, labels=labels, detach=True)
+            # need to use low level api as network alias is not supported in high level api
+            # https://github.com/docker/docker-py/issues/982
+            #ccontainer = docker_client.api.create_container(
+            #    image=image, name=container_name,
+            #    network=network.name, hostname=hostname,
+            #    networking_config=client.create_networking_config(
+            #        endpoints_config={network.name: docker_client.api.create_endpoint_config(aliases=['foo', 'bar'])},
+            #    volumes=volumes_dict, volumes_from=volumes_from,
+            #    environment=environment, detach=True)
+            log.info('container id = {}'.format(container.short_id))
+            _capture_logs(request.config, container)
+            try:
+                health_start_period = int(container.attrs['Config']['Healthcheck']['StartPeriod'] / 1000000000)
+            except (KeyError, TypeError):
+                health_start_period = 0
+            timeout = max(ready_timeout, health_start_period)
+            log.info('waiting up to {} seconds for service to become ready'.format(timeout))
+            try:
+                with timing.span('container ready wait'):
+                    waited = readiness.wait_for_container(container, timeout=timeout, backoff=ready_backoff,
+                                                          probes=probes)
+            except readiness.ContainerNotReady:
+                container.remove(v=True, force=True)
+                raise
+            request.config._containers_readiness.record('container', waited)
+            return container
+        def _init_container(container):
+            log.info('running container init hook')
+            try:
+                with timing.span('container init'):
+                    init(container)
+            except Exception:
+                container.remove(v=True, force=True)
+                raise
+        def _start_container():
+            if init is None:
+                return _run_container(image)
+            if snapshot_cache is None:
+                container = _run_container(image)
+                _init_container(container)
+                return container
+            key = snapshots.snapshot_key(image, init, environment)
+            # containers asking for the same snapshot wait until it is made
+            with snapshot_cache.lock(key):
+                snapshot = snapshot_cache.lookup(docker_client, key)
+                if snapshot is not None:
+                    return _run_container(snapshot)
+                container = _run_container(image)
+                _init_container(container)
+                snapshot_cache.commit(container, key)
+                return container
+        if container_pool is not None and _poolable(network, volumes):
+            # the pool tops up with the first factory of a key, so the key covers everything the factory uses
+            key = pool.config_key({
+                'image': image.id, 'service_name': service_name, 'network': network.name, 'hostname': hostname,
+                'volumes': volumes_dict, 'volumes_from': volumes_from,
+                'environment': environment, 'labels': labels,
+                'probes': [snapshots.hook_identity(probe) for probe in probes or []],
+                'init': None if init is None else snapshots.snapshot_key(image, init, environment)})
+            return container_pool.acquire(key, _start_container)
+        container = _start_container()
         created_containers.append(container)
         return container
     yield _container_factory
     log.info('teardown container factory')
-    for container in created_containers:
-        if len(docker_client.containers.list(filters={'id': container.id})) > 0:
-            log.info('docker container rm --volumes --force {}'.format(container.name))
-            container.remove(v=True, force=True)
+    with timing.span('container bulk rm'):
+        cleanup.remove_containers(docker_client, created_containers,
+                                  max_workers=request.config.getoption('containers_teardown_workers'))
+
+
+def _capture_logs(config, container):
+    if config._containers_logs is not None:
+        config._containers_logs.capture(
+            container.name, lambda: container.logs(stdout=True, stderr=True, stream=True, follow=True))
+
+
+def _poolable(network, volumes):
+    # only containers which do not depend on class scoped resources can be shared
+    return network.name in ['host', 'bridge'] and all(volume['type'] == 'anonymous' for volume in volumes)
 
 
 @pytest.fixture(scope='class')
-def container(docker_client, container_factory, image, service_name, network, volumes, environment):
+def container(docker_client, container_factory, container_pool, image, service_name, network, volumes, environment,
+              readiness_probes, container_reset, container_init):
     """ Return class scoped container fixture.
 
     Example:
@@ -329,15 +1309,21 @@ def container(docker_client, container_factory, image, service_name, network, vo
 
     """
     log.info('setup container')
-    container = container_factory(image=image, service_name=service_name, volumes=volumes, network=network, environment=environment)
+    container = container_factory(image=image, service_name=service_name, volumes=volumes, network=network,
+                                  environment=environment, probes=readiness_probes, init=container_init)
     yield container
     log.info('teardown container')
+    if container_pool is not None and container_pool.owns(container):
+        with timing.span('container pool release'):
+            container_pool.release(container, reset=container_reset)
+        return
     log.info('docker container rm --volumes --force {}'.format(container.name))
-    container.remove(v=True, force=True)
+    with timing.span('container rm'):
+        container.remove(v=True, force=True)
 
 
 @pytest.fixture(scope='module')
-def client_container_factory(docker_client):
+def client_container_factory(request, docker_client):
     """ Return factory used to make client container fixtures.
     """
     log.info('setup client container factory')
@@ -353,27 +1339,28 @@ def client_container_factory(docker_client):
         client_container_name = random_name(container.name + '_client')
         links = {container.name: container.name} if network.name == 'bridge' else {}
         extra_hosts = {container.name: '127.0.0.1'} if network.name == 'host' else {}
-        labels = ['pytest_fixture']
-        log.info('docker container run -d --name {} --label {}'
+        labels = _labels(request.config)
+        log.info('docker container run -d --name {} {}'
             '{} {} {} {} {}'.format(
-                client_container_name, labels[0],
+                client_container_name, _label_options(labels),
                 '' if links == {} else ' --link {}'.format(links),
                 '' if network.name == 'bridge' else ' --network ' + network.name,
                 '' if extra_hosts == {} else ' --add-host {}'.format(extra_hosts),
                 image.attrs['RepoTags'][0], command))
-        client_container = docker_client.containers.run(image=image, name=client_container_name,
-                                                        network=network.name, links=links,
-                                                        extra_hosts=extra_hosts,
-                                                        command=command, labels=labels, detach=True)
+        with timing.span('container run'):
+            client_container = docker_client.containers.run(image=image, name=client_container_name,
+                                                            network=network.name, links=links,
+                                                            extra_hosts=extra_hosts,
+                                                            command=command, labels=labels, detach=True)
         log.info('client container id = {}'.format(client_container.short_id))
+        _capture_logs(request.config, client_container)
         created_client_containers.append(client_container)
         return client_container
     yield _client_container_factory
     log.info('teardown client container factory {}'.format(_client_container_factory))
-    for client_container in created_client_containers:
-        if len(docker_client.containers.list(filters={'id': client_container.id})) > 0:
-            log.info('docker container rm --volumes --force {}'.format(client_container.name))
-            client_container.remove(v=True, force=True)
+    with timing.span('container bulk rm'):
+        cleanup.remove_containers(docker_client, created_client_containers,
+                                  max_workers=request.config.getoption('containers_teardown_workers'))
 
 
 @pytest.fixture(scope='class')
@@ -385,10 +1372,31 @@ def client_container(client_container_factory, container):
     yield client_container
     log.info('teardown client container')
     log.info('docker container rm --volumes --force {}'.format(client_container.name))
-    client_container.remove(v=True, force=True)
+    with timing.span('container rm'):
+        client_container.remove(v=True, force=True)
+
+
+@pytest.fixture(scope='class')
+def client_session(request, client_container):
+    """ Return class scoped shell session in the client container which runs commands over a single exec.
+
+    Example:
+        >>> def test_web(container, client_session):
+        >>>     result = client_session.run('wget -q -O - http://{}:8080/'.format(container.name), timeout=5)
+        >>>     assert result.exit_code == 0
+        >>>     assert b'Hello' in result.stdout
+
+    """
+    log.info('setup client session')
+    client_session = execsession.ExecSession(client_container,
+                                             timeout=request.config.getoption('containers_exec_timeout'))
+    yield client_session
+    log.info('teardown client session after {} commands'.format(client_session.commands))
+    client_session.close()
+
 
 @pytest.fixture(scope='class', params=[1])
-def service(request, docker_client, swarm, image, network, volumes, environment):
+def service(request, docker_client, swarm, image, service_name, network, volumes, environment):
     # TODO namespace the service using random name
     service_name_random = random_name(service_name)
     replicas = request.param
@@ -397,21 +1405,159 @@ def service(request, docker_client, swarm, image, network, volumes, environment)
              '--network {} --replicas {} --constraint "node.role == manager" {}'.format(service_name_random, network.name,
                                                                                       replicas, image_name))
     service_mode = docker.types.ServiceMode(mode='replicated', replicas=replicas)
-    service = docker_client.services.create(image=image_name, name=service_name_random,
-                                            networks=[network.name],
-                                            mode=service_mode,
-                                            constraints=['node.role == manager'])
+    with timing.span('service create'):
+        service = docker_client.services.create(image=image_name, name=service_name_random,
+                                                labels=_labels(request.config),
+                                                container_labels=_labels(request.config),
+                                                networks=[network.name],
+                                                mode=service_mode,
+                                                constraints=['node.role == manager'])
     log.info('service id = {}'.format(service.id))
+    if request.config._containers_logs is not None:
+        request.config._containers_logs.capture(
+            service.name, lambda: service.logs(stdout=True, stderr=True, follow=True))
     health_start_period = int(image.attrs['ContainerConfig']['Healthcheck']['StartPeriod'] / 1000000000)
     log.info("waiting {} seconds for service to start".format(health_start_period))
-    time.sleep(health_start_period)
+    with timing.span('service start period sleep'):
+        time.sleep(health_start_period)
     yield service
     # container = docker_client.containers.get(service.tasks()[0]['Status']['ContainerStatus']['ContainerID'])
     # mounts = container.attrs['Mounts']
     log.info('docker service rm {}'.format(service.name))
-    service.remove()
+    with timing.span('service rm'):
+        service.remove()
     # TODO confirm that docker swarm will prune service volumes
     # for mount in mounts:
     #    log.info('docker volume rm {}'.format(mount['Name']))
     #    volume = docker_client.volumes.get(mount['Name'])
-    #    volume.remove()
\ No newline at end of file
+    #    volume.remove()
+
+
+@pytest.fixture(scope='session')
+def kubernetes_client(request):
+    """Return session scoped kubernetes API client configured from within the cluster or from the kube config.
+
+    Tests using the kubernetes fixtures are skipped when the kubernetes package is not installed.
+    """
+    if kube.kubernetes is None:
+        pytest.skip('the kubernetes package is not installed')
+    client = kube.api_client()
+    yield client
+    # older clients close their connection pool when collected
+    close = getattr(client, 'close', None)
+    if close is not None:
+        close()
+
+
+@pytest.fixture(scope='session')
+def kubernetes_namespace(request, kubernetes_client):
+    """Return name of the namespace the kubernetes fixtures of this session create their objects in.
+
+    Every session, and so every pytest-xdist worker, has its own namespace. The class scoped fixtures
+    delete their objects without waiting for them to go, the namespace is deleted at the end of the
+    session and the cluster removes whatever is left in it in the background.
+    """
+    config = request.config
+    core = kube.kubernetes.client.CoreV1Api(kubernetes_client)
+    stale_after = config.getoption('containers_stale_after')
+    if stale_after > 0:
+        try:
+            with timing.span('stale namespace prune'):
+                kube.prune_namespaces(core, 'pytest_fixture', until=time.time() - stale_after * 3600)
+        except kube.kubernetes.client.rest.ApiException as err:
+            log.warning('namespaces left behind by earlier sessions could not be pruned: {}'.format(err))
+    namespace = kube.object_name(config._containers_session)
+    with timing.span('namespace create'):
+        kube.create_namespace(core, namespace, _labels(config))
+    yield namespace
+    with timing.span('namespace delete'):
+        kube.delete_namespace(core, namespace)
+
+
+@pytest.fixture(scope='class')
+def pod(request, kubernetes_client, kubernetes_namespace, docker_registry, service_name, service_port, environment):
+    """ Return class scoped pod running the image under test, once the pod reports ready.
+
+    Readiness is watched rather than polled, the pod is deleted without waiting when the class finishes.
+
+    Example:
+        >>> def test_pod(pod):
+        >>>     assert pod.status.phase == 'Running'
+
+    """
+    log.info('setup pod')
+    config = request.config
+    core = kube.kubernetes.client.CoreV1Api(kubernetes_client)
+    name = kube.object_name(random_name(service_name))
+    image_name = _image_repo_tag(docker_registry, service_name)
+    log.info('kubectl run {} --namespace {} --restart=Never --port {} --image {}'.format(
+        name, kubernetes_namespace, service_port, image_name))
+    with timing.span('pod create'):
+        core.create_namespaced_pod(kubernetes_namespace, kube.pod_manifest(name, image_name, _labels(config),
+                                                                           environment, service_port))
+    with timing.span('pod ready wait'):
+        pod, waited = kube.wait_for_pod(core, kubernetes_namespace, name,
+                                        timeout=config.getoption('containers_ready_timeout'))
+    config._containers_readiness.record('pod', waited)
+    if config._containers_logs is not None:
+        config._containers_logs.capture(name, lambda: kube.follow_logs(core, kubernetes_namespace, name))
+    yield pod
+    log.info('teardown pod')
+    with timing.span('pod delete'):
+        kube.delete_object('pod', core.delete_namespaced_pod, kubernetes_namespace, name)
+
+
+@pytest.fixture(scope='class', params=[1])
+def deployment(request, kubernetes_client, kubernetes_namespace, docker_registry, service_name, service_port,
+               environment):
+    """ Return class scoped deployment of the image under test, once every replica is available.
+
+    The number of replicas is the fixture's parameter. Readiness is watched rather than polled,
+    the deployment and its pods are deleted without waiting when the class finishes.
+    """
+    log.info('setup deployment')
+    config = request.config
+    apps = kube.kubernetes.client.AppsV1Api(kubernetes_client)
+    name = kube.object_name(random_name(service_name))
+    replicas = request.param
+    image_name = _image_repo_tag(docker_registry, service_name)
+    log.info('kubectl create deployment {} --namespace {} --replicas {} --port {} --image {}'.format(
+        name, kubernetes_namespace, replicas, service_port, image_name))
+    with timing.span('deployment create'):
+        apps.create_namespaced_deployment(kubernetes_namespace, kube.deployment_manifest(
+            name, image_name, _labels(config), replicas, environment, service_port))
+    with timing.span('deployment ready wait'):
+        deployment, waited = kube.wait_for_deployment(apps, kubernetes_namespace, name,
+                                                      timeout=config.getoption('containers_ready_timeout'))
+    config._containers_readiness.record('deployment', waited)
+    yield deployment
+    log.info('teardown deployment')
+    with timing.span('deployment delete'):
+        kube.delete_object('deployment', apps.delete_namespaced_deployment, kubernetes_namespace, name)
+
+
+@pytest.fixture(scope='class')
+def kubernetes_service(request, kubernetes_client, kubernetes_namespace, deployment, service_port):
+    """ Return class scoped kubernetes service in front of the deployment, once it has a ready endpoint.
+
+    Example:
+        >>> def test_service(kubernetes_service, kubernetes_namespace):
+        >>>     url = 'http://{}.{}:8080/'.format(kubernetes_service.metadata.name, kubernetes_namespace)
+
+    """
+    log.info('setup kubernetes service')
+    config = request.config
+    core = kube.kubernetes.client.CoreV1Api(kubernetes_client)
+    name = deployment.metadata.name
+    log.info('kubectl expose deployment {} --namespace {} --port {}'.format(name, kubernetes_namespace, service_port))
+    with timing.span('kubernetes service create'):
+        service = core.create_namespaced_service(kubernetes_namespace, kube.service_manifest(
+            name, name, _labels(config), service_port))
+    with timing.span('kubernetes service ready wait'):
+        _, waited = kube.wait_for_endpoints(core, kubernetes_namespace, name,
+                                            timeout=config.getoption('containers_ready_timeout'))
+    config._containers_readiness.record('kubernetes service', waited)
+    yield service
+    log.info('teardown kubernetes service')
+    with timing.span('kubernetes service delete'):
+        kube.delete_object('service', core.delete_namespaced_service, kubernetes_namespace, name)
@@ -0,0 +1,99 @@
+import logging
+import re
+import threading
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+
+_VERSION = re.compile(r'^v\d+\.\d+$')
+
+# endpoint collections whose second path segment identifies an object
+_COLLECTIONS = ['configs', 'containers', 'exec', 'networks', 'nodes', 'plugins', 'secrets', 'services', 'tasks',
+                'volumes']
+
+# second path segments which are actions on the collection rather than object identifiers
+_COLLECTION_ACTIONS = ['create', 'json', 'load', 'privileges', 'prune', 'pull', 'search']
+
+# trailing path segments of image endpoints, image names may contain slashes
+_IMAGE_ACTIONS = ['get', 'history', 'json', 'push', 'tag']
+
+
+def endpoint(method, url):
+    """Return method and path of url with object identifiers replaced, e.g. ``GET /containers/{id}/json``.
+    """
+    parts = [part for part in urlsplit(url).path.split('/') if part]
+    if parts and _VERSION.match(parts[0]):
+        parts = parts[1:]
+    if len(parts) > 1 and parts[0] in ['images', 'distribution'] and parts[1] not in _COLLECTION_ACTIONS:
+        action = parts[-1] if len(parts) > 2 and parts[-1] in _IMAGE_ACTIONS else None
+        parts = [parts[0], '{name}'] + ([action] if action else [])
+    elif len(parts) > 1 and parts[0] in _COLLECTIONS and parts[1] not in _COLLECTION_ACTIONS:
+        parts[1] = '{id}'
+    return '{} /{}'.format(method, '/'.join(parts))
+
+
+class ApiStats(object):
+    """Count and time docker engine API requests by endpoint, fixture and test.
+
+    Attribution follows the fixture and test of the :py:class:`~pytest_containers.timing.Timeline`.
+
+    Args:
+        timeline (:py:class:`~pytest_containers.timing.Timeline`): source of the current fixture and test.
+    """
+
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, client):
+        """Account every request made by client, a :py:class:`docker.DockerClient`, and return it.
+        """
+        client.api.hooks['response'].append(self._response)
+        return client
+
+    def _response(self, response, *args, **kwargs):
+        seconds = response.elapsed.total_seconds() if response.elapsed is not None else 0.0
+        self.add(endpoint(response.request.method, response.request.url), seconds)
+
+    def add(self, name, seconds):
+        fixture, test = self.timeline.context()
+        key = (test, fixture, name)
+        with self._lock:
+            count, total = self.calls.get(key, (0, 0.0))
+            self.calls[key] = (count + 1, total + seconds)
+
+    def requests(self, test):
+        """Return the number of requests attributed to test keyed by endpoint.
+        """
+        requests = {}
+        with self._lock:
+            for (key_test, _, name), (count, _) in self.calls.items():
+                if key_test == test:
+                    requests[name] = requests.get(name, 0) + count
+        return requests
+
+    def _totals(self, index):
+        totals = {}
+        with self._lock:
+            for key, (count, seconds) in self.calls.items():
+                # requests made on background threads have no test, requests of test bodies no fixture
+                name = key[index] or ('(background)' if key[0] is None else '(test)')
+                previous_count, previous_seconds = totals.get(name, (0, 0.0))
+                totals[name] = (previous_count + count, previous_seconds + seconds)
+        return sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+
+    def summary(self, limit=5):
+        """Return report lines of the requests by endpoint, test and fixture, or [] when none were made.
+        """
+        endpoints = self._totals(2)
+        if not endpoints:
+            return []
+        lines = ['{} requests, {:.2f}s total'.format(sum(count for _, (count, _) in endpoints),
+                                                     sum(seconds for _, (_, seconds) in endpoints))]
+        for title, totals in [('endpoints', endpoints), ('tests', self._totals(0)), ('fixtures', self._totals(1))]:
+            lines.append('most requests by {}:'.format(title))
+            for name, (count, seconds) in totals[:limit]:
+                lines.append('  {} {} ({:.2f}s)'.format(count, name, seconds))
+        return lines
@@ -0,0 +1,134 @@
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+import docker
+from docker.utils import version_lt
+
+from . import kube
+
+log = logging.getLogger(__name__)
+
+
+# command line tools the orchestrators are driven with
+CLIS = ['docker', 'docker-compose', 'kubectl', 'maestro']
+
+# swarm mode services and overlay networks
+SWARM_API_VERSION = '1.24'
+
+MODES = ['skip', 'deselect', 'off']
+
+
+def _cli_works(command, timeout):
+    try:
+        return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              timeout=timeout).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _kubernetes_reachable(clis, timeout):
+    if kube.kubernetes is not None:
+        try:
+            kube.kubernetes.client.VersionApi(kube.api_client()).get_code(_request_timeout=timeout)
+            return True
+        except Exception as err:
+            log.debug('kubernetes API not reachable: {}'.format(err))
+            return False
+    if clis.get('kubectl'):
+        return _cli_works(['kubectl', 'version', '--request-timeout={}s'.format(int(max(timeout, 1)))], timeout + 1)
+    return False
+
+
+def probe(client_factory, timeout=5):
+    """Return the capabilities of this host as a JSON serializable dict.
+
+    The dict holds whether the docker daemon answered, its API and server version, the swarm node
+    state, whether the node can manage services, the network drivers, whether a kubernetes API is
+    reachable and which command line tools are installed.
+
+    Args:
+        client_factory (callable): returns the docker client used to query the daemon.
+        timeout (float): seconds each probe may take.
+    """
+    clis = dict((cli, shutil.which(cli) is not None) for cli in CLIS)
+    # compose v2 is a plugin of the docker command
+    clis['docker compose'] = clis['docker'] and _cli_works(['docker', 'compose', 'version'], timeout)
+    capabilities = {'docker': False, 'api_version': None, 'server_version': None, 'swarm': None,
+                    'swarm_manager': False, 'network_drivers': [], 'clis': clis,
+                    'kubernetes': _kubernetes_reachable(clis, timeout)}
+    try:
+        client = client_factory()
+        try:
+            version = client.version()
+            info = client.info()
+        finally:
+            client.close()
+    except (docker.errors.DockerException, OSError) as err:
+        log.warning('docker daemon not reachable, parametrizations are not pruned: {}'.format(err))
+        return capabilities
+    swarm = info.get('Swarm') or {}
+    capabilities.update(docker=True, api_version=version.get('ApiVersion'), server_version=version.get('Version'),
+                        swarm=swarm.get('LocalNodeState'),
+                        # the swarm fixture initializes a swarm on nodes which are not part of one yet
+                        swarm_manager=swarm.get('LocalNodeState') == 'inactive' or bool(swarm.get('ControlAvailable')),
+                        network_drivers=sorted((info.get('Plugins') or {}).get('Network') or []))
+    return capabilities
+
+
+def cached_probe(cache, key, client_factory, max_age, timeout=5):
+    """Return the capabilities cached under key when probed less than max_age seconds ago, probe otherwise.
+
+    Cached capabilities are only used for the same ``DOCKER_HOST``, ``KUBECONFIG`` and ``PATH``.
+    """
+    environment = dict((name, os.getenv(name, '')) for name in ['DOCKER_HOST', 'KUBECONFIG', 'PATH'])
+    cached = cache.get(key, None) if cache is not None else None
+    if cached is not None and cached.get('environment') == environment and time.time() - cached['probed'] < max_age:
+        return cached['capabilities']
+    capabilities = probe(client_factory, timeout)
+    if cache is not None:
+        cache.set(key, {'environment': environment, 'probed': time.time(), 'capabilities': capabilities})
+    return capabilities
+
+
+def _swarm_missing(capabilities):
+    if capabilities['api_version'] and version_lt(capabilities['api_version'], SWARM_API_VERSION):
+        return 'docker API {} is older than {}'.format(capabilities['api_version'], SWARM_API_VERSION)
+    if not capabilities['swarm_manager']:
+        return 'this docker node can not manage a swarm ({})'.format(capabilities['swarm'])
+    return None
+
+
+def unsatisfiable(params, fixturenames, capabilities):
+    """Return why a test with these parameters and fixtures can not run on this host, or None.
+    """
+    if 'kubernetes_client' in fixturenames and not capabilities['kubernetes']:
+        # the kubernetes fixtures do not use the docker daemon
+        return 'kubernetes fixtures need a reachable kubernetes API'
+    if not capabilities['docker']:
+        # without a daemon nothing is known, the tests fail loudly rather than being skipped
+        return None
+    orchestrator = params.get('orchestrator')
+    clis = capabilities['clis']
+    if orchestrator == 'swarm' or 'service' in fixturenames:
+        missing = _swarm_missing(capabilities)
+        if missing is not None:
+            return '{} needs swarm mode: {}'.format('orchestrator swarm' if orchestrator == 'swarm' else 'service',
+                                                    missing)
+    if orchestrator == 'kubernetes' and not capabilities['kubernetes']:
+        return 'orchestrator kubernetes needs a reachable kubernetes API'
+    if orchestrator == 'compose' and not (clis.get('docker-compose') or clis.get('docker compose')):
+        return 'orchestrator compose needs docker-compose or the docker compose plugin'
+    if orchestrator == 'maestro' and not clis.get('maestro'):
+        return 'orchestrator maestro needs the maestro command'
+    network = params.get('network')
+    drivers = capabilities['network_drivers']
+    if network == 'overlay':
+        missing = _swarm_missing(capabilities)
+        if missing is not None:
+            return 'network overlay needs swarm mode: {}'.format(missing)
+    if network in ['bridge', 'overlay', 'host'] and drivers and network not in drivers:
+        return 'network {} needs the {} network driver, the daemon has {}'.format(network, network, ', '.join(drivers))
+    return None
@@ -0,0 +1,177 @@
+import base64
+import json
+import logging
+import re
+import threading
+from io import BytesIO
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+import requests
+import urllib3
+
+log = logging.getLogger(__name__)
+
+
+CASSETTE_VERSION = 1
+
+# query parameters which change between runs without changing the meaning of a request
+IGNORED_PARAMS = ['since', 'until']
+
+# names made by random_name(), the suffix is 64 random bits in hex
+_RANDOM_NAME = re.compile(r'pytest[\w.-]*')
+_RANDOM_SUFFIX = re.compile(r'_[0-9a-f]{8,16}(?![0-9a-zA-Z])')
+
+# numbered pytest base temporary directories
+_BASETEMP = re.compile(r'pytest-of-[^/]+/pytest-\d+')
+
+# times of until filters, such as those of the stale resource prune
+_UNTIL_FILTER = re.compile(r'("until": \[")\d+')
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Raised when a replayed request was not recorded.
+    """
+
+
+def normalise(text):
+    """Replace the parts of a request which differ between runs, such as random names, by placeholders.
+    """
+    text = _BASETEMP.sub('pytest-of-{user}/pytest-{n}', text)
+    text = _UNTIL_FILTER.sub(r'\1{time}', text)
+    return _RANDOM_NAME.sub(lambda match: _RANDOM_SUFFIX.sub('_{random}', match.group(0)), text)
+
+
+def request_key(method, url, body):
+    """Return the key a request is recorded and matched by.
+    """
+    split = urlsplit(url)
+    # requests made with another api version are equivalent
+    path = re.sub(r'^/v\d+\.\d+', '', unquote(split.path))
+    query = sorted((key, value) for key, value in parse_qsl(split.query, keep_blank_values=True)
+                   if key not in IGNORED_PARAMS)
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    if not isinstance(body, str):
+        # streamed uploads are not part of the key
+        body = ''
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True) if body else ''
+    except ValueError:
+        pass
+    return normalise('{} {}{}{} {}'.format(method, path, '?' if query else '', unquote(urlencode(query)), body)).strip()
+
+
+class _Body(BytesIO):
+    # docker-py inspects the chunked state of the underlying response to decide how to stream it
+    def __init__(self, data, chunked):
+        super(_Body, self).__init__(data)
+        self.chunked = chunked
+        self.chunk_left = None
+
+
+def _response(request, recorded):
+    body = base64.b64decode(recorded['body']) if recorded.get('base64') else recorded['body'].encode('utf-8')
+    headers = dict((key, value) for key, value in recorded['headers'].items()
+                   if key.lower() not in ['content-encoding', 'content-length', 'transfer-encoding'])
+    headers['Content-Length'] = str(len(body))
+    chunked = any(key.lower() == 'transfer-encoding' and 'chunked' in value.lower()
+                  for key, value in recorded['headers'].items())
+    raw = urllib3.HTTPResponse(body=_Body(body, chunked), headers=headers, status=recorded['status'],
+                               reason=recorded.get('reason'), preload_content=False, decode_content=False)
+    return requests.adapters.HTTPAdapter().build_response(request, raw)
+
+
+class CassetteAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which records the exchanges of adapter, or replays them when adapter is None.
+    """
+
+    def __init__(self, cassette, adapter=None):
+        super(CassetteAdapter, self).__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = request_key(request.method, request.url, request.body)
+        # hijacked connections such as exec and attach stream over the raw socket, followed logs never end
+        unrecorded = request.headers.get('Upgrade') == 'tcp' or ('follow', '1') in parse_qsl(urlsplit(request.url).query)
+        if self.adapter is None:
+            if unrecorded:
+                raise CassetteMiss('hijacked connections and followed streams can not be replayed: {}'.format(key),
+                                   request=request)
+            return _response(request, self.cassette.play(key, request))
+        response = self.adapter.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                     proxies=proxies)
+        if unrecorded:
+            return response
+        body = response.content
+        try:
+            recorded = {'body': body.decode('utf-8')}
+        except UnicodeDecodeError:
+            recorded = {'body': base64.b64encode(body).decode('ascii'), 'base64': True}
+        recorded.update(status=response.status_code, reason=response.reason, headers=dict(response.headers))
+        self.cassette.record(key, recorded)
+        return _response(request, recorded)
+
+    def close(self):
+        if self.adapter is not None:
+            self.adapter.close()
+
+
+class Cassette(object):
+    """Docker engine HTTP exchanges recorded to, or replayed from, a JSON file.
+
+    Requests are matched by method, path, query and body with random names and temporary
+    directories replaced by placeholders. Identical requests are answered in recorded order,
+    once they are used up the last response is repeated so polling loops can run any number of times.
+
+    Args:
+        path (str): cassette file.
+        replaying (bool): serve recorded responses instead of contacting the daemon.
+    """
+
+    def __init__(self, path, replaying=False):
+        self.path = path
+        self.replaying = replaying
+        self.api_version = None
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._played = {}
+        if replaying:
+            with open(path) as cassette_file:
+                data = json.load(cassette_file)
+            if data.get('version') != CASSETTE_VERSION:
+                raise ValueError('unsupported cassette version {!r} in {}'.format(data.get('version'), path))
+            self.api_version = data['api_version']
+            self.interactions = data['interactions']
+        self._responses = {}
+        for interaction in self.interactions:
+            self._responses.setdefault(interaction['request'], []).append(interaction['response'])
+
+    def install(self, client):
+        """Route the requests of client, a :py:class:`docker.DockerClient`, through the cassette.
+        """
+        if not self.replaying and self.api_version is None:
+            self.api_version = client.api.api_version
+        for prefix, adapter in list(client.api.adapters.items()):
+            client.api.mount(prefix, CassetteAdapter(self, None if self.replaying else adapter))
+        return client
+
+    def record(self, key, response):
+        with self._lock:
+            self.interactions.append({'request': key, 'response': response})
+
+    def play(self, key, request=None):
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                raise CassetteMiss('no response recorded for {} in {}'.format(key, self.path), request=request)
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+    def save(self):
+        with self._lock:
+            data = {'version': CASSETTE_VERSION, 'api_version': self.api_version, 'interactions': self.interactions}
+        with open(self.path, 'w') as cassette_file:
+            json.dump(data, cassette_file, indent=1)
+        log.info('recorded {} docker API exchanges to {}'.format(len(data['interactions']), self.path))
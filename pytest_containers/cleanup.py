@@ -0,0 +1,147 @@
+import calendar
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+log = logging.getLogger(__name__)
+
+
+class TeardownError(Exception):
+    """Raised when one or more resources could not be removed during teardown.
+    """
+
+    def __init__(self, errors):
+        super(TeardownError, self).__init__(errors)
+        self.errors = errors
+
+    def __str__(self):
+        return '{} resources could not be removed:\n{}'.format(
+            len(self.errors), '\n'.join('{}: {}'.format(name, err) for name, err in self.errors))
+
+
+def _remove_container(docker_client, container_id):
+    try:
+        docker_client.api.remove_container(container_id, v=True, force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+def remove_containers(docker_client, containers, label='pytest_fixture', max_workers=8):
+    """Remove the containers which still exist.
+
+    Survivors are found with a single label filtered list call and removed
+    concurrently on a bounded thread pool.
+
+    Raises:
+        :py:class:`TeardownError`
+            If any container could not be removed, after all removals were attempted.
+    """
+    if not containers:
+        return
+    names = {container.id: container.name for container in containers}
+    survivors = [item['Id'] for item in docker_client.api.containers(all=True, quiet=True, filters={'label': label})
+                 if item['Id'] in names]
+    if not survivors:
+        return
+    log.info('docker container rm --volumes --force {}'.format(' '.join(names[x] for x in survivors)))
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(names[x], executor.submit(_remove_container, docker_client, x)) for x in survivors]
+        for name, future in futures:
+            try:
+                future.result()
+            except docker.errors.APIError as err:
+                errors.append((name, err))
+    if errors:
+        raise TeardownError(errors)
+
+
+SESSION_LABEL = 'pytest_containers.session'
+
+# the volumes prune api only removes anonymous volumes from api version 1.42 unless asked for all
+_VOLUMES_PRUNE_ALL_VERSION = (1, 42)
+
+
+def _version(api_version):
+    return tuple(int(part) for part in api_version.split('.'))
+
+
+def _created(created):
+    # list calls report unix times, inspections RFC 3339 times in UTC
+    if isinstance(created, (int, float)):
+        return created
+    return calendar.timegm(time.strptime(created[:19], '%Y-%m-%dT%H:%M:%S'))
+
+
+def _concurrently(function, names, max_workers):
+    errors = []
+    if not names:
+        return errors
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(name, executor.submit(function, name)) for name in names]
+        for name, future in futures:
+            try:
+                future.result()
+            except docker.errors.NotFound:
+                pass
+            except docker.errors.APIError as err:
+                errors.append((name, err))
+    return errors
+
+
+def prune(docker_client, labels, until=None, max_workers=8):
+    """Remove the services, containers, networks and volumes carrying all labels in bulk.
+
+    Running containers are killed concurrently so that a single prune call removes them, services
+    have no prune api and are removed concurrently.
+
+    Args:
+        docker_client: docker client.
+        labels (list): label filters, ``key`` or ``key=value``.
+        until (float): only remove resources created before this unix time.
+        max_workers (int): maximum number of concurrent kills and removals.
+
+    Returns:
+        dict: number of removed resources by kind.
+
+    Raises:
+        :py:class:`TeardownError`
+            If any resource could not be removed, after all removals were attempted.
+    """
+    api = docker_client.api
+    filters = {'label': list(labels)}
+    dated_filters = dict(filters, until=str(int(until))) if until is not None else filters
+    removed = {}
+    errors = []
+    try:
+        services = [item['ID'] for item in api.services(filters=filters)
+                    if until is None or _created(item['CreatedAt']) < until]
+    except docker.errors.APIError:
+        # not a swarm manager
+        services = []
+    errors += _concurrently(api.remove_service, services, max_workers)
+    removed['services'] = len(services)
+    running = [item['Id'] for item in api.containers(filters=filters)
+               if until is None or _created(item['Created']) < until]
+    errors += _concurrently(api.kill, running, max_workers)
+    removed['containers'] = len(api.prune_containers(filters=dated_filters).get('ContainersDeleted') or [])
+    removed['networks'] = len(api.prune_networks(filters=dated_filters).get('NetworksDeleted') or [])
+    if until is None:
+        volume_filters = dict(filters)
+        if _version(api.api_version) >= _VOLUMES_PRUNE_ALL_VERSION:
+            volume_filters['all'] = 'true'
+        removed['volumes'] = len(api.prune_volumes(filters=volume_filters).get('VolumesDeleted') or [])
+    else:
+        # volumes can not be pruned by age
+        volumes = [item['Name'] for item in api.volumes(filters=filters).get('Volumes') or []
+                   if _created(item['CreatedAt']) < until]
+        errors += _concurrently(api.remove_volume, volumes, max_workers)
+        removed['volumes'] = len(volumes)
+    if any(removed.values()):
+        log.info('pruned {} labelled {}'.format(
+            ', '.join('{} {}'.format(count, kind) for kind, count in sorted(removed.items())), ' '.join(labels)))
+    if errors:
+        raise TeardownError(errors)
+    return removed
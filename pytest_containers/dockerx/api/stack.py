@@ -8,14 +8,22 @@ class StackApiMixin(object):
     def stacks(self, filters=None):
         """
         List stacks. Similar to the ``docker stack ls`` command.
+
+        Args:
+            filters (dict): Filters to process on the stack list. Valid filters:
+                ``name`` - a stack name or list of stack names.
         """
+        names = (filters or {}).get('name')
+        if isinstance(names, str):
+            names = [names]
         result = self.dispatch(['stack', 'ls', '--format', '{{json .}}'], returncode=0)
         string_list = result.stdout.split('\n')
         dict_list = []
         for item in string_list:
-            if item is not '':
+            if item != '':
                 dict = json.loads(item)
-                dict_list.append(dict)
+                if names is None or dict.get('Name') in names:
+                    dict_list.append(dict)
         dict = {'Stacks': dict_list}
         return dict
 
@@ -29,6 +37,13 @@ class StackApiMixin(object):
         self.dispatch(['stack', 'rm', name], returncode=0)
         return
 
+    def remove_stacks(self, names):
+        """
+        Remove several stacks concurrently. Similar to the ``docker stack rm`` command.
+        """
+        self.dispatch_many([['stack', 'rm', name] for name in names], returncode=0)
+        return
+
     def services(self):
         pass
 
@@ -1,29 +1,75 @@
+import asyncio
+import logging
+import os
+import signal
 import subprocess
+import sys
 from collections import namedtuple
 from docker.constants import (DEFAULT_TIMEOUT_SECONDS)
 from ..api.stack import StackApiMixin
 
+log = logging.getLogger(__name__)
+
 
 ProcessResult = namedtuple('ProcessResult', 'stdout stderr')
 
 
-def start_process(base_dir, options):
-    proc = subprocess.Popen(
-        ['docker'] + options,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        cwd=base_dir)
-    print("Running process: %s" % proc.pid)
-    return proc
+async def _pump(stream, prefix, lines):
+    # forward output line by line so long running commands can be followed in the log
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        lines.append(line)
+        log.debug('{}: {}'.format(prefix, line.decode('utf-8', 'replace').rstrip()))
+
 
+async def run_process(base_dir, options, timeout=None, returncode=0):
+    """Run the docker CLI with options, killing it when it does not finish within timeout seconds.
 
-def wait_on_process(proc, returncode=0):
-    stdout, stderr = proc.communicate()
+    Raises:
+        :py:class:`subprocess.TimeoutExpired`
+            If the process did not finish in time.
+        :py:class:`subprocess.CalledProcessError`
+            If the process exited with another code than returncode.
+    """
+    cmd = ['docker'] + options
+    # own process group so processes spawned by the CLI are killed with it
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=base_dir,
+                                                start_new_session=True)
+    log.info('Running process {}: {}'.format(proc.pid, ' '.join(cmd)))
+    stdout, stderr = [], []
+    try:
+        await asyncio.wait_for(asyncio.gather(_pump(proc.stdout, '{} stdout'.format(proc.pid), stdout),
+                                              _pump(proc.stderr, '{} stderr'.format(proc.pid), stderr),
+                                              proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        log.warning('Killing process {} after {} seconds: {}'.format(proc.pid, timeout, ' '.join(cmd)))
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout, output=b''.join(stdout), stderr=b''.join(stderr))
+    result = ProcessResult(b''.join(stdout).decode('utf-8'), b''.join(stderr).decode('utf-8'))
     if proc.returncode != returncode:
-        print("Stderr: {}".format(stderr))
-        print("Stdout: {}".format(stdout))
-        assert proc.returncode == returncode
-    return ProcessResult(stdout.decode('utf-8'), stderr.decode('utf-8'))
+        log.error('Process {} exited with {}\nStderr: {}\nStdout: {}'.format(
+            proc.pid, proc.returncode, result.stderr, result.stdout))
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=result.stdout, stderr=result.stderr)
+    return result
+
+
+def run_sync(coroutine):
+    """Run coroutine to completion on a private event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        if sys.version_info < (3, 8):
+            # older pythons only reap children of loops attached to the child watcher
+            asyncio.get_child_watcher().attach_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
 
 
 class CLIClient(StackApiMixin):
@@ -31,21 +77,53 @@ class CLIClient(StackApiMixin):
     A low-level client for the Docker Engine CLI.
 
     Args:
-        base_dir (str): path to base directory.
+        timeout (int): seconds a CLI command may run before it is killed.
+        concurrency (int): maximum number of CLI commands run at once by :py:meth:`dispatch_many`.
 
     Example:
         >>> import client
         >>> client = client.CLIClient(base_dir='')
         >>> client.version()
     """
-    def __init__(self, timeout=DEFAULT_TIMEOUT_SECONDS):
+    def __init__(self, timeout=DEFAULT_TIMEOUT_SECONDS, concurrency=4):
         self.timeout = timeout
+        self.concurrency = concurrency
         self.base_dir = 'fixtures'
 
-    def dispatch(self, options, project_options=None, returncode=0):
+    async def dispatch_async(self, options, project_options=None, returncode=0):
         project_options = project_options or []
-        proc = start_process(self.base_dir, project_options + options)
-        return wait_on_process(proc, returncode=returncode)
+        return await run_process(self.base_dir, project_options + options, timeout=self.timeout,
+                                 returncode=returncode)
+
+    def dispatch(self, options, project_options=None, returncode=0):
+        return run_sync(self.dispatch_async(options, project_options=project_options, returncode=returncode))
+
+    def dispatch_many(self, commands, project_options=None, returncode=0):
+        """
+        Run several CLI commands concurrently, at most ``concurrency`` at a time.
+
+        Every command is run to completion even when another one fails, the first
+        failure is raised afterwards.
+
+        Args:
+            commands (list): options of each command.
+
+        Returns:
+            (list of :py:class:`ProcessResult`): The results in the order of commands.
+        """
+        async def dispatch_all():
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def dispatch(options):
+                async with semaphore:
+                    return await self.dispatch_async(options, project_options=project_options,
+                                                     returncode=returncode)
+            return await asyncio.gather(*[dispatch(options) for options in commands], return_exceptions=True)
+        results = run_sync(dispatch_all())
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
 
     def version(self):
         """
@@ -1,6 +1,6 @@
 import docker
 from .cli.client import CLIClient
-from .models.stacks import StackCollection
+from .models.stacks import StackCollection, StackIndex
                                                                                 
     
 class DockerClient(docker.DockerClient):
@@ -12,6 +12,7 @@ class DockerClient(docker.DockerClient):
     def __init__(self, *args, **kwargs):
         super(DockerClient, self).__init__(*args, **kwargs)
         self.cli = CLIClient()
+        self.stack_index = StackIndex()
 
     @property
     def stacks(self):
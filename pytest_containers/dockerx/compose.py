@@ -0,0 +1,90 @@
+import os
+import re
+
+import yaml
+
+
+_INTERPOLATION = re.compile(r'\$(?:(?P<escaped>\$)|(?P<named>[_a-zA-Z][_a-zA-Z0-9]*)|'
+                            r'{(?P<braced>[_a-zA-Z][_a-zA-Z0-9]*)(?:(?P<separator>:?[-?])(?P<default>[^}]*))?})')
+
+_DURATION = re.compile(r'(?P<value>\d+(?:\.\d+)?)(?P<unit>ns|us|ms|s|m|h)')
+
+_DURATION_UNITS = {'ns': 1, 'us': 1000, 'ms': 1000000, 's': 1000000000, 'm': 60000000000, 'h': 3600000000000}
+
+_BYTES_UNITS = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+class ComposeError(ValueError):
+    """Raised when a compose file can not be loaded.
+    """
+
+
+def interpolate(value, environment):
+    """Substitute ``$VAR``, ``${VAR}``, ``${VAR:-default}`` and ``${VAR?error}`` in strings of value.
+    """
+    if isinstance(value, dict):
+        return dict((key, interpolate(item, environment)) for key, item in value.items())
+    if isinstance(value, list):
+        return [interpolate(item, environment) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def substitute(match):
+        if match.group('escaped'):
+            return '$'
+        name = match.group('named') or match.group('braced')
+        separator = match.group('separator')
+        current = environment.get(name)
+        if separator in [':-', ':?'] and not current:
+            current = None
+        if current is not None:
+            return current
+        if separator is not None and separator.endswith('?'):
+            raise ComposeError('required variable {} is missing: {}'.format(name, match.group('default')))
+        return match.group('default') or ''
+    return _INTERPOLATION.sub(substitute, value)
+
+
+def parse_duration(value):
+    """Return duration such as ``1m30s`` in nanoseconds.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    matches = list(_DURATION.finditer(value))
+    if not matches or ''.join(match.group(0) for match in matches) != value:
+        raise ComposeError('invalid duration {!r}'.format(value))
+    return int(sum(float(match.group('value')) * _DURATION_UNITS[match.group('unit')] for match in matches))
+
+
+def parse_bytes(value):
+    """Return size such as ``50M`` in bytes.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([bkmg])?b?$', value.strip().lower())
+    if match is None:
+        raise ComposeError('invalid size {!r}'.format(value))
+    return int(float(match.group(1)) * _BYTES_UNITS[match.group(2) or 'b'])
+
+
+def load(compose_file, environment=None):
+    """Load and interpolate compose_file.
+
+    Returns:
+        (dict): the compose document with ``services``, ``networks``, ``secrets`` and ``configs``
+        always present and relative file paths resolved against the directory of the compose file.
+    """
+    environment = os.environ if environment is None else environment
+    with open(compose_file) as stream:
+        document = yaml.safe_load(stream) or {}
+    if not isinstance(document, dict) or not isinstance(document.get('services'), dict):
+        raise ComposeError('{} does not define any services'.format(compose_file))
+    document = interpolate(document, environment)
+    base_dir = os.path.dirname(os.path.abspath(compose_file))
+    for section in ['services', 'networks', 'secrets', 'configs']:
+        document[section] = dict((name, spec or {}) for name, spec in (document.get(section) or {}).items())
+    for section in ['secrets', 'configs']:
+        for spec in document[section].values():
+            if 'file' in spec:
+                spec['file'] = os.path.join(base_dir, spec['file'])
+    return document
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+
+from docker import errors
+
+from .engine import NAMESPACE_LABEL
+
+log = logging.getLogger(__name__)
+
+
+# attribute of container events naming the service the task container belongs to
+SERVICE_ID_LABEL = 'com.docker.swarm.service.id'
+
+
+class StackConvergenceError(errors.DockerException):
+    """Raised when the services of a stack do not reach their replica count in time.
+    """
+
+    def __init__(self, stack, reason, task_errors=None):
+        super(StackConvergenceError, self).__init__(reason)
+        self.stack = stack
+        self.reason = reason
+        self.task_errors = task_errors or []
+
+    def __str__(self):
+        message = 'stack {} did not converge: {}'.format(self.stack, self.reason)
+        if self.task_errors:
+            message += '\n--- failed tasks ---\n{}'.format('\n'.join(self.task_errors))
+        return message
+
+
+class StackWatcher(object):
+    """Desired and actual task states of a stack, updated incrementally.
+
+    Args:
+        api (:py:class:`docker.APIClient`): low-level client.
+        name (str): stack name.
+    """
+
+    def __init__(self, api, name):
+        self.api = api
+        self.name = name
+        self.filters = {'label': '{}={}'.format(NAMESPACE_LABEL, name)}
+        self.services = {}
+        self.tasks = {}
+
+    def refresh(self, service_id=None):
+        """Reload the tasks of service_id, or the services and tasks of the whole stack.
+        """
+        if service_id is None:
+            self.services = dict((service['ID'], service) for service in self.api.services(filters=self.filters))
+            tasks = self.api.tasks(filters=self.filters)
+            self.tasks = dict((task['ID'], task) for task in tasks)
+            return
+        tasks = self.api.tasks(filters={'service': service_id})
+        self.tasks = dict((task_id, task) for task_id, task in self.tasks.items() if task['ServiceID'] != service_id)
+        self.tasks.update((task['ID'], task) for task in tasks)
+
+    def pending(self):
+        """Return names of the services which have not reached their replica count.
+        """
+        running = {}
+        desired = {}
+        for task in self.tasks.values():
+            if task.get('DesiredState') != 'running':
+                continue
+            desired[task['ServiceID']] = desired.get(task['ServiceID'], 0) + 1
+            if task['Status']['State'] == 'running':
+                running[task['ServiceID']] = running.get(task['ServiceID'], 0) + 1
+        pending = []
+        for service_id, service in self.services.items():
+            mode = service['Spec'].get('Mode') or {}
+            if 'Replicated' in mode:
+                replicas = mode['Replicated'].get('Replicas', 1)
+            else:
+                # global services run one task on every eligible node, at least one is expected
+                replicas = max(desired.get(service_id, 0), 1)
+            if running.get(service_id, 0) != replicas:
+                pending.append(service['Spec']['Name'])
+        return sorted(pending)
+
+    def task_errors(self):
+        """Return one line per task which failed or was rejected.
+        """
+        names = dict((service_id, service['Spec']['Name']) for service_id, service in self.services.items())
+        lines = []
+        for task in sorted(self.tasks.values(), key=lambda task: task['Status'].get('Timestamp', '')):
+            status = task['Status']
+            if status['State'] in ['failed', 'rejected'] or status.get('Err'):
+                lines.append('{}.{} {}: {}'.format(names.get(task['ServiceID'], task['ServiceID']),
+                                                   task.get('Slot', task.get('NodeID', '')),
+                                                   status['State'], status.get('Err', status.get('Message', ''))))
+        return lines
+
+
+def _read_events(stream, events):
+    try:
+        for event in stream:
+            events.put(event)
+    except Exception as err:
+        log.debug('event stream closed: {}'.format(err))
+
+
+def wait_converged(client, name, timeout=60, poll_interval=2.0):
+    """Block until every service of stack name runs its replica count, return seconds waited.
+
+    A single event stream filtered by the stack namespace label is watched, task container
+    events only reload the tasks of their service. The whole stack is reloaded every
+    ``poll_interval`` seconds to notice tasks scheduled on other nodes.
+
+    Raises:
+        :py:class:`StackConvergenceError`
+            If the stack has no services or does not converge before timeout.
+    """
+    started = time.time()
+    deadline = started + timeout
+    watcher = StackWatcher(client.api, name)
+    events = queue.Queue()
+    filters = dict(watcher.filters, type='container')
+    stream = client.api.events(since=started, until=deadline, filters=filters, decode=True)
+    reader = threading.Thread(target=_read_events, args=(stream, events), name='stack-events-{}'.format(name))
+    reader.daemon = True
+    reader.start()
+    try:
+        watcher.refresh()
+        if not watcher.services:
+            raise StackConvergenceError(name, 'no services found')
+        polled = time.time()
+        while True:
+            pending = watcher.pending()
+            if not pending:
+                waited = time.time() - started
+                log.info('stack {} converged after {:.2f} seconds'.format(name, waited))
+                return waited
+            now = time.time()
+            if now >= deadline:
+                raise StackConvergenceError(name, 'services {} not running after {} seconds'.format(
+                    ', '.join(pending), timeout), watcher.task_errors())
+            try:
+                event = events.get(timeout=min(polled + poll_interval, deadline) - now)
+            except queue.Empty:
+                event = None
+            if event is None or time.time() - polled >= poll_interval:
+                watcher.refresh()
+                polled = time.time()
+                continue
+            service_id = (event.get('Actor') or {}).get('Attributes', {}).get(SERVICE_ID_LABEL)
+            watcher.refresh(service_id)
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,315 @@
+import logging
+import os
+import shlex
+import time
+
+from docker import errors, types
+
+from . import compose
+
+log = logging.getLogger(__name__)
+
+
+NAMESPACE_LABEL = 'com.docker.stack.namespace'
+IMAGE_LABEL = 'com.docker.stack.image'
+
+# errors of removing a network whose task containers are still detaching
+NETWORK_IN_USE = ['active endpoints', 'in use']
+
+
+def _namespace_filters(name):
+    return {'label': '{}={}'.format(NAMESPACE_LABEL, name)}
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return shlex.split(value)
+    return list(value)
+
+
+def _as_dict(value, separator='='):
+    # compose accepts mappings or lists of "key=value"
+    if value is None:
+        return {}
+    if isinstance(value, dict):
+        return dict((key, '' if item is None else str(item)) for key, item in value.items())
+    result = {}
+    for item in value:
+        key, _, item_value = item.partition(separator)
+        result[key] = item_value
+    return result
+
+
+def _ports(ports):
+    result = []
+    for port in ports or []:
+        if isinstance(port, dict):
+            spec = {'TargetPort': int(port['target']), 'Protocol': port.get('protocol', 'tcp'),
+                    'PublishMode': port.get('mode', 'ingress')}
+            if port.get('published') is not None:
+                spec['PublishedPort'] = int(port['published'])
+            result.append(spec)
+            continue
+        port, _, protocol = str(port).partition('/')
+        published, _, target = port.rpartition(':')
+        published = published.rpartition(':')[2]
+        spec = {'TargetPort': int(target), 'Protocol': protocol or 'tcp', 'PublishMode': 'ingress'}
+        if published:
+            spec['PublishedPort'] = int(published)
+        result.append(spec)
+    return result
+
+
+def _healthcheck(healthcheck):
+    if not healthcheck:
+        return None
+    if healthcheck.get('disable'):
+        return types.Healthcheck(test=['NONE'])
+    test = healthcheck.get('test')
+    if isinstance(test, str):
+        test = ['CMD-SHELL', test]
+    return types.Healthcheck(test=test,
+                             interval=compose.parse_duration(healthcheck.get('interval')),
+                             timeout=compose.parse_duration(healthcheck.get('timeout')),
+                             retries=healthcheck.get('retries'),
+                             start_period=compose.parse_duration(healthcheck.get('start_period')))
+
+
+def _resources(resources):
+    limits = resources.get('limits') or {}
+    reservations = resources.get('reservations') or {}
+    if not limits and not reservations:
+        return None
+
+    def nano_cpus(value):
+        return int(float(value) * 1000000000) if value is not None else None
+    return types.Resources(cpu_limit=nano_cpus(limits.get('cpus')),
+                           mem_limit=compose.parse_bytes(limits.get('memory')),
+                           cpu_reservation=nano_cpus(reservations.get('cpus')),
+                           mem_reservation=compose.parse_bytes(reservations.get('memory')))
+
+
+def _restart_policy(policy):
+    if not policy:
+        return None
+    return types.RestartPolicy(condition=policy.get('condition', 'any'),
+                               delay=compose.parse_duration(policy.get('delay')) or 0,
+                               max_attempts=policy.get('max_attempts') or 0,
+                               window=compose.parse_duration(policy.get('window')) or 0)
+
+
+class StackEngine(object):
+    """
+    Deploy and remove stacks directly through the Docker Engine API.
+
+    This is a native replacement for ``docker stack deploy`` and ``docker stack rm``
+    supporting the services, networks and secrets sections of version 3 compose files.
+    Every created object is labelled with ``com.docker.stack.namespace`` like the CLI does.
+
+    Args:
+        client (:py:class:`~pytest_containers.dockerx.DockerClient`): client used to talk to the engine.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _compose_path(self, compose_file):
+        # the CLI resolves compose files relative to its base directory
+        if not os.path.isabs(compose_file):
+            candidate = os.path.join(self.client.cli.base_dir, compose_file)
+            if os.path.exists(candidate):
+                return candidate
+        return compose_file
+
+    def deploy(self, name, compose_file, prune=False, **kwargs):
+        """
+        Deploy a stack. Similar to ``docker stack deploy``.
+
+        Args:
+            name (str): The name for this stack.
+            compose_file (str): Path to a Compose file.
+            prune (bool): Remove services that are no longer referenced.
+
+        Other keyword arguments of ``docker stack deploy`` are accepted and ignored.
+
+        Returns:
+            (dict): The stack attributes.
+        """
+        document = compose.load(self._compose_path(compose_file))
+        labels = {NAMESPACE_LABEL: name}
+        networks = self._create_networks(name, document, labels)
+        secrets = self._create_secrets(name, document, labels)
+        existing = dict((service.name, service) for service in
+                        self.client.services.list(filters=_namespace_filters(name)))
+        for service_name, spec in sorted(document['services'].items()):
+            full_name = '{}_{}'.format(name, service_name)
+            service_kwargs = self._service_kwargs(name, service_name, spec, networks, secrets)
+            service = existing.pop(full_name, None)
+            if service is None:
+                log.info('Creating service {}'.format(full_name))
+                self.client.services.create(**service_kwargs)
+            else:
+                log.info('Updating service {} (id: {})'.format(full_name, service.id))
+                service.update(**service_kwargs)
+        if prune:
+            for service in existing.values():
+                log.info('Removing service {}'.format(service.name))
+                service.remove()
+        return {'Name': name, 'Services': len(document['services'])}
+
+    def _create_networks(self, name, document, labels):
+        declared = dict(document['networks'])
+        if any('networks' not in spec for spec in document['services'].values()):
+            declared.setdefault('default', {})
+        existing = set(network.name for network in self.client.networks.list(filters=_namespace_filters(name)))
+        networks = {}
+        for key, spec in sorted(declared.items()):
+            if spec.get('external'):
+                external = spec['external']
+                networks[key] = external['name'] if isinstance(external, dict) and 'name' in external \
+                    else spec.get('name', key)
+                continue
+            network_name = spec.get('name', '{}_{}'.format(name, key))
+            networks[key] = network_name
+            if network_name in existing:
+                continue
+            ipam = None
+            if spec.get('ipam'):
+                pools = [types.IPAMPool(subnet=config.get('subnet')) for config in spec['ipam'].get('config') or []]
+                ipam = types.IPAMConfig(driver=spec['ipam'].get('driver', 'default'), pool_configs=pools)
+            log.info('Creating network {}'.format(network_name))
+            network_labels = dict(_as_dict(spec.get('labels')), **labels)
+            self.client.networks.create(name=network_name, driver=spec.get('driver', 'overlay'),
+                                        options=spec.get('driver_opts'), ipam=ipam,
+                                        attachable=spec.get('attachable', False),
+                                        internal=spec.get('internal', False),
+                                        labels=network_labels)
+        return networks
+
+    def _create_secrets(self, name, document, labels):
+        existing = dict((secret.name, secret) for secret in self.client.secrets.list(filters=_namespace_filters(name)))
+        secrets = {}
+        for key, spec in sorted(document['secrets'].items()):
+            if spec.get('external'):
+                external = spec['external']
+                secret_name = external['name'] if isinstance(external, dict) and 'name' in external \
+                    else spec.get('name', key)
+                secrets[key] = self.client.secrets.get(secret_name)
+                continue
+            secret_name = spec.get('name', '{}_{}'.format(name, key))
+            if secret_name in existing:
+                secrets[key] = existing[secret_name]
+                continue
+            with open(spec['file'], 'rb') as secret_file:
+                data = secret_file.read()
+            log.info('Creating secret {}'.format(secret_name))
+            secret_labels = dict(_as_dict(spec.get('labels')), **labels)
+            secrets[key] = self.client.secrets.create(name=secret_name, data=data, labels=secret_labels)
+        return secrets
+
+    def _service_kwargs(self, name, service_name, spec, networks, secrets):
+        if 'image' not in spec:
+            raise compose.ComposeError('service {} has no image'.format(service_name))
+        deploy = spec.get('deploy') or {}
+        labels = {NAMESPACE_LABEL: name}
+        service_labels = dict(_as_dict(deploy.get('labels')), **labels)
+        service_labels[IMAGE_LABEL] = spec['image']
+        container_labels = dict(_as_dict(spec.get('labels')), **labels)
+        service_networks = spec.get('networks', ['default'])
+        if isinstance(service_networks, dict):
+            aliases = dict((key, (value or {}).get('aliases', [])) for key, value in service_networks.items())
+        else:
+            aliases = dict((key, []) for key in service_networks)
+        # services resolve each other by the name used in the compose file
+        service_networks = [{'Target': networks[key], 'Aliases': [service_name] + list(aliases[key])}
+                            for key in sorted(aliases)]
+        secret_references = []
+        for secret in spec.get('secrets') or []:
+            if isinstance(secret, str):
+                secret = {'source': secret}
+            target = secrets[secret['source']]
+            secret_mode = secret.get('mode', 0o444)
+            if isinstance(secret_mode, str):
+                secret_mode = int(secret_mode, 8)
+            secret_references.append(types.SecretReference(
+                secret_id=target.id, secret_name=target.name, filename=secret.get('target', secret['source']),
+                uid=str(secret.get('uid', '0')), gid=str(secret.get('gid', '0')), mode=secret_mode))
+        mode = deploy.get('mode', 'replicated')
+        replicas = deploy.get('replicas', 1) if mode == 'replicated' else None
+        kwargs = {
+            'image': spec['image'],
+            'name': '{}_{}'.format(name, service_name),
+            'command': _as_list(spec.get('entrypoint')),
+            'args': _as_list(spec.get('command')),
+            'env': ['{}={}'.format(key, value) for key, value in sorted(_as_dict(spec.get('environment')).items())],
+            'labels': service_labels,
+            'container_labels': container_labels,
+            'networks': service_networks,
+            'mode': types.ServiceMode(mode=mode, replicas=replicas),
+            'constraints': (deploy.get('placement') or {}).get('constraints'),
+            'secrets': secret_references,
+            'endpoint_spec': types.EndpointSpec(mode=deploy.get('endpoint_mode'), ports=_ports(spec.get('ports'))),
+            'hostname': spec.get('hostname'),
+            'user': spec.get('user'),
+            'workdir': spec.get('working_dir'),
+            'tty': spec.get('tty', False),
+            'stop_grace_period': compose.parse_duration(spec.get('stop_grace_period')),
+            'healthcheck': _healthcheck(spec.get('healthcheck')),
+            'resources': _resources(deploy.get('resources') or {}),
+            'restart_policy': _restart_policy(deploy.get('restart_policy')),
+        }
+        return dict((key, value) for key, value in kwargs.items() if value not in [None, [], {}])
+
+    def remove(self, name, timeout=60, poll_interval=0.5):
+        """
+        Remove a stack. Similar to ``docker stack rm``.
+
+        Services are removed first, then the secrets and, once the tasks of the services are gone,
+        the networks of the stack.
+
+        Args:
+            name (str): Stack name.
+            timeout (int): Seconds to wait for the task containers to detach from the networks.
+            poll_interval (float): Seconds between checks of the tasks and network removal attempts.
+
+        Raises:
+            :py:class:`docker.errors.APIError`
+                If a network is still in use after timeout.
+        """
+        filters = _namespace_filters(name)
+        services = self.client.services.list(filters=filters)
+        networks = self.client.networks.list(filters=filters)
+        secrets = self.client.secrets.list(filters=filters)
+        if not (services or networks or secrets):
+            log.info('Nothing found in stack: {}'.format(name))
+            return
+        deadline = time.time() + timeout
+        for collection in [services, secrets]:
+            for model in collection:
+                self._remove(model)
+        if services and networks:
+            self._wait_for_tasks(name, deadline, poll_interval)
+        for network in networks:
+            while True:
+                try:
+                    self._remove(network)
+                    break
+                except errors.APIError as err:
+                    if time.time() >= deadline or not any(x in str(err) for x in NETWORK_IN_USE):
+                        raise
+                    log.debug('network {} still in use: {}'.format(network.name, err))
+                    time.sleep(poll_interval)
+
+    def _remove(self, model):
+        log.info('Removing {} {}'.format(type(model).__name__.lower(), model.name))
+        try:
+            model.remove()
+        except errors.NotFound:
+            pass
+
+    def _wait_for_tasks(self, name, deadline, poll_interval):
+        # task containers of removed services keep their network endpoints until they are shut down
+        while self.client.api.tasks(filters=_namespace_filters(name)) and time.time() < deadline:
+            time.sleep(poll_interval)
@@ -1,6 +1,12 @@
+import threading
+import time
+
 from docker.models.resource import Collection, Model
 from docker import errors
 
+from ..convergence import wait_converged
+from ..engine import NAMESPACE_LABEL, StackEngine
+
 
 class Stack(Model):
     """
@@ -32,7 +38,7 @@ class Stack(Model):
         # docker stack services webapp
         # docker service ls --filter label=com.docker.stack.namespace=self.name
         filters = {}
-        filters['label'] = 'com.docker.stack.namespace={}'.format(self.name)
+        filters['label'] = '{}={}'.format(NAMESPACE_LABEL, self.name)
         services = self.client.services.list(filters=filters)
         return services
 
@@ -44,17 +50,71 @@ class Stack(Model):
         """
         # docker stack ps self.name
         filters = {}
-        filters['label'] = 'com.docker.stack.namespace={}'.format(self.name)
+        filters['label'] = '{}={}'.format(NAMESPACE_LABEL, self.name)
         tasks = self.client.api.tasks(filters=filters)
         return tasks
                 
+    def wait_converged(self, timeout=60, poll_interval=2.0):
+        """
+        Wait until every service of this stack runs its replica count.
+
+        Args:
+            timeout (int): Seconds to wait.
+            poll_interval (float): Seconds between reloads of all tasks, task
+                container events trigger reloads in between.
+
+        Returns:
+            (float): The number of seconds waited.
+
+        Raises:
+            :py:class:`~pytest_containers.dockerx.convergence.StackConvergenceError`
+                If the stack does not converge in time, with the errors of the failed tasks.
+        """
+        return wait_converged(self.client, self.name, timeout=timeout, poll_interval=poll_interval)
+
     def remove(self, **kwargs):
         """
         Remove this stack. Similar to the ``docker stack rm`` command.
+
+        Args:
+            timeout (int): Seconds to wait for the task containers to detach from the networks.
+            poll_interval (float): Seconds between checks of the tasks and network removal attempts.
         """
-        return self.client.cli.remove_stack(self.name, **kwargs)
+        try:
+            return StackEngine(self.client).remove(self.name, **kwargs)
+        finally:
+            self.client.stack_index.invalidate()
     
 
+class StackIndex(object):
+    """
+    Short lived cache of the stack attributes listed by ``docker stack ls``, indexed by name.
+
+    Args:
+        ttl (float): Seconds the listing is reused before the CLI is asked again.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stacks = None
+        self._loaded_at = 0.0
+
+    def stacks(self, load, refresh=False):
+        """
+        Return the stack attributes keyed by name, calling ``load()`` when the cache expired.
+        """
+        with self._lock:
+            if refresh or self._stacks is None or time.time() - self._loaded_at > self.ttl:
+                self._stacks = dict((item['Name'], item) for item in load()['Stacks'])
+                self._loaded_at = time.time()
+            return self._stacks
+
+    def invalidate(self):
+        with self._lock:
+            self._stacks = None
+
+
 class StackCollection(Collection):
     """
     Stacks on the Docker server.
@@ -69,13 +129,13 @@ class StackCollection(Collection):
             name (str): The name for this stack.
             compose_file (str): Path to a Compose file.
             prune (bool): Prune services that are no longer referenced.
-            resolve_image (str): Query the registry to resolve image digest and supported platforms ("always"|"changed"|"never")
-                                 (default "always")
-            with_registry_auth (bool): Send registry authentication details to Swarm agents.
         Returns:
             A :py:class:`Stack` object.
         """
-        resp = self.client.cli.deploy_stack(name=name, compose_file=compose_file, **kwargs)
+        try:
+            resp = StackEngine(self.client).deploy(name=name, compose_file=compose_file, **kwargs)
+        finally:
+            self.client.stack_index.invalidate()
         return self.prepare_model(resp)
     
     def get(self, stack_name):
@@ -91,13 +151,16 @@ class StackCollection(Collection):
             :py:class:`docker.errors.NotFound`
                 If the stack does not exist.
         """
-        stacks = self.list()
-        stack = next((x for x in stacks if x.name == stack_name), None)
-        if stack is None:
+        index = self.client.stack_index
+        attrs = index.stacks(self.client.cli.stacks).get(stack_name)
+        if attrs is None:
+            # the stack may have been deployed by someone else since the listing was cached
+            attrs = index.stacks(self.client.cli.stacks, refresh=True).get(stack_name)
+        if attrs is None:
             raise errors.NotFound('stack {} not found'.format(stack_name))
-        return stack
+        return self.prepare_model(attrs)
     
-    def list(self, **kwargs):
+    def list(self, names=None):
         """
         List stacks. Similar to the ``docker stack ls`` command.
 
@@ -107,6 +170,7 @@ class StackCollection(Collection):
         Returns:
             (list of :py:class:`Stack`) The stacks on the cluster.
         """
-        resp = self.client.cli.stacks(**kwargs)
-        stacks = [self.prepare_model(item) for item in resp['Stacks']]
-        return stacks
+        stacks = self.client.stack_index.stacks(self.client.cli.stacks)
+        if names is not None:
+            stacks = dict((name, stacks[name]) for name in names if name in stacks)
+        return [self.prepare_model(stacks[name]) for name in sorted(stacks)]
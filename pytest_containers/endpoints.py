@@ -0,0 +1,352 @@
+import errno
+import logging
+import selectors
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import docker
+
+from .networks import local_daemon
+from .readiness import DEFAULT_BACKOFF, delays
+
+log = logging.getLogger(__name__)
+
+
+# probes run inside the network namespace of containers this host can not reach
+TCP_COMMAND = 'nc -z 127.0.0.1 {port} || bash -c "echo > /dev/tcp/127.0.0.1/{port}"'
+HTTP_COMMAND = 'curl -fsS -o /dev/null {url} || wget -q -O /dev/null {url}'
+
+DEFAULT_STATUSES = range(200, 400)
+
+# seconds a connection to a published port must stay open, the userland proxy of the daemon accepts it
+# before it connects to the container and closes it again when nothing listens there
+PROXY_SETTLE = 0.1
+
+# connect errors of addresses this host has no route to, such as bridge addresses seen from a container
+UNREACHABLE = [errno.EHOSTUNREACH, errno.ENETUNREACH]
+
+
+class EndpointsNotReady(Exception):
+    """Raised when endpoints do not accept connections before their deadline.
+    """
+
+    def __init__(self, failures):
+        super(EndpointsNotReady, self).__init__(failures)
+        self.failures = failures
+
+    def __str__(self):
+        return 'endpoints not ready: {}'.format(', '.join(
+            '{}:{} ({})'.format(name, port, reason) for name, port, reason in self.failures))
+
+
+def _daemon_host(client):
+    # unix socket and named pipe daemons publish ports on this host
+    base_url = client.api.base_url
+    if base_url.startswith('http+docker://'):
+        return '127.0.0.1'
+    return urlsplit(base_url).hostname
+
+
+def _host_address(container, port, protocol):
+    # returns the address and whether it is a published port
+    settings = container.attrs.get('NetworkSettings') or {}
+    for binding in (settings.get('Ports') or {}).get('{}/{}'.format(port, protocol)) or []:
+        if binding.get('HostPort'):
+            host = binding.get('HostIp') or ''
+            if host in ['', '0.0.0.0', '::']:
+                host = _daemon_host(container.client)
+            return (host, int(binding['HostPort'])), True
+    if not local_daemon(container.client):
+        return None, False
+    if (container.attrs.get('HostConfig') or {}).get('NetworkMode') == 'host':
+        return ('127.0.0.1', port), False
+    for network in (settings.get('Networks') or {}).values():
+        if network.get('IPAddress'):
+            return (network['IPAddress'], port), False
+    return None, False
+
+
+def host_address(container, port, protocol='tcp'):
+    """Return the (host, port) address at which this host reaches port of container, or None.
+
+    Published ports are preferred, then the loopback address for containers on the host network
+    and the container's own addresses, which are only routable from the host of a local Linux daemon.
+    """
+    return _host_address(container, port, protocol)[0]
+
+
+def exposed_ports(container):
+    """Return the TCP ports exposed by container.
+    """
+    exposed = (container.attrs.get('Config') or {}).get('ExposedPorts') or {}
+    return sorted(int(port.split('/')[0]) for port in exposed if port.endswith('/tcp'))
+
+
+class _Probe(object):
+    # connects to one endpoint, optionally sends an HTTP request and checks the status line
+
+    def __init__(self, container, port, deadline, backoff, path=None, statuses=DEFAULT_STATUSES):
+        self.container = container
+        self.port = port
+        self.deadline = deadline
+        self.path = path
+        self.statuses = statuses
+        self.address = None
+        self.published = False
+        self.in_container = False
+        self.reason = 'not probed'
+        self.sock = None
+        self.connected = False
+        self.settling = False
+        self.attempt_deadline = None
+        self.next_attempt = 0
+        self.response = b''
+        self._delays = delays(backoff)
+
+    @property
+    def command(self):
+        if self.path is None:
+            return TCP_COMMAND.format(port=self.port)
+        return HTTP_COMMAND.format(url='http://127.0.0.1:{}{}'.format(self.port, self.path))
+
+    def request(self):
+        return 'GET {} HTTP/1.0\r\nHost: {}:{}\r\nConnection: close\r\n\r\n'.format(
+            self.path, self.address[0], self.address[1]).encode('ascii')
+
+
+class _HostProber(object):
+    # drives every probe of this host over non-blocking sockets from a single selector, probes of
+    # addresses this host can not route to are handed to fallback
+
+    def __init__(self, probes, connect_timeout, fallback):
+        self.probes = probes
+        self.connect_timeout = connect_timeout
+        self.fallback = fallback
+        self.selector = selectors.DefaultSelector()
+        self.failures = []
+
+    def run(self):
+        pending = list(self.probes)
+        try:
+            while pending:
+                now = time.time()
+                for probe in list(pending):
+                    if probe.sock is None and probe.next_attempt <= now:
+                        self._connect(probe, now)
+                    elif probe.sock is not None and now >= probe.attempt_deadline:
+                        self._timeout(probe)
+                    if probe.sock is None and not probe.in_container and probe.next_attempt > probe.deadline:
+                        self.failures.append((probe.container.name, probe.port, probe.reason))
+                        pending.remove(probe)
+                pending = [probe for probe in pending if probe.reason != 'ready' and not probe.in_container]
+                if not pending:
+                    break
+                wakeup = min(probe.attempt_deadline if probe.sock is not None else probe.next_attempt
+                             for probe in pending)
+                for key, events in self.selector.select(max(wakeup - time.time(), 0)):
+                    self._step(key.data, events)
+                pending = [probe for probe in pending if probe.reason != 'ready' and not probe.in_container]
+        finally:
+            for probe in self.probes:
+                self._close(probe)
+            self.selector.close()
+        return self.failures
+
+    def _connect(self, probe, now):
+        family = socket.AF_INET6 if ':' in probe.address[0] else socket.AF_INET
+        probe.sock = socket.socket(family, socket.SOCK_STREAM)
+        probe.sock.setblocking(False)
+        probe.response = b''
+        probe.connected = probe.settling = False
+        probe.attempt_deadline = min(now + self.connect_timeout, probe.deadline)
+        err = probe.sock.connect_ex(probe.address)
+        if err not in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+            self._connect_failed(probe, err)
+            return
+        self.selector.register(probe.sock, selectors.EVENT_WRITE, probe)
+
+    def _connect_failed(self, probe, err):
+        reason = errno.errorcode.get(err, str(err))
+        if err in UNREACHABLE:
+            self._hand_off(probe, reason)
+        else:
+            self._retry(probe, reason)
+
+    def _timeout(self, probe):
+        if probe.settling:
+            # the connection stayed open, something listens behind the proxy
+            self._ready(probe)
+        elif not probe.connected and not probe.published:
+            # container addresses which drop connections are not routable from here
+            self._hand_off(probe, 'timed out')
+        else:
+            self._retry(probe, 'timed out')
+
+    def _step(self, probe, events):
+        if events & selectors.EVENT_WRITE:
+            err = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self._connect_failed(probe, err)
+                return
+            probe.connected = True
+            if probe.path is None and not probe.published:
+                self._ready(probe)
+                return
+            if probe.path is None:
+                probe.settling = True
+                probe.attempt_deadline = min(time.time() + PROXY_SETTLE, probe.deadline)
+            else:
+                try:
+                    # a request line and a few headers fit into the empty send buffer
+                    probe.sock.send(probe.request())
+                except OSError as err:
+                    self._retry(probe, str(err))
+                    return
+            self.selector.modify(probe.sock, selectors.EVENT_READ, probe)
+            return
+        try:
+            data = probe.sock.recv(4096)
+        except OSError as err:
+            self._retry(probe, str(err))
+            return
+        if probe.settling:
+            if data:
+                # the service spoke first
+                self._ready(probe)
+            else:
+                self._retry(probe, 'connection closed')
+            return
+        probe.response += data
+        if b'\r\n' not in probe.response:
+            if not data:
+                self._retry(probe, 'connection closed')
+            return
+        status_line = probe.response.split(b'\r\n', 1)[0].decode('latin-1').split()
+        try:
+            status = int(status_line[1])
+        except (IndexError, ValueError):
+            self._retry(probe, 'invalid response')
+            return
+        if status in probe.statuses:
+            self._ready(probe)
+        else:
+            self._retry(probe, 'status {}'.format(status))
+
+    def _ready(self, probe):
+        self._close(probe)
+        probe.reason = 'ready'
+        log.info('{}:{} ready at {}:{}'.format(probe.container.name, probe.port, *probe.address))
+
+    def _retry(self, probe, reason):
+        self._close(probe)
+        probe.reason = reason
+        probe.next_attempt = time.time() + next(probe._delays)
+
+    def _hand_off(self, probe, reason):
+        self._close(probe)
+        probe.reason = reason
+        probe.in_container = True
+        log.info('{}:{} not reachable at {}:{} ({}), probing inside the container'.format(
+            probe.container.name, probe.port, probe.address[0], probe.address[1], reason))
+        self.fallback(probe)
+
+    def _close(self, probe):
+        if probe.sock is not None:
+            try:
+                self.selector.unregister(probe.sock)
+            except (KeyError, ValueError):
+                pass
+            probe.sock.close()
+            probe.sock = None
+
+
+def _probe_in_container(probe):
+    # returns None when ready or the reason of the last failure
+    while True:
+        try:
+            result = probe.container.exec_run(['sh', '-c', probe.command])
+            if result.exit_code == 0:
+                log.info('{}:{} ready inside the container'.format(probe.container.name, probe.port))
+                return None
+            probe.reason = 'probe exited with {}'.format(result.exit_code)
+        except docker.errors.APIError as err:
+            probe.reason = str(err)
+        delay = next(probe._delays)
+        if time.time() + delay > probe.deadline:
+            return probe.reason
+        time.sleep(delay)
+
+
+def _wait(probes, connect_timeout, max_workers):
+    started = time.time()
+    from_host, from_container = [], []
+    for probe in probes:
+        probe.address, probe.published = _host_address(probe.container, probe.port, 'tcp')
+        (from_host if probe.address is not None else from_container).append(probe)
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(min(len(probes), max_workers), 1)) as executor:
+        futures = [(probe, executor.submit(_probe_in_container, probe)) for probe in from_container]
+        if from_host:
+            def fallback(probe):
+                futures.append((probe, executor.submit(_probe_in_container, probe)))
+            failures.extend(_HostProber(from_host, connect_timeout, fallback).run())
+        for probe, future in futures:
+            reason = future.result()
+            if reason is not None:
+                failures.append((probe.container.name, probe.port, reason))
+    if failures:
+        raise EndpointsNotReady(failures)
+    return time.time() - started
+
+
+def _containers(containers):
+    return containers if isinstance(containers, (list, tuple)) else [containers]
+
+
+def wait_for_ports(containers, ports=None, timeout=30, backoff=DEFAULT_BACKOFF, connect_timeout=1.0, max_workers=8):
+    """Block until every port of every container accepts TCP connections and return the number of seconds waited.
+
+    All ports are probed at once from this host over non-blocking sockets, at their published
+    port or container address. A published port is ready once a connection stays open for
+    :py:data:`PROXY_SETTLE` seconds, as the proxy of the daemon accepts connections before the
+    container listens. Ports this host can not reach, or whose container address can not be
+    routed to, are probed by running ``nc`` or ``bash`` inside the container.
+
+    Args:
+        containers: container or list of containers, whose attributes are up to date.
+        ports: list of ports, or dict of port to the seconds it may take, by default the exposed ports.
+        timeout (float): seconds each port may take.
+        backoff (:py:class:`pytest_containers.readiness.Backoff`): delay between attempts.
+        connect_timeout (float): seconds a single connection attempt may take.
+        max_workers (int): number of probes run inside containers at once.
+
+    Raises:
+        :py:class:`EndpointsNotReady`
+            If a port does not accept connections before its deadline.
+    """
+    now = time.time()
+    probes = []
+    for container in _containers(containers):
+        selected = exposed_ports(container) if ports is None else ports
+        timeouts = selected if isinstance(selected, dict) else dict.fromkeys(selected, timeout)
+        probes.extend(_Probe(container, port, now + port_timeout, backoff)
+                      for port, port_timeout in sorted(timeouts.items()))
+    return _wait(probes, connect_timeout, max_workers)
+
+
+def wait_for_http(containers, port, path='/', timeout=30, backoff=DEFAULT_BACKOFF, connect_timeout=1.0,
+                  statuses=DEFAULT_STATUSES, max_workers=8):
+    """Block until ``GET path`` on port of every container answers with one of statuses and return the seconds waited.
+
+    Probed like :py:func:`wait_for_ports`, with ``curl`` or ``wget`` inside containers this host can not reach.
+
+    Raises:
+        :py:class:`EndpointsNotReady`
+            If an endpoint does not answer with one of statuses before the deadline.
+    """
+    deadline = time.time() + timeout
+    probes = [_Probe(container, port, deadline, backoff, path=path, statuses=statuses)
+              for container in _containers(containers)]
+    return _wait(probes, connect_timeout, max_workers)
@@ -0,0 +1,189 @@
+import logging
+import re
+import select
+import shlex
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import docker
+
+from . import timing
+
+log = logging.getLogger(__name__)
+
+
+CommandResult = namedtuple('CommandResult', 'exit_code stdout stderr')
+
+STDOUT = 1
+STDERR = 2
+
+# seconds a timed out command is given to report its exit after it was killed
+KILL_GRACE = 5
+
+# each command runs in a background subshell whose pid is reported, so it can be killed on timeout,
+# the exit code and a marker on both streams frame its output
+SCRIPT = """( {command}
+) </dev/null &
+printf '%s %s\\n' '{marker}-pid' "$!"
+wait "$!"
+printf '%s %s\\n' '{marker}' "$?"
+printf '%s\\n' '{marker}' >&2
+"""
+
+
+class ExecSessionError(Exception):
+    """Raised when the shell of an exec session exits or its connection breaks.
+    """
+
+
+class ExecTimeout(Exception):
+    """Raised when a command of an exec session does not finish before its timeout.
+    """
+
+    def __init__(self, command, timeout, stdout=b'', stderr=b''):
+        super(ExecTimeout, self).__init__(command)
+        self.command = command
+        self.timeout = timeout
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __str__(self):
+        return 'command {!r} did not finish within {} seconds'.format(self.command, self.timeout)
+
+
+class ExecSession(object):
+    """Long lived shell in a container which runs one command after another over a single exec.
+
+    Running a command costs a write to the attached socket and a fork in the container instead of
+    an exec create, an exec start and a new connection. Commands run in a subshell of the session's
+    shell, so state such as the working directory does not carry over between commands. The shell is
+    started on the first command and again after it exited or a timed out command could not be killed.
+
+    Args:
+        container (:py:class:`docker.models.containers.Container`): running container.
+        shell (str): shell started in the container.
+        timeout (float): seconds a command may take unless run is given another timeout.
+    """
+
+    def __init__(self, container, shell='sh', timeout=60):
+        self.container = container
+        self.shell = shell
+        self.timeout = timeout
+        self.commands = 0
+        self.starts = 0
+        self._lock = threading.Lock()
+        self._socket = None
+        self._raw = None
+        self._frames = b''
+        self._output = {STDOUT: b'', STDERR: b''}
+
+    def run(self, command, timeout=None):
+        """Run command and return a :py:class:`CommandResult` of its exit code and output.
+
+        Args:
+            command: shell command line, or list of arguments which are quoted.
+            timeout (float): seconds the command may take.
+
+        Raises:
+            :py:class:`ExecTimeout`
+                If the command does not finish in time, it is killed.
+            :py:class:`ExecSessionError`
+                If the shell exits while the command runs.
+        """
+        if not isinstance(command, str):
+            command = ' '.join(shlex.quote(str(argument)) for argument in command)
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._raw is None:
+                self._open()
+            marker = 'pytest-containers-' + uuid.uuid4().hex
+            self.commands += 1
+            log.debug('session {} $ {}'.format(self.container.name, command))
+            with timing.span('session exec'):
+                try:
+                    self._raw.sendall(SCRIPT.format(command=command, marker=marker).encode('utf-8'))
+                    result = self._read(marker, time.time() + timeout)
+                except (OSError, ExecSessionError):
+                    self._close()
+                    raise
+                if result is None:
+                    self._kill(command, marker, timeout)
+            return result
+
+    def close(self):
+        """End the shell.
+        """
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        api = self.container.client.api
+        log.info('docker container exec --interactive {} {}'.format(self.container.name, self.shell))
+        with timing.span('session start'):
+            exec_id = api.exec_create(self.container.id, [self.shell], stdin=True, stdout=True, stderr=True)['Id']
+            self._socket = api.exec_start(exec_id, socket=True)
+        # docker-py hands out the socket wrapped in a SocketIO for unix and plain TCP daemons
+        self._raw = getattr(self._socket, '_sock', self._socket)
+        self._frames = b''
+        self._output = {STDOUT: b'', STDERR: b''}
+        self.starts += 1
+
+    def _close(self):
+        if self._raw is None:
+            return
+        try:
+            self._raw.sendall(b'exit\n')
+        except OSError:
+            pass
+        self._socket.close()
+        self._raw.close()
+        self._socket = self._raw = None
+
+    def _read(self, marker, deadline):
+        # returns the result once both streams carry the marker, None at the deadline
+        marker = marker.encode('ascii')
+        end = re.compile(re.escape(marker) + br' (\d+)\n')
+        while True:
+            stdout, stderr = self._output[STDOUT], self._output[STDERR]
+            exit_match = end.search(stdout)
+            if exit_match is not None and marker + b'\n' in stderr:
+                self._output[STDOUT] = stdout[exit_match.end():]
+                stderr, _, self._output[STDERR] = stderr.partition(marker + b'\n')
+                stdout = re.sub(re.escape(marker) + br'-pid \d+\n', b'', stdout[:exit_match.start()])
+                return CommandResult(int(exit_match.group(1)), stdout, stderr)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([self._raw], [], [], remaining)
+            if not readable:
+                continue
+            data = self._raw.recv(65536)
+            if not data:
+                raise ExecSessionError('shell of the exec session in {} exited'.format(self.container.name))
+            self._frames += data
+            while len(self._frames) >= 8:
+                stream, size = struct.unpack('>BxxxL', self._frames[:8])
+                if len(self._frames) < 8 + size:
+                    break
+                if stream in self._output:
+                    self._output[stream] += self._frames[8:8 + size]
+                self._frames = self._frames[8 + size:]
+
+    def _kill(self, command, marker, timeout):
+        pid_line = re.compile(re.escape(marker.encode('ascii')) + br'-pid (\d+)\n')
+        pid = pid_line.search(self._output[STDOUT])
+        stdout, stderr = pid_line.sub(b'', self._output[STDOUT]), self._output[STDERR]
+        if pid is not None:
+            log.warning('command {!r} timed out after {} seconds, killing it'.format(command, timeout))
+            try:
+                self.container.exec_run(['kill', '-9', pid.group(1).decode('ascii')])
+                result = self._read(marker, time.time() + KILL_GRACE)
+            except (docker.errors.APIError, OSError, ExecSessionError):
+                result = None
+            if result is not None:
+                raise ExecTimeout(command, timeout, result.stdout, result.stderr)
+        self._close()
+        raise ExecTimeout(command, timeout, stdout, stderr)
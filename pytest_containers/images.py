@@ -0,0 +1,124 @@
+import contextlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from . import timing
+
+log = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _unlocked(name):
+    yield
+
+
+class ImageRegistry(object):
+    """Session cache of images indexed by id, repo:tag and digest.
+
+    Images are resolved once per session, later lookups are served from memory.
+    Missing images can be pulled concurrently ahead of the tests which need them.
+
+    Args:
+        client_factory (callable): returns the docker client used to pre-pull images.
+        parallelism (int): maximum number of concurrent pulls.
+        lock (callable): returns a context manager held while pre-pulling, see
+            :py:meth:`~pytest_containers.shared.SharedResources.lock`.
+    """
+
+    def __init__(self, client_factory, parallelism=4, lock=None):
+        self.parallelism = parallelism
+        self._client_factory = client_factory
+        self._pull_lock = lock or _unlocked
+        self._client = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._attrs = {}
+        self._index = {}
+        self._pulls = {}
+
+    def _add(self, attrs):
+        with self._lock:
+            self._attrs[attrs['Id']] = attrs
+            self._index[attrs['Id']] = attrs['Id']
+            for repo_tag in attrs.get('RepoTags') or []:
+                self._index[repo_tag] = attrs['Id']
+            for repo_digest in attrs.get('RepoDigests') or []:
+                self._index[repo_digest] = attrs['Id']
+                self._index[repo_digest.split('@', 1)[1]] = attrs['Id']
+
+    def lookup(self, name):
+        """Return attrs of the image known by id, repo:tag, repo@digest or digest, or None.
+        """
+        with self._lock:
+            image_id = self._index.get(name)
+            return self._attrs.get(image_id) if image_id is not None else None
+
+    def get(self, client, repo_tag, lock=None):
+        """Return image repo_tag bound to client, pulling it when it does not exist.
+
+        Args:
+            client: docker client the returned :py:class:`~docker.models.images.Image` is bound to.
+            repo_tag (str): image reference.
+            lock (callable): returns a context manager held while pulling, see
+                :py:meth:`~pytest_containers.shared.SharedResources.lock`.
+        """
+        with self._lock:
+            pull = self._pulls.get(repo_tag)
+        if pull is not None:
+            try:
+                pull.result()
+            except Exception as err:
+                log.warning('pre-pull of {} failed: {}'.format(repo_tag, err))
+        attrs = self.lookup(repo_tag)
+        if attrs is None:
+            attrs = self._fetch(client, repo_tag, lock or _unlocked).attrs
+        return client.images.prepare_model(attrs)
+
+    def _fetch(self, client, repo_tag, lock):
+        try:
+            with timing.span('image inspect'):
+                image = client.images.get(repo_tag)
+        except docker.errors.ImageNotFound:
+            with lock('image ' + repo_tag):
+                try:
+                    image = client.images.get(repo_tag)
+                except docker.errors.ImageNotFound:
+                    log.info('docker image pull {}'.format(repo_tag))
+                    with timing.span('image pull'):
+                        image = client.images.pull(repo_tag)
+        self._add(image.attrs)
+        return image
+
+    def prefetch(self, repo_tags):
+        """Resolve repo_tags in the background, pulling the missing images concurrently.
+        """
+        if self.parallelism <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.parallelism)
+            repo_tags = [x for x in sorted(set(repo_tags)) if x not in self._index and x not in self._pulls]
+            for repo_tag in repo_tags:
+                log.info('pre-pulling image {}'.format(repo_tag))
+                self._pulls[repo_tag] = self._executor.submit(self._prefetch, repo_tag)
+
+    def _prefetch(self, repo_tag):
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+        self._fetch(self._client, repo_tag, self._pull_lock)
+
+    def close(self):
+        """Cancel pulls which have not started and wait for the others.
+        """
+        with self._lock:
+            pulls = list(self._pulls.values())
+        for pull in pulls:
+            pull.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._client is not None:
+            self._client.close()
@@ -0,0 +1,259 @@
+import logging
+import math
+import os
+import re
+import time
+
+import urllib3
+
+try:
+    import kubernetes
+except ImportError:
+    kubernetes = None
+
+log = logging.getLogger(__name__)
+
+
+# container states from which a pod does not become ready on its own
+FATAL_REASONS = ['CrashLoopBackOff', 'ErrImagePull', 'ImagePullBackOff', 'InvalidImageName',
+                 'CreateContainerConfigError', 'CreateContainerError']
+
+# label selecting the pods of a deployment and the service in front of them
+APP_LABEL = 'app'
+
+
+class KubernetesNotReady(Exception):
+    """Raised when an object fails or does not become ready before the deadline.
+    """
+
+    def __init__(self, kind, name, reason):
+        super(KubernetesNotReady, self).__init__(reason)
+        self.kind = kind
+        self.name = name
+        self.reason = reason
+
+    def __str__(self):
+        return '{} {} not ready: {}'.format(self.kind, self.name, self.reason)
+
+
+def api_client():
+    """Return an API client configured from within the cluster or from the kube config.
+
+    Raises:
+        ImportError
+            If the kubernetes package is not installed.
+    """
+    if kubernetes is None:
+        raise ImportError('the kubernetes package is not installed')
+    try:
+        kubernetes.config.load_incluster_config()
+    except kubernetes.config.ConfigException:
+        # the kubernetes package reads KUBECONFIG once when it is imported
+        kubernetes.config.load_kube_config(config_file=os.getenv('KUBECONFIG'))
+    return kubernetes.client.ApiClient()
+
+
+def object_name(name):
+    """Return name as a DNS label usable as the name of any kubernetes object.
+    """
+    return re.sub(r'[^a-z0-9-]', '-', name.lower())[:63].strip('-')
+
+
+def _metadata(name, labels):
+    return {'name': name, 'labels': dict(labels)}
+
+
+def _container(name, image, environment, port):
+    container = {'name': name, 'image': image,
+                 'env': [{'name': key, 'value': str(value)} for key, value in sorted(environment.items())]}
+    if port is not None:
+        container['ports'] = [{'containerPort': port}]
+    return container
+
+
+def pod_manifest(name, image, labels, environment=None, port=None):
+    """Return the manifest of a pod running a single container of image.
+    """
+    return {'apiVersion': 'v1', 'kind': 'Pod', 'metadata': _metadata(name, labels),
+            'spec': {'containers': [_container(name, image, environment or {}, port)]}}
+
+
+def deployment_manifest(name, image, labels, replicas=1, environment=None, port=None):
+    """Return the manifest of a deployment whose pods carry labels and an ``app`` label of name.
+    """
+    pod_labels = dict(labels, **{APP_LABEL: name})
+    return {'apiVersion': 'apps/v1', 'kind': 'Deployment', 'metadata': _metadata(name, labels),
+            'spec': {'replicas': replicas, 'selector': {'matchLabels': {APP_LABEL: name}},
+                     'template': {'metadata': {'labels': pod_labels},
+                                  'spec': {'containers': [_container(name, image, environment or {}, port)]}}}}
+
+
+def service_manifest(name, app, labels, port):
+    """Return the manifest of a service forwarding port to the pods of deployment app.
+    """
+    return {'apiVersion': 'v1', 'kind': 'Service', 'metadata': _metadata(name, labels),
+            'spec': {'selector': {APP_LABEL: app}, 'ports': [{'port': port, 'targetPort': port}]}}
+
+
+def create_namespace(core, name, labels):
+    """Create namespace name carrying labels.
+    """
+    log.info('kubectl create namespace {}'.format(name))
+    return core.create_namespace({'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': _metadata(name, labels)})
+
+
+def delete_namespace(core, name):
+    """Delete namespace name and with it every object in it, without waiting for the deletion to finish.
+    """
+    log.info('kubectl delete namespace {} --wait=false'.format(name))
+    try:
+        core.delete_namespace(name, body={'apiVersion': 'v1', 'kind': 'DeleteOptions',
+                                          'propagationPolicy': 'Background'})
+    except kubernetes.client.rest.ApiException as err:
+        if err.status != 404:
+            raise
+
+
+def delete_object(kind, delete_function, namespace, name):
+    """Delete object name of kind and its dependents without waiting, its containers are killed at once.
+
+    Args:
+        kind (str): kind of the object, such as ``pod``.
+        delete_function (callable): the ``delete_namespaced_<kind>`` method of the API of kind.
+        namespace (str): namespace of the object.
+        name (str): name of the object.
+    """
+    log.info('kubectl delete {} {} --namespace {} --grace-period=0 --wait=false'.format(kind, name, namespace))
+    try:
+        delete_function(name, namespace, body={'apiVersion': 'v1', 'kind': 'DeleteOptions',
+                                               'propagationPolicy': 'Background', 'gracePeriodSeconds': 0})
+    except kubernetes.client.rest.ApiException as err:
+        if err.status != 404:
+            raise
+
+
+def prune_namespaces(core, label, until):
+    """Delete the namespaces carrying label created before the unix time until, return their names.
+    """
+    pruned = []
+    for namespace in core.list_namespace(label_selector=label).items:
+        created = namespace.metadata.creation_timestamp
+        if created is None or created.timestamp() >= until or namespace.status.phase == 'Terminating':
+            continue
+        delete_namespace(core, namespace.metadata.name)
+        pruned.append(namespace.metadata.name)
+    return pruned
+
+
+def _pod_pending(pod):
+    name = pod.metadata.name
+    status = pod.status
+    if status is None:
+        return 'no status'
+    if status.phase in ['Succeeded', 'Failed']:
+        raise KubernetesNotReady('pod', name, 'pod {}'.format(status.phase.lower()))
+    for container in status.container_statuses or []:
+        waiting = container.state.waiting if container.state is not None else None
+        if waiting is not None and waiting.reason in FATAL_REASONS:
+            reason = 'container {} {}: {}'.format(container.name, waiting.reason, waiting.message or '')
+            raise KubernetesNotReady('pod', name, reason)
+    for condition in status.conditions or []:
+        if condition.type == 'Ready' and condition.status == 'True':
+            return None
+    return 'phase {}'.format(status.phase)
+
+
+def _deployment_pending(deployment):
+    status = deployment.status
+    replicas = deployment.spec.replicas
+    for condition in (status.conditions if status is not None else None) or []:
+        if condition.type == 'Progressing' and condition.reason == 'ProgressDeadlineExceeded':
+            raise KubernetesNotReady('deployment', deployment.metadata.name, condition.message)
+    if status is None or (status.observed_generation or 0) < (deployment.metadata.generation or 0):
+        return 'not observed yet'
+    if (status.updated_replicas or 0) < replicas or (status.available_replicas or 0) < replicas:
+        return '{} of {} replicas available'.format(status.available_replicas or 0, replicas)
+    return None
+
+
+def _endpoints_pending(endpoints):
+    if any(subset.addresses for subset in endpoints.subsets or []):
+        return None
+    return 'no ready endpoints'
+
+
+def wait_for(kind, list_function, namespace, name, pending, timeout=60):
+    """Block until object name of kind is ready and return it and the number of seconds waited.
+
+    The object is watched rather than polled: the first event of the watch carries its current state,
+    later events arrive as soon as the API server records a change. pending takes the object and returns
+    None once it is ready, why it is not otherwise, it raises when the object can not become ready.
+
+    Raises:
+        :py:class:`KubernetesNotReady`
+            If the object fails, is deleted or is not ready before timeout.
+    """
+    started = time.time()
+    deadline = started + timeout
+    resource_version = None
+    reason = 'not created'
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise KubernetesNotReady(kind, name, 'not ready after {} seconds ({})'.format(timeout, reason))
+        watch = kubernetes.watch.Watch()
+        kwargs = {'field_selector': 'metadata.name={}'.format(name),
+                  'timeout_seconds': max(int(math.ceil(remaining)), 1),
+                  # the API server counts whole seconds, the client gives up reading at the deadline
+                  '_request_timeout': remaining}
+        if resource_version is not None:
+            kwargs['resource_version'] = resource_version
+        try:
+            for event in watch.stream(list_function, namespace, **kwargs):
+                if event['type'] == 'ERROR':
+                    # the resource version expired, the next watch starts from the current state
+                    resource_version = None
+                    break
+                if event['type'] == 'DELETED':
+                    raise KubernetesNotReady(kind, name, 'deleted')
+                if event['type'] not in ['ADDED', 'MODIFIED']:
+                    continue
+                current = event['object']
+                resource_version = current.metadata.resource_version
+                reason = pending(current)
+                if reason is None:
+                    waited = time.time() - started
+                    log.info('{} {} ready after {:.2f} seconds'.format(kind, name, waited))
+                    return current, waited
+        except kubernetes.client.rest.ApiException as err:
+            if err.status != 410:
+                raise
+            resource_version = None
+        except urllib3.exceptions.ReadTimeoutError:
+            pass
+        finally:
+            watch.stop()
+
+
+def wait_for_pod(core, namespace, name, timeout=60):
+    """Block until pod name reports ready, see :py:func:`wait_for`.
+    """
+    return wait_for('pod', core.list_namespaced_pod, namespace, name, _pod_pending, timeout)
+
+
+def wait_for_deployment(apps, namespace, name, timeout=60):
+    """Block until every replica of deployment name is updated and available, see :py:func:`wait_for`.
+    """
+    return wait_for('deployment', apps.list_namespaced_deployment, namespace, name, _deployment_pending, timeout)
+
+
+def wait_for_endpoints(core, namespace, name, timeout=60):
+    """Block until service name has a ready endpoint, see :py:func:`wait_for`.
+    """
+    return wait_for('service', core.list_namespaced_endpoints, namespace, name, _endpoints_pending, timeout)
+
+
+def follow_logs(core, namespace, name):
+    """Return iterator of the log chunks of pod name as they are written.
+    """
+    return core.read_namespaced_pod_log(name, namespace, follow=True, _preload_content=False).stream()
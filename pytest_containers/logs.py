@@ -0,0 +1,176 @@
+import collections
+import logging
+import os
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LogBuffer(object):
+    """Ring buffer keeping the last limit bytes of a log, optionally spilling the whole log to a file.
+
+    Args:
+        limit (int): bytes kept in memory.
+        path (str): file the whole log is appended to, or None.
+    """
+
+    def __init__(self, limit, path=None):
+        self.limit = limit
+        self.path = path
+        self.dropped = 0
+        self._cut = False
+        self._chunks = collections.deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab') if path is not None else None
+
+    def write(self, data):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+            self._chunks.append(data)
+            self._size += len(data)
+            while self._size > self.limit:
+                excess = self._size - self.limit
+                first = self._chunks[0]
+                if len(first) <= excess:
+                    self._chunks.popleft()
+                    removed = first
+                else:
+                    self._chunks[0] = first[excess:]
+                    removed = first[:excess]
+                self._size -= len(removed)
+                self.dropped += len(removed)
+                self._cut = not removed.endswith(b'\n')
+
+    def tail(self, lines=None):
+        """Return the buffered end of the log as text, limited to its last lines when given.
+        """
+        with self._lock:
+            data = b''.join(self._chunks)
+            cut = self._cut
+        text = data.decode('utf-8', 'replace')
+        if cut and '\n' in text:
+            # the first line was cut by the ring buffer
+            text = text.split('\n', 1)[1]
+        if lines is not None:
+            text = '\n'.join(text.rstrip('\n').split('\n')[-lines:]) + '\n' if text else text
+        return text
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LogCapture(object):
+    """Stream a log into a :py:class:`LogBuffer` on a background thread until the stream ends.
+
+    Args:
+        name (str): name of the container or service.
+        stream (callable): returns an iterator of log chunks, which ends when the container is removed.
+        buffer (:py:class:`LogBuffer`): buffer the chunks are written to.
+    """
+
+    def __init__(self, name, stream, buffer):
+        self.name = name
+        self.buffer = buffer
+        self._stream = stream
+        self._iterator = None
+        self._received = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='containers-log-' + name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def finished(self):
+        return not self._thread.is_alive()
+
+    def _run(self):
+        try:
+            self._iterator = self._stream()
+            for chunk in self._iterator:
+                self.buffer.write(chunk)
+                self._received.set()
+        except Exception as err:
+            log.debug('log stream of {} ended: {}'.format(self.name, err))
+        finally:
+            self.buffer.close()
+            self._received.set()
+
+    def wait(self, timeout):
+        """Wait until the first chunk arrived or the stream ended, return whether it did within timeout.
+        """
+        return self._received.wait(timeout)
+
+    def stop(self, timeout=1.0):
+        iterator = self._iterator
+        if hasattr(iterator, 'close'):
+            # cancellable streams close their response
+            try:
+                iterator.close()
+            except Exception as err:
+                log.debug('log stream of {} could not be closed: {}'.format(self.name, err))
+        self._thread.join(timeout)
+
+
+class LogCollector(object):
+    """Logs of the managed containers and services, each kept in a bounded ring buffer.
+
+    Captures are kept until the test after their stream ended has started, so that the logs of
+    containers removed during a failing teardown can still be reported.
+
+    Args:
+        limit (int): bytes kept in memory for each log.
+        directory (str): directory the whole logs are spilled to, or None.
+    """
+
+    def __init__(self, limit, directory=None):
+        self.limit = limit
+        self.directory = directory
+        self._captures = []
+        self._lock = threading.Lock()
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def capture(self, name, stream):
+        """Start capturing the log stream of name and return the :py:class:`LogCapture`.
+        """
+        path = None
+        if self.directory is not None:
+            path = os.path.join(self.directory, re.sub(r'[^\w.-]', '_', name) + '.log')
+        capture = LogCapture(name, stream, LogBuffer(self.limit, path))
+        with self._lock:
+            self._captures.append(capture)
+        return capture
+
+    def discard_finished(self):
+        with self._lock:
+            self._captures = [capture for capture in self._captures if not capture.finished]
+
+    def sections(self, lines=None, timeout=0.5):
+        """Return report sections of the log tails as (title, text) tuples.
+
+        Captures that have not received anything yet are given up to timeout seconds in total, as a
+        test can fail before the stream of a container it just started caught up.
+        """
+        with self._lock:
+            captures = list(self._captures)
+        deadline = time.time() + timeout
+        sections = []
+        for capture in captures:
+            capture.wait(max(deadline - time.time(), 0))
+            text = capture.buffer.tail(lines)
+            if capture.buffer.path is not None:
+                text += '(whole log in {})\n'.format(capture.buffer.path)
+            sections.append(('container log {}'.format(capture.name), text))
+        return sections
+
+    def close(self):
+        with self._lock:
+            captures, self._captures = self._captures, []
+        for capture in captures:
+            capture.stop()
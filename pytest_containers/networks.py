@@ -0,0 +1,281 @@
+import ipaddress
+import logging
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+log = logging.getLogger(__name__)
+
+
+class SubnetsExhausted(Exception):
+    """Raised when every subnet of the managed range is in use."""
+
+
+def local_daemon(client):
+    """Return true when the docker daemon of client is reached over a unix socket on Linux.
+
+    Such a daemon usually runs on this host, whose routes lead to the addresses of its containers and
+    whose paths it can mount. Neither holds when the tests run in a container with the docker socket
+    mounted, so callers must cope with the assumption being wrong.
+    """
+    return client.api.base_url.startswith('http+docker://') and sys.platform.startswith('linux')
+
+
+def worker_range(network_range, worker='master', workers=1):
+    """Return the slice of network_range used by a pytest-xdist worker, so workers never hand out the same subnet.
+
+    Args:
+        network_range (str): address range in CIDR notation.
+        worker (str): id of the worker, ``gw<N>`` or 'master'.
+        workers (int): number of workers of the test run.
+    """
+    network = ipaddress.ip_network(network_range)
+    if worker == 'master' or workers <= 1:
+        return network
+    slices = list(network.subnets(prefixlen_diff=int(math.ceil(math.log(workers, 2)))))
+    return slices[int(worker.lstrip('gw')) % len(slices)]
+
+
+def overlaps(err):
+    """Return true when a network create error was caused by a subnet the daemon already uses.
+    """
+    return 'overlaps' in str(err).lower()
+
+
+class SubnetAllocator(object):
+    """Hand out subnets of a managed address range to the networks made by the plugin.
+
+    Subnets used by networks which already exist on the docker daemon are skipped, released
+    subnets are handed out again before new ones.
+
+    Args:
+        network_range (str): address range in CIDR notation.
+        prefixlen (int): prefix length of the subnets handed out.
+    """
+
+    def __init__(self, network_range, prefixlen=24):
+        self.range = ipaddress.ip_network(network_range)
+        if prefixlen < self.range.prefixlen:
+            raise ValueError('subnets /{} do not fit in {}'.format(prefixlen, self.range))
+        self.prefixlen = prefixlen
+        self._lock = threading.Lock()
+        self._subnets = self.range.subnets(new_prefix=prefixlen)
+        self._free = []
+        self._used = set()
+        self._foreign = None
+
+    def allocate(self, client):
+        """Return a free subnet as a string.
+
+        Raises:
+            SubnetsExhausted: when every subnet of the range is in use.
+        """
+        with self._lock:
+            if self._foreign is None:
+                # subnets of the existing networks, including the ones of other test runs
+                self._foreign = [ipaddress.ip_network(config['Subnet'], strict=False)
+                                 for network in client.api.networks()
+                                 for config in (network.get('IPAM') or {}).get('Config') or []
+                                 if config.get('Subnet') and ':' not in config['Subnet']]
+            while True:
+                if self._free:
+                    subnet = self._free.pop(0)
+                else:
+                    subnet = next(self._subnets, None)
+                    if subnet is None:
+                        raise SubnetsExhausted('all /{} subnets of {} are in use'.format(self.prefixlen, self.range))
+                if not any(subnet.overlaps(foreign) for foreign in self._foreign):
+                    self._used.add(subnet)
+                    return str(subnet)
+
+    def release(self, subnet):
+        """Return subnet to the range, subnets the allocator did not hand out are ignored.
+        """
+        subnet = ipaddress.ip_network(subnet, strict=False)
+        with self._lock:
+            if subnet in self._used:
+                self._used.remove(subnet)
+                self._free.append(subnet)
+                self._free.sort()
+
+    def exclude(self, subnet):
+        """Never hand out subnet again, as something outside of the plugin uses it.
+        """
+        with self._lock:
+            self._used.discard(ipaddress.ip_network(subnet, strict=False))
+            self._foreign.append(ipaddress.ip_network(subnet, strict=False))
+
+
+def subnet_of(network):
+    """Return the first IPv4 subnet of network, or None.
+    """
+    for config in (network.attrs.get('IPAM') or {}).get('Config') or []:
+        if config.get('Subnet') and ':' not in config['Subnet']:
+            return config['Subnet']
+    return None
+
+
+def detach(network):
+    """Disconnect every container still attached to network.
+    """
+    network.reload()
+    for container_id in network.attrs.get('Containers') or {}:
+        log.info('docker network disconnect --force {} {}'.format(network.name, container_id[:12]))
+        try:
+            network.disconnect(container_id, force=True)
+        except docker.errors.NotFound:
+            pass
+
+
+class NetworkPool(object):
+    """Pool of networks leased to network fixtures and reused instead of removed, keyed by driver.
+
+    A lease which finds no idle network creates one, and the pool creates spares in the background
+    for as many leases as were held at the same time, so that it grows with demand up to ``size``
+    networks per driver. Returned networks are detached from leftover containers and kept idle.
+    Networks beyond ``size`` are removed when returned and idle networks beyond the first are
+    removed after ``idle_timeout``, so that the pool shrinks again when demand drops.
+
+    Args:
+        size (int): maximum number of networks kept per driver, leased ones included.
+        create (callable): ``create(driver)`` returns a new ready network.
+        remove (callable): ``remove(network)`` removes a network.
+        idle_timeout (float): seconds after which idle networks beyond the first are removed.
+        max_workers (int): number of threads used to create and remove networks.
+    """
+
+    def __init__(self, size, create, remove, idle_timeout=60, max_workers=4):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._create = create
+        self._remove = remove
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._idle = {}
+        self._pending = {}
+        self._leased = {}
+        self._peak = {}
+        self._closed = False
+
+    def acquire(self, driver):
+        """Return a ready network of driver.
+        """
+        with self._lock:
+            self._expire(driver)
+            idle = self._idle.setdefault(driver, [])
+            pending = self._pending.setdefault(driver, [])
+            network = idle.pop(0)[0] if idle else None
+            future = pending.pop(0) if network is None and pending else None
+        if future is not None:
+            try:
+                network = future.result()
+            except Exception as err:
+                log.warning('pooled {} network failed to create: {}'.format(driver, err))
+        if network is None:
+            log.info('no idle {} network, creating one'.format(driver))
+            network = self._create(driver)
+        else:
+            log.info('reusing network {}'.format(network.name))
+        with self._lock:
+            self._leased[network.id] = driver
+            self._peak[driver] = max(self._peak.get(driver, 0), self._leases(driver))
+        self._top_up(driver)
+        return network
+
+    def owns(self, network):
+        """Return true when network was handed out by the pool.
+        """
+        with self._lock:
+            return network.id in self._leased
+
+    def release(self, network):
+        """Return network to the pool.
+        """
+        with self._lock:
+            driver = self._leased.pop(network.id)
+        if not self._closed:
+            try:
+                detach(network)
+            except docker.errors.APIError as err:
+                log.warning('network {} could not be detached, discarding: {}'.format(network.name, err))
+            else:
+                with self._lock:
+                    if self._owned(driver) < self.size:
+                        self._idle[driver].append((network, time.time()))
+                        return
+                log.info('network pool of {} networks is full'.format(driver))
+        self._executor.submit(self._discard, network)
+
+    def close(self):
+        """Stop topping up the pool and remove every network it holds.
+        """
+        with self._lock:
+            self._closed = True
+            pending = [future for futures in self._pending.values() for future in futures]
+            idle = [network for networks in self._idle.values() for network, _ in networks]
+            self._pending.clear()
+            self._idle.clear()
+        for future in pending:
+            if not future.cancel():
+                try:
+                    idle.append(future.result())
+                except Exception:
+                    pass
+        for network in idle:
+            self._executor.submit(self._discard, network)
+        self._executor.shutdown(wait=True)
+
+    def _top_up(self, driver):
+        with self._lock:
+            if self._closed:
+                return
+            leased = self._leases(driver)
+            missing = min(self._peak.get(driver, 1), self.size - leased) - len(self._idle[driver]) - \
+                len(self._pending[driver])
+            for _ in range(missing):
+                future = self._executor.submit(self._create, driver)
+                self._pending[driver].append(future)
+                future.add_done_callback(lambda future, driver=driver: self._created(driver, future))
+
+    def _created(self, driver, future):
+        if future.cancelled():
+            return
+        with self._lock:
+            if future not in self._pending.get(driver, []):
+                return
+            self._pending[driver].remove(future)
+            if future.exception() is None:
+                self._idle[driver].append((future.result(), time.time()))
+                return
+        log.warning('pooled {} network failed to create: {}'.format(driver, future.exception()))
+
+    def _expire(self, driver):
+        # demand dropped, forget the peak and let the pool shrink back to a single idle network
+        now = time.time()
+        idle = self._idle.get(driver, [])
+        expired = [network for network, since in idle[1:] if now - since > self.idle_timeout]
+        if not expired:
+            return
+        self._idle[driver] = [x for x in idle if x[0] not in expired]
+        self._peak[driver] = max(self._leases(driver), 1)
+        for network in expired:
+            log.info('removing network {} idle for more than {} seconds'.format(network.name, self.idle_timeout))
+            self._executor.submit(self._discard, network)
+
+    def _leases(self, driver):
+        return sum(1 for x in self._leased.values() if x == driver)
+
+    def _owned(self, driver):
+        return self._leases(driver) + len(self._idle[driver]) + len(self._pending[driver])
+
+    def _discard(self, network):
+        try:
+            self._remove(network)
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as err:
+            log.warning('unable to remove network {}: {}'.format(network.name, err))
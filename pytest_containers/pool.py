@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+log = logging.getLogger(__name__)
+
+
+def config_key(config):
+    """Return stable hash of a container configuration dict.
+    """
+    data = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ContainerPool(object):
+    """Pool of pre-started containers keyed by a hash of their configuration.
+
+    Once a configuration has been requested the pool keeps ``size`` started containers
+    ready for it, replacing them in the background as they are handed out.
+
+    Args:
+        size (int): number of warm containers kept per configuration.
+        max_workers (int): number of threads used to start and remove containers.
+    """
+
+    def __init__(self, size, max_workers=4):
+        self.size = size
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._factories = {}
+        self._idle = {}
+        self._pending = {}
+        self._leased = {}
+        self._closed = False
+
+    def acquire(self, key, factory):
+        """Return a ready container for key.
+
+        A warm container is handed out when one is available, otherwise the one
+        being started in the background is awaited, otherwise factory is called.
+        Factory is also used to top up the pool and must return a ready container.
+        """
+        with self._lock:
+            self._factories.setdefault(key, factory)
+            idle = self._idle.setdefault(key, [])
+            pending = self._pending.setdefault(key, [])
+            container = idle.pop(0) if idle else None
+            future = pending.pop(0) if container is None and pending else None
+        if future is not None:
+            try:
+                container = future.result()
+            except Exception as err:
+                log.warning('warm container for {} failed to start: {}'.format(key[:12], err))
+        if container is None:
+            log.info('no warm container for {}, starting one'.format(key[:12]))
+            container = factory()
+        else:
+            log.info('reusing warm container {}'.format(container.short_id))
+        with self._lock:
+            self._leased[container.id] = (key, container)
+        self._top_up(key)
+        return container
+
+    def owns(self, container):
+        """Return true when container was handed out by the pool.
+        """
+        with self._lock:
+            return container.id in self._leased
+
+    def release(self, container, reset=None):
+        """Return container to the pool.
+
+        The container is recycled when reset is given and succeeds, otherwise it is
+        removed and replaced in the background.
+        """
+        with self._lock:
+            key, _ = self._leased.pop(container.id)
+        if self._closed:
+            _remove(container)
+            return
+        if reset is not None:
+            try:
+                reset(container)
+            except Exception as err:
+                log.warning('reset of container {} failed, discarding: {}'.format(container.short_id, err))
+            else:
+                log.info('recycled container {}'.format(container.short_id))
+                with self._lock:
+                    self._idle[key].append(container)
+                return
+        log.info('discarding container {}'.format(container.short_id))
+        self._executor.submit(_remove, container)
+        self._top_up(key)
+
+    def close(self):
+        """Stop topping up the pool and remove every container it holds, including those never released.
+        """
+        with self._lock:
+            self._closed = True
+            pending = [future for futures in self._pending.values() for future in futures]
+            idle = [container for containers in self._idle.values() for container in containers]
+            # containers leased by direct container_factory calls have no teardown of their own
+            idle.extend(container for _, container in self._leased.values())
+            self._pending.clear()
+            self._idle.clear()
+            self._leased.clear()
+        for future in pending:
+            if not future.cancel():
+                try:
+                    idle.append(future.result())
+                except Exception:
+                    pass
+        for container in idle:
+            self._executor.submit(_remove, container)
+        self._executor.shutdown(wait=True)
+
+    def _top_up(self, key):
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size - len(self._idle[key]) - len(self._pending[key])
+            for _ in range(missing):
+                future = self._executor.submit(self._factories[key])
+                self._pending[key].append(future)
+                future.add_done_callback(lambda future, key=key: self._started(key, future))
+
+    def _started(self, key, future):
+        if future.cancelled():
+            return
+        with self._lock:
+            if future not in self._pending.get(key, []):
+                return
+            self._pending[key].remove(future)
+            if future.exception() is None:
+                self._idle[key].append(future.result())
+                return
+        log.warning('warm container for {} failed to start: {}'.format(key[:12], future.exception()))
+
+
+def _remove(container):
+    try:
+        log.info('docker container rm --volumes --force {}'.format(container.name))
+        container.remove(v=True, force=True)
+    except docker.errors.NotFound:
+        pass
+    except docker.errors.APIError as err:
+        log.warning('unable to remove container {}: {}'.format(container.name, err))
@@ -0,0 +1,124 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import timing
+
+log = logging.getLogger(__name__)
+
+
+class Provisioner(object):
+    """Provision fixture resources in the background ahead of the tests which request them.
+
+    The plan is built from the collected items, every unique fixture instance they need
+    is recorded in the order it is first needed. As each test starts the next
+    ``lookahead`` fixture instances are provisioned on a thread pool and handed off
+    when the fixture asks for them.
+
+    Args:
+        lookahead (int): number of fixture instances provisioned ahead of the running test.
+        client_factory (callable): returns the docker client used by the background threads.
+        max_workers (int): number of threads used to provision resources.
+    """
+
+    def __init__(self, lookahead, client_factory, max_workers=4):
+        self.lookahead = lookahead
+        self._client_factory = client_factory
+        self._client = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._providers = {}
+        self._plan = []
+        self._positions = {}
+        self._submitted = 0
+        self._futures = {}
+        self._closed = False
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            return self._client
+
+    def register(self, fixture, create, destroy):
+        """Register how to create and destroy the resource of fixture.
+
+        ``create(client, spec)`` returns the resource or None when it can not be provisioned
+        ahead of time, ``destroy(client, resource)`` removes a resource which was never claimed.
+        """
+        self._providers[fixture] = (create, destroy)
+
+    def plan(self, items, needs):
+        """Record the fixture instances needed by items in execution order.
+
+        ``needs(item)`` returns a list of ``(fixture, key, spec)`` tuples where key identifies
+        the fixture instance and spec is passed to the create function.
+        """
+        seen = set()
+        self._plan = []
+        self._positions = {}
+        for item in items:
+            for fixture, key, spec in needs(item):
+                if fixture in self._providers and (fixture, key) not in seen:
+                    seen.add((fixture, key))
+                    self._plan.append((fixture, key, spec))
+            self._positions[item] = len(self._plan)
+        log.info('lookahead provisioning plan has {} fixture instances'.format(len(self._plan)))
+
+    def advance(self, item):
+        """Start provisioning the fixture instances needed after item.
+        """
+        if self._closed or item not in self._positions:
+            return
+        start = max(self._submitted, self._positions[item])
+        for fixture, key, spec in self._plan[start:self._positions[item] + self.lookahead]:
+            log.info('provisioning {} {} ahead of time'.format(fixture, key))
+            self._futures[(fixture, key)] = self._executor.submit(self._create, fixture, spec)
+        self._submitted = max(self._submitted, self._positions[item] + self.lookahead)
+
+    def _create(self, fixture, spec):
+        create, _ = self._providers[fixture]
+        with timing.fixture(fixture):
+            return create(self.client, spec)
+
+    def take(self, fixture, key):
+        """Return the provisioned resource for the fixture instance, or None.
+
+        Waits for the resource when it is still being provisioned. The caller owns the
+        returned resource.
+        """
+        future = self._futures.pop((fixture, key), None)
+        if future is None:
+            return None
+        try:
+            resource = future.result()
+        except Exception as err:
+            log.warning('provisioning {} {} failed: {}'.format(fixture, key, err))
+            return None
+        if resource is not None:
+            log.info('using {} {} provisioned ahead of time'.format(fixture, key))
+        return resource
+
+    def close(self):
+        """Cancel pending provisioning and destroy resources which were never claimed.
+        """
+        self._closed = True
+        futures, self._futures = self._futures, {}
+        for (fixture, key), future in futures.items():
+            if future.cancel():
+                continue
+            try:
+                resource = future.result()
+            except Exception:
+                continue
+            if resource is not None:
+                log.info('destroying unclaimed {} {}'.format(fixture, key))
+                _, destroy = self._providers[fixture]
+                try:
+                    destroy(self.client, resource)
+                except Exception as err:
+                    log.warning('unable to destroy unclaimed {} {}: {}'.format(fixture, key, err))
+        self._executor.shutdown(wait=True)
+        if self._client is not None:
+            self._client.close()
@@ -0,0 +1,210 @@
+import logging
+import time
+from collections import namedtuple
+
+import docker
+
+log = logging.getLogger(__name__)
+
+
+Backoff = namedtuple('Backoff', 'initial factor maximum')
+
+DEFAULT_BACKOFF = Backoff(initial=0.05, factor=2.0, maximum=1.0)
+
+# container events which may change the outcome of a readiness check
+CONTAINER_EVENTS = ['start', 'die', 'oom', 'health_status']
+
+# network events which may change the outcome of a readiness check
+NETWORK_EVENTS = ['create', 'update']
+
+
+class ContainerNotReady(Exception):
+    """Raised when a container dies or does not become ready before the deadline.
+    """
+
+    def __init__(self, container, reason, exit_code=None, logs=''):
+        super(ContainerNotReady, self).__init__(reason)
+        self.container = container
+        self.reason = reason
+        self.exit_code = exit_code
+        self.logs = logs
+
+    def __str__(self):
+        message = 'container {} not ready: {}'.format(self.container.name, self.reason)
+        if self.exit_code is not None:
+            message += ' (exit code {})'.format(self.exit_code)
+        if self.logs:
+            message += '\n--- last log lines ---\n{}'.format(self.logs)
+        return message
+
+
+class NetworkNotReady(Exception):
+    """Raised when a network can not be confirmed before the deadline.
+    """
+
+    def __init__(self, network, reason):
+        super(NetworkNotReady, self).__init__(reason)
+        self.network = network
+        self.reason = reason
+
+    def __str__(self):
+        return 'network {} not ready: {}'.format(self.network.name, self.reason)
+
+
+class ReadinessReport(object):
+    """Collect the time spent waiting for resources to become ready.
+    """
+
+    def __init__(self):
+        self.waits = {}
+
+    def record(self, kind, seconds):
+        count, total = self.waits.get(kind, (0, 0.0))
+        self.waits[kind] = (count + 1, total + seconds)
+
+    def summary(self):
+        """Return list of report lines, one per kind of resource.
+        """
+        lines = []
+        for kind, (count, total) in sorted(self.waits.items()):
+            lines.append('{}: {} waits, {:.2f}s total, {:.2f}s average'.format(kind, count, total, total / count))
+        return lines
+
+
+def parse_backoff(value):
+    """Parse backoff given as ``initial,factor,maximum`` seconds.
+    """
+    try:
+        initial, factor, maximum = (float(item) for item in value.split(','))
+    except ValueError:
+        raise ValueError('backoff must be "initial,factor,maximum", got {!r}'.format(value))
+    return Backoff(initial=initial, factor=factor, maximum=maximum)
+
+
+def delays(backoff=DEFAULT_BACKOFF):
+    """Yield the sequence of delays described by backoff.
+    """
+    delay = backoff.initial
+    while True:
+        yield delay
+        delay = min(delay * backoff.factor, backoff.maximum)
+
+
+def wait_for_event(client, filters, since, timeout):
+    """Block until an event matching filters occurs or timeout expires.
+
+    Events which happened after ``since`` are replayed by the daemon so transitions
+    occurring between the last inspect and the subscription are not lost.
+    Returns the event or None.
+    """
+    if timeout <= 0:
+        return None
+    deadline = time.time() + timeout
+    try:
+        stream = client.events(since=since, until=deadline, filters=filters, decode=True)
+    except docker.errors.APIError as err:
+        log.debug('unable to watch events {}: {}'.format(filters, err))
+        time.sleep(timeout)
+        return None
+    try:
+        for event in stream:
+            return event
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+    return None
+
+
+def _log_tail(container, lines):
+    try:
+        return container.logs(tail=lines).decode('utf-8', 'replace').rstrip()
+    except docker.errors.APIError:
+        return ''
+
+
+def _probe(container, probes):
+    for probe in probes:
+        try:
+            if not probe(container):
+                return probe
+        except Exception as err:
+            log.debug('probe {} failed on {}: {}'.format(probe, container.name, err))
+            return probe
+    return None
+
+
+def wait_for_container(container, timeout=60, backoff=DEFAULT_BACKOFF, probes=None, log_tail=20):
+    """Block until container is ready and return the number of seconds waited.
+
+    A container is ready when it is running, its healthcheck (if any) reports healthy
+    and every probe returns true. Probes are callables accepting the container.
+    Between checks the container event stream is watched so health transitions and exits
+    are acted upon immediately, the backoff only bounds the time between checks.
+
+    Raises:
+        :py:class:`ContainerNotReady`
+            If the container exits, becomes unhealthy or is not ready before timeout.
+    """
+    probes = probes or []
+    started = time.time()
+    deadline = started + timeout
+    filters = {'container': container.id, 'event': CONTAINER_EVENTS}
+    for delay in delays(backoff):
+        checked_at = time.time()
+        container.reload()
+        state = container.attrs['State']
+        if state['Status'] in ['exited', 'dead']:
+            raise ContainerNotReady(container, 'container exited', exit_code=state.get('ExitCode'),
+                                    logs=_log_tail(container, log_tail))
+        health = (state.get('Health') or {}).get('Status')
+        if health == 'unhealthy':
+            raise ContainerNotReady(container, 'healthcheck reported unhealthy',
+                                    logs=_log_tail(container, log_tail))
+        if state['Status'] == 'running' and health in [None, 'healthy']:
+            failed_probe = _probe(container, probes)
+            if failed_probe is None:
+                waited = time.time() - started
+                log.info('container {} ready after {:.2f} seconds'.format(container.short_id, waited))
+                return waited
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise ContainerNotReady(container, 'not ready after {} seconds (status={}, health={})'.format(
+                timeout, state['Status'], health), logs=_log_tail(container, log_tail))
+        wait_for_event(container.client, filters, since=checked_at, timeout=min(delay, remaining))
+
+
+def _network_ready(network):
+    try:
+        network.reload()
+    except docker.errors.NotFound:
+        return False
+    if network.attrs.get('Driver') in ['bridge', 'overlay']:
+        # address allocation is the last step of network creation
+        return bool((network.attrs.get('IPAM') or {}).get('Config'))
+    return True
+
+
+def wait_for_network(network, timeout=30, backoff=DEFAULT_BACKOFF):
+    """Block until network is confirmed by inspection and return the number of seconds waited.
+
+    Network events are watched between inspections so an overlay network created on a
+    swarm manager is confirmed as soon as the manager reports it.
+
+    Raises:
+        :py:class:`NetworkNotReady`
+            If the network is not confirmed before timeout.
+    """
+    started = time.time()
+    deadline = started + timeout
+    filters = {'type': 'network', 'network': network.id, 'event': NETWORK_EVENTS}
+    for delay in delays(backoff):
+        checked_at = time.time()
+        if _network_ready(network):
+            waited = time.time() - started
+            log.info('network {} ready after {:.2f} seconds'.format(network.short_id, waited))
+            return waited
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise NetworkNotReady(network, 'not confirmed after {} seconds'.format(timeout))
+        wait_for_event(network.client, filters, since=checked_at, timeout=min(delay, remaining))
@@ -0,0 +1,206 @@
+import logging
+from collections import namedtuple
+
+import pytest
+
+log = logging.getLogger(__name__)
+
+
+# estimated seconds to setup a fixture instance, keyed by "fixture" or "fixture[param]"
+DEFAULT_COSTS = {
+    'swarm': 3.0,
+    # images are served from the session image registry after the first module
+    'image': 0.1,
+    'container': 1.0,
+    'client_container': 1.0,
+    'data_container': 1.0,
+    'service': 5.0,
+    'network[bridge]': 0.5,
+    'network[overlay]': 1.0,
+    'volumes[named]': 0.2,
+    'volumes[container]': 1.0,
+}
+
+DEFAULT_COST = 0.01
+
+# estimated saving below which the default order is kept
+MIN_SAVING = 0.5
+
+Unit = namedtuple('Unit', 'fixture scope key param')
+
+Schedule = namedtuple('Schedule', 'applied setups_before setups_after cost_before cost_after')
+
+
+class CostModel(object):
+    """Estimated setup cost of fixture instances, seeded from measured timings.
+
+    Args:
+        measured (dict): seconds keyed by "fixture" or "fixture[param]", usually from a previous run.
+    """
+
+    def __init__(self, measured=None):
+        self.measured = dict(measured or {})
+
+    def cost(self, fixture, param=None):
+        keys = ['{}[{}]'.format(fixture, param), fixture] if param is not None else [fixture]
+        for costs in [self.measured, DEFAULT_COSTS]:
+            for key in keys:
+                if key in costs:
+                    return costs[key]
+        return DEFAULT_COST
+
+    def observe(self, fixture, param, seconds):
+        """Fold a measured setup duration into the model.
+        """
+        key = '{}[{}]'.format(fixture, param) if param is not None else fixture
+        previous = self.measured.get(key)
+        # exponential moving average so a single slow setup does not dominate
+        self.measured[key] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+
+def _scope_key(item, scope):
+    if scope == 'module':
+        return item.getparent(pytest.Module).nodeid
+    if scope == 'class':
+        cls = item.getparent(pytest.Class)
+        # class scoped fixtures of functions outside of a class are cached on the function itself
+        return cls.nodeid if cls is not None else None
+    return ''
+
+
+def setup_units(item):
+    """Return the higher scoped fixture instances item needs.
+
+    The key of a unit is None when the instance can not be shared with any other item.
+    """
+    fixtureinfo = getattr(item, '_fixtureinfo', None)
+    if fixtureinfo is None:
+        return ()
+    callspec = getattr(item, 'callspec', None)
+    params = callspec.params if callspec is not None else {}
+    units = []
+    for name in item.fixturenames:
+        fixturedefs = fixtureinfo.name2fixturedefs.get(name)
+        if not fixturedefs:
+            continue
+        scope = str(fixturedefs[-1].scope)
+        if scope not in ['session', 'package', 'module', 'class']:
+            continue
+        param = params.get(name)
+        units.append(Unit(name, scope, _scope_key(item, scope), None if param is None else str(param)))
+    return tuple(units)
+
+
+def _signature(item):
+    return (_scope_key(item, 'module'), _scope_key(item, 'class'), setup_units(item))
+
+
+class _Simulation(object):
+    """Track the fixture instances pytest keeps cached while running items in order.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.active = {}
+        self.module = self.cls = None
+        self.setups = 0
+        self.cost = 0.0
+
+    def _leave(self, scopes):
+        for fixture, (scope, _) in list(self.active.items()):
+            if scope in scopes:
+                del self.active[fixture]
+
+    def step_cost(self, signature, apply=False):
+        module, cls, units = signature
+        active = self.active
+        if apply:
+            # pytest finalizes module and class scoped fixtures when leaving the node
+            if module != self.module:
+                self._leave(['module', 'class'])
+            elif cls != self.cls or cls is None:
+                self._leave(['class'])
+            self.module, self.cls = module, cls
+        elif module != self.module:
+            active = dict((k, v) for k, v in active.items() if v[0] not in ['module', 'class'])
+        elif cls != self.cls or cls is None:
+            active = dict((k, v) for k, v in active.items() if v[0] != 'class')
+        setups = 0
+        cost = 0.0
+        for unit in units:
+            instance = (unit.scope, (unit.key, unit.param))
+            if unit.key is None or active.get(unit.fixture) != instance:
+                setups += 1
+                cost += self.model.cost(unit.fixture, unit.param)
+                if apply:
+                    self.active[unit.fixture] = instance
+        if apply:
+            self.setups += setups
+            self.cost += cost
+        return cost, setups
+
+
+def estimate(signatures, model):
+    """Return the number and cost of fixture setups needed to run items in order.
+
+    A cached fixture instance is setup again when a different instance of the same fixture
+    is requested, or when pytest leaves the module or class it was cached on.
+    """
+    simulation = _Simulation(model)
+    for signature in signatures:
+        simulation.step_cost(signature, apply=True)
+    return simulation.setups, simulation.cost
+
+
+def _greedy(groups, model, local):
+    # repeatedly run the group of items which is cheapest to setup after the current one,
+    # ties keep the default order. When local, the groups of the current class and then
+    # of the current module are exhausted first so module and class fixtures are kept.
+    simulation = _Simulation(model)
+    signature, ordered = groups[0]
+    simulation.step_cost(signature, apply=True)
+    ordered = list(ordered)
+    remaining = list(groups[1:])
+    while remaining:
+        candidates = range(len(remaining))
+        if local:
+            module, cls, _ = signature
+            for same in [lambda x: x[0] == module and x[1] == cls and cls is not None, lambda x: x[0] == module]:
+                nearby = [i for i in candidates if same(remaining[i][0])]
+                if nearby:
+                    candidates = nearby
+                    break
+        best = min(candidates, key=lambda i: (simulation.step_cost(remaining[i][0]), i))
+        signature, indexes = remaining.pop(best)
+        simulation.step_cost(signature, apply=True)
+        ordered.extend(indexes)
+    return ordered
+
+
+def reorder(items, model):
+    """Reorder items in place to minimise the estimated fixture setup cost.
+
+    Items with identical fixture instances are grouped and the groups are ordered greedily
+    by the cost of setting them up after the previous group, with and without keeping
+    classes and modules together. The cheapest order is applied only
+    when it is estimated to save at least ``MIN_SAVING`` seconds.
+    """
+    signatures = [_signature(item) for item in items]
+    groups = []
+    positions = {}
+    for index, signature in enumerate(signatures):
+        if signature not in positions:
+            positions[signature] = len(groups)
+            groups.append((signature, []))
+        groups[positions[signature]][1].append(index)
+    setups_before, cost_before = estimate(signatures, model)
+    candidates = []
+    for local in [True, False]:
+        ordered = _greedy(groups, model, local)
+        candidates.append(estimate([signatures[index] for index in ordered], model)[::-1] + (ordered,))
+    cost_after, setups_after, ordered = min(candidates, key=lambda candidate: candidate[:2])
+    if cost_before - cost_after < MIN_SAVING:
+        return Schedule(False, setups_before, setups_before, cost_before, cost_before)
+    items[:] = [items[index] for index in ordered]
+    log.info('reordered {} items, estimated fixture setups {} -> {}'.format(len(items), setups_before, setups_after))
+    return Schedule(True, setups_before, setups_after, cost_before, cost_after)
@@ -0,0 +1,107 @@
+import contextlib
+import json
+import logging
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+def worker_id():
+    """Return id of the pytest-xdist worker running this process, or 'master'.
+    """
+    return os.getenv('PYTEST_XDIST_WORKER', 'master')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class SharedResources(object):
+    """Coordinate session resources between pytest-xdist workers using file locks.
+
+    The first worker to acquire a resource creates it, later workers attach to the
+    recorded value and the resource is destroyed when the last user releases it.
+    Without pytest-xdist the only user is the current process.
+
+    Args:
+        directory (str): directory shared by every worker of the test run.
+        worker (str): id of the current worker.
+    """
+
+    def __init__(self, directory, worker=None):
+        self.directory = str(directory)
+        self.worker = worker or worker_id()
+
+    def _path(self, name, suffix):
+        return os.path.join(self.directory, 'containers-{}{}'.format(re.sub(r'[^\w.-]', '_', name), suffix))
+
+    @contextlib.contextmanager
+    def lock(self, name):
+        """Hold an exclusive lock on name across every worker.
+        """
+        with open(self._path(name, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self, name):
+        try:
+            with open(self._path(name, '.json')) as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError):
+            return None
+        # forget workers which died without releasing the resource
+        state['users'] = {worker: pid for worker, pid in state['users'].items() if _pid_alive(pid)}
+        return state
+
+    def _write(self, name, state):
+        with open(self._path(name, '.json'), 'w') as state_file:
+            json.dump(state, state_file)
+
+    def acquire(self, name, create):
+        """Return value of shared resource name, calling create() when this worker is the first user.
+
+        The value returned by create must be JSON serializable.
+        """
+        with self.lock(name):
+            state = self._read(name)
+            if state is None:
+                log.info('worker {} creating shared resource {}'.format(self.worker, name))
+                state = {'value': create(), 'users': {}}
+            else:
+                log.info('worker {} attaching to shared resource {}'.format(self.worker, name))
+            state['users'][self.worker] = os.getpid()
+            self._write(name, state)
+            return state['value']
+
+    def release(self, name, destroy):
+        """Release shared resource name, calling destroy(value) when this worker is the last user.
+        """
+        with self.lock(name):
+            state = self._read(name)
+            if state is None:
+                return
+            state['users'].pop(self.worker, None)
+            if state['users']:
+                log.info('worker {} detaching from shared resource {}'.format(self.worker, name))
+                self._write(name, state)
+                return
+            log.info('worker {} destroying shared resource {}'.format(self.worker, name))
+            os.remove(self._path(name, '.json'))
+            destroy(state['value'])
@@ -0,0 +1,127 @@
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+
+import docker
+
+from . import timing
+
+log = logging.getLogger(__name__)
+
+
+REPOSITORY = 'pytest-containers-snapshot'
+KEY_LABEL = 'pytest_containers.snapshot'
+
+
+def hook_identity(hook):
+    """Return a string identifying callable hook across fixtures and runs.
+
+    An explicit ``snapshot_key`` attribute wins over the source of the hook, which changes whenever the hook does.
+    """
+    key = getattr(hook, 'snapshot_key', None)
+    if key is not None:
+        return str(key)
+    try:
+        return inspect.getsource(hook)
+    except (OSError, TypeError):
+        return '{}.{}'.format(getattr(hook, '__module__', ''), getattr(hook, '__qualname__', repr(hook)))
+
+
+def snapshot_key(image, init, environment=None):
+    """Return the key of the snapshot of image after init ran, a hash of the image digest and init configuration.
+
+    Args:
+        image (:py:class:`docker.models.images.Image`): image the container was started from.
+        init (callable): init hook, identified by its ``snapshot_key`` attribute or its source.
+        environment (dict): container environment.
+    """
+    data = json.dumps({'image': image.id, 'init': hook_identity(init), 'environment': environment or {}},
+                      sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+class SnapshotCache(object):
+    """Local images of containers committed after their init hook ran, reused across fixtures and runs.
+
+    Snapshots are tagged ``pytest-containers-snapshot:<key>`` and labelled with their key. Eviction
+    removes snapshots older than max_age and then the least recently created until the total size of
+    the remaining snapshots is at most max_size. Snapshots used in the current run are kept.
+
+    Args:
+        max_age (float): seconds a snapshot is kept, None keeps snapshots regardless of age.
+        max_size (int): bytes of snapshots kept, None keeps snapshots regardless of size.
+    """
+
+    def __init__(self, max_age=None, max_size=None):
+        self.max_age = max_age
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._used = set()
+
+    def lock(self, key):
+        """Return the lock held while the snapshot key is looked up and made, so it is made once.
+        """
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def lookup(self, client, key):
+        """Return the snapshot image of key, or None when it does not exist.
+        """
+        try:
+            with timing.span('snapshot inspect'):
+                image = client.images.get('{}:{}'.format(REPOSITORY, key))
+        except docker.errors.ImageNotFound:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._used.add(image.id)
+        log.info('starting from snapshot {}:{}'.format(REPOSITORY, key))
+        return image
+
+    def commit(self, container, key):
+        """Commit container as the snapshot of key and return the image.
+        """
+        log.info('docker container commit {} {}:{}'.format(container.short_id, REPOSITORY, key))
+        with timing.span('container commit'):
+            image = container.commit(repository=REPOSITORY, tag=key, conf={'Labels': {KEY_LABEL: key}})
+        with self._lock:
+            self._used.add(image.id)
+        return image
+
+    def evict(self, client, now=None):
+        """Remove expired snapshots and the oldest beyond the size limit, return the ids of removed images.
+        """
+        now = time.time() if now is None else now
+        with timing.span('image ls'):
+            snapshots = client.api.images(filters={'label': KEY_LABEL})
+        with self._lock:
+            used = [snapshot for snapshot in snapshots if snapshot['Id'] in self._used]
+        # snapshots used in this run are kept and count towards the size limit first
+        kept_size = sum(snapshot['Size'] for snapshot in used)
+        evicted = []
+        for snapshot in sorted(snapshots, key=lambda snapshot: snapshot['Created'], reverse=True):
+            if snapshot in used:
+                continue
+            expired = self.max_age is not None and now - snapshot['Created'] > self.max_age
+            oversize = self.max_size is not None and kept_size + snapshot['Size'] > self.max_size
+            if not (expired or oversize):
+                kept_size += snapshot['Size']
+                continue
+            log.info('docker image rm {} ({})'.format(snapshot['Id'], 'expired' if expired else 'size limit'))
+            try:
+                with timing.span('image rm'):
+                    client.api.remove_image(snapshot['Id'], force=True)
+            except docker.errors.APIError as err:
+                log.warning('snapshot {} could not be removed: {}'.format(snapshot['Id'], err))
+                kept_size += snapshot['Size']
+                continue
+            evicted.append(snapshot['Id'])
+        return evicted
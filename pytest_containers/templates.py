@@ -0,0 +1,227 @@
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+
+from . import networks, timing
+
+log = logging.getLogger(__name__)
+
+
+STRATEGIES = ['auto', 'overlay', 'reflink', 'tar']
+
+
+class VolumeTemplate(object):
+    """Data seeding volumes, prepared once per session from a directory or tar file.
+
+    Tar files hold the volume contents relative to its root and may be compressed.
+
+    Args:
+        source (str): directory or tar file.
+        directory (str): working directory of the template.
+    """
+
+    def __init__(self, source, directory):
+        if not os.path.exists(source):
+            raise ValueError('volume template {} does not exist'.format(source))
+        self.source = source
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._seed = source if os.path.isdir(source) else None
+        self._archive = None if os.path.isdir(source) else source
+
+    def seed(self):
+        """Return the directory holding the template contents, a tar file is extracted on first use.
+        """
+        with self._lock:
+            if self._seed is None:
+                seed = os.path.join(self._directory, 'seed')
+                with timing.span('volume template extract'), tarfile.open(self.source) as archive:
+                    _extract(archive, seed)
+                self._seed = seed
+            return self._seed
+
+    def archive(self):
+        """Return the path of a tar file of the template contents, a directory is archived on first use.
+        """
+        with self._lock:
+            if self._archive is None:
+                archive_path = os.path.join(self._directory, 'seed.tar')
+                with timing.span('volume template archive'), tarfile.open(archive_path, 'w') as archive:
+                    for name in sorted(os.listdir(self.source)):
+                        archive.add(os.path.join(self.source, name), arcname=name)
+                self._archive = archive_path
+            return self._archive
+
+
+def _extract(archive, path):
+    # refuse members escaping path where tarfile supports extraction filters
+    if hasattr(tarfile, 'data_filter'):
+        archive.extractall(path, filter='data')
+    else:
+        archive.extractall(path)
+
+
+def _overlay_supported():
+    try:
+        with open('/proc/filesystems') as filesystems:
+            return any(line.split()[-1] == 'overlay' for line in filesystems if line.strip())
+    except (IOError, OSError):
+        return False
+
+
+def _reflink(source, destination):
+    # copy the contents of source into the existing directory destination sharing the data blocks
+    subprocess.check_call(['cp', '-a', '--reflink=always', os.path.join(source, '.'), destination],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class TemplateStore(object):
+    """Session store of volume templates, cloned cheaply for every volume which uses them.
+
+    Clone strategies:
+        overlay: a local volume mounting an overlay filesystem whose lower layer is the template.
+        reflink: a copy of the template sharing its data blocks, on filesystems such as btrfs and xfs.
+        tar: the template streamed into the volume as a tar archive, works with any daemon.
+        auto: overlay or reflink when the daemon is reached over a unix socket on Linux and they are
+            supported, tar otherwise. Only use it when the daemon shares the filesystem of this process.
+
+    Args:
+        strategy (str): one of :py:data:`STRATEGIES`.
+    """
+
+    def __init__(self, strategy='tar'):
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown volume clone strategy {!r}, choose from {}'.format(strategy, STRATEGIES))
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._directory = None
+        self._templates = {}
+        self._probed = {}
+
+    def _workdir(self, prefix):
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='pytest-containers-templates')
+        return tempfile.mkdtemp(prefix=prefix, dir=self._directory)
+
+    def template(self, source):
+        """Return the :py:class:`VolumeTemplate` of source, made once per session.
+        """
+        source = os.path.abspath(source)
+        with self._lock:
+            template = self._templates.get(source)
+        if template is None:
+            template = VolumeTemplate(source, self._workdir('template'))
+            with self._lock:
+                template = self._templates.setdefault(source, template)
+        return template
+
+    def _supports(self, name, probe):
+        with self._lock:
+            if name in self._probed:
+                return self._probed[name]
+        try:
+            supported = probe()
+        except (OSError, subprocess.CalledProcessError):
+            supported = False
+        log.info('volume clone strategy {} is {}supported'.format(name, '' if supported else 'not '))
+        with self._lock:
+            self._probed[name] = supported
+        return supported
+
+    def _probe_reflink(self):
+        directory = self._workdir('reflink')
+        source = os.path.join(directory, 'source')
+        os.mkdir(source)
+        with open(os.path.join(source, 'probe'), 'w') as probe:
+            probe.write('probe')
+        os.mkdir(os.path.join(directory, 'clone'))
+        _reflink(source, os.path.join(directory, 'clone'))
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+    def resolve(self, client):
+        """Return the clone strategy used for volumes of client.
+        """
+        if self.strategy != 'auto':
+            return self.strategy
+        # overlay and reflink clones are made from paths of this host, which only a daemon on it can see
+        if networks.local_daemon(client) and self._supports('overlay', _overlay_supported):
+            return 'overlay'
+        if networks.local_daemon(client) and self._supports('reflink', self._probe_reflink):
+            return 'reflink'
+        return 'tar'
+
+    def clone_directory(self, source, destination):
+        """Copy the template of source into the existing host directory destination.
+        """
+        template = self.template(source)
+        if self.strategy in ['auto', 'reflink'] and self._supports('reflink', self._probe_reflink):
+            with timing.span('volume template reflink'):
+                _reflink(template.seed(), destination)
+            return
+        with timing.span('volume template copy'), tarfile.open(template.archive()) as archive:
+            _extract(archive, destination)
+
+    def clone_volume(self, client, source, name, labels, image, target):
+        """Create volume name holding a clone of the template of source.
+
+        Args:
+            client: docker client.
+            source (str): template directory or tar file.
+            name (str): volume name.
+            labels (dict): labels of the volume and helper container.
+            image: image of the helper container which streams a tar copy into the volume.
+            target (str): path the volume is mounted at in containers of image.
+        """
+        template = self.template(source)
+        strategy = self.resolve(client)
+        log.info('docker volume create {} from template {} ({})'.format(name, source, strategy))
+        if strategy == 'overlay':
+            directory = self._workdir('overlay')
+            upper, work = os.path.join(directory, 'upper'), os.path.join(directory, 'work')
+            os.mkdir(upper)
+            os.mkdir(work)
+            options = 'lowerdir={},upperdir={},workdir={}'.format(template.seed(), upper, work)
+            with timing.span('volume create'):
+                client.volumes.create(name=name, driver='local', labels=labels,
+                                      driver_opts={'type': 'overlay', 'device': 'overlay', 'o': options})
+        elif strategy == 'reflink':
+            directory = self._workdir('reflink')
+            with timing.span('volume template reflink'):
+                _reflink(template.seed(), directory)
+            with timing.span('volume create'):
+                client.volumes.create(name=name, driver='local', labels=labels,
+                                      driver_opts={'type': 'none', 'device': directory, 'o': 'bind'})
+        else:
+            with timing.span('volume create'):
+                client.volumes.create(name=name, driver='local', labels=labels)
+            self.populate_volume(client, source, name, labels, image, target)
+
+    def populate_volume(self, client, source, name, labels, image, target):
+        """Stream the template of source into the existing volume name through a helper container of image.
+        """
+        with timing.span('container create'):
+            helper = client.containers.create(image=image, volumes={name: {'bind': target}}, labels=labels)
+        try:
+            self.populate_container(helper, source, target)
+        finally:
+            with timing.span('container rm'):
+                helper.remove(force=True)
+
+    def populate_container(self, container, source, target):
+        """Stream the template of source into path target of container.
+        """
+        with open(self.template(source).archive(), 'rb') as archive, timing.span('volume template copy'):
+            container.put_archive(target, archive)
+
+    def close(self):
+        with self._lock:
+            directory, self._directory = self._directory, None
+        if directory is not None:
+            # files written to overlay upper layers by containers may belong to root
+            shutil.rmtree(directory, ignore_errors=True)
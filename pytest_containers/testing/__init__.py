@@ -0,0 +1,2 @@
+"""Test doubles used to exercise the plugin without a Docker daemon.
+"""
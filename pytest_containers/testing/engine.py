@@ -0,0 +1,909 @@
+import calendar
+import io
+import ipaddress
+import json
+import logging
+import os
+import re
+import socketserver
+import struct
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+from .. import apistats
+
+log = logging.getLogger(__name__)
+
+
+# image used by the fixtures when a module does not define service_name
+DEFAULT_IMAGES = {
+    'google/python-hello:latest': {
+        'Config': {'Volumes': {'/data': {}}, 'Healthcheck': None},
+        'ContainerConfig': {'Healthcheck': {'StartPeriod': 0}},
+    },
+}
+
+
+class EngineError(Exception):
+    """Raised by request handlers to answer with an error status.
+    """
+
+    def __init__(self, status, message):
+        super(EngineError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _new_id():
+    return uuid.uuid4().hex + uuid.uuid4().hex
+
+
+def _filters(query):
+    filters = json.loads(query.get('filters') or '{}')
+    # filter values are lists, or maps of value to true with older clients
+    return dict((key, [value] if isinstance(value, str) else list(value)) for key, value in filters.items())
+
+
+def _labels_match(labels, wanted):
+    for item in wanted:
+        key, separator, value = item.partition('=')
+        if key not in labels or (separator and labels[key] != value):
+            return False
+    return True
+
+
+def _created_before(created, filters):
+    # until filters hold unix times
+    return 'until' not in filters or calendar.timegm(time.strptime(created, '%Y-%m-%dT%H:%M:%SZ')) < float(
+        filters['until'][0])
+
+
+def _prunable(item, filters):
+    return _created_before(item['Created'], filters) and _labels_match(item['Config']['Labels'], filters.get('label', []))
+
+
+def _frame(data, stream=1):
+    # output of containers without a tty is multiplexed in frames of stdout and stderr
+    return struct.pack('>BxxxL', stream, len(data)) + data if data else b''
+
+
+class _Raw(object):
+    # iterator of bytes streamed as they are rather than as JSON documents
+    def __init__(self, iterator):
+        self._iterator = iterator
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+
+class _Hijack(object):
+    # answer upgraded to a raw stream of the connection, run(rfile, connection) drives it
+    def __init__(self, run):
+        self.run = run
+
+
+def _lower_keys(value):
+    return dict((key.lower(), item) for key, item in (value or {}).items())
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+    def _handle(self):
+        engine = self.server.engine
+        split = urlsplit(self.path)
+        path = re.sub(r'^/v\d+\.\d+', '', split.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(split.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            pass
+        delay = engine.delay(self.command, self.path)
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            status, payload = engine.handle(self.command, path, query, body)
+        except EngineError as err:
+            status, payload = err.status, {'message': err.message}
+        try:
+            self._respond(status, payload)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    do_DELETE = do_GET = do_HEAD = do_POST = do_PUT = _handle
+
+    def _respond(self, status, payload):
+        if isinstance(payload, _Hijack):
+            self.send_response(101, 'UPGRADED')
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.send_header('Connection', 'Upgrade')
+            self.send_header('Upgrade', 'tcp')
+            self.end_headers()
+            self.wfile.flush()
+            payload.run(self.rfile, self.connection)
+            self.close_connection = True
+            return
+        self.send_response(status)
+        if hasattr(payload, '__next__'):
+            # streamed responses use chunked encoding like the engine
+            raw = isinstance(payload, _Raw)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream' if raw else 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for item in payload:
+                data = item if raw else (json.dumps(item) + '\n').encode('utf-8')
+                self.wfile.write('{:x}\r\n'.format(len(data)).encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        if payload is None:
+            data, content_type = b'', 'text/plain'
+        elif isinstance(payload, bytes):
+            data, content_type = payload, 'text/plain'
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if data and self.command != 'HEAD':
+            self.wfile.write(data)
+
+
+class FakeEngine(object):
+    """In-memory stand-in for the Docker Engine API served on a unix socket.
+
+    Implements the endpoints used by the plugin's fixtures: images, containers, networks,
+    volumes, swarm, services, tasks and events. Containers start immediately and report
+    healthy, images which are not known are "pulled" instantly.
+
+    Args:
+        socket_path (str): path of the unix socket to listen on.
+        latency (float): seconds added to every request.
+        latencies (dict): seconds added to requests of an endpoint such as ``POST /containers/create``,
+            see :py:func:`pytest_containers.apistats.endpoint`.
+        images (dict): attributes of the available images keyed by repo:tag.
+
+    Example:
+        >>> with FakeEngine('/tmp/docker.sock', latency=0.01) as engine:
+        >>>     client = docker.DockerClient(base_url=engine.base_url)
+
+    """
+
+    api_version = '1.35'
+
+    def __init__(self, socket_path, latency=0.0, latencies=None, images=None):
+        self.socket_path = socket_path
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.requests = 0
+        self.images = {}
+        self.containers = {}
+        self.networks = {}
+        self.volumes = {}
+        self.services = {}
+        self.tasks = {}
+        self.swarm = None
+        self.events = []
+        # files copied into containers
+        self.archives = []
+        # output written by every container and service
+        self.log_output = b''
+        # exec instances, their commands run as processes of this host
+        self.execs = {}
+        self.network_drivers = ['bridge', 'host', 'ipvlan', 'macvlan', 'null', 'overlay']
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._server = None
+        self._thread = None
+        self._stopped = False
+        self._subnets = 0
+        for name, driver in [('bridge', 'bridge'), ('host', 'host'), ('none', 'null')]:
+            self._add_network({'Name': name, 'Driver': driver}, scope='local')
+        for repo_tag, attrs in (DEFAULT_IMAGES if images is None else images).items():
+            self.add_image(repo_tag, attrs)
+        self._routes = [(method, re.compile('^{}$'.format(pattern)), handler) for method, pattern, handler in [
+            ('GET', '/_ping', self._ping),
+            ('HEAD', '/_ping', self._ping),
+            ('GET', '/version', self._version),
+            ('GET', '/info', self._info),
+            ('GET', '/events', self._events),
+            ('GET', '/images/json', self._list_images),
+            ('POST', '/images/create', self._pull_image),
+            ('GET', '/images/(?P<name>.+)/json', self._inspect_image),
+            ('DELETE', '/images/(?P<name>.+)', self._remove_image),
+            ('POST', '/commit', self._commit),
+            ('POST', '/containers/create', self._create_container),
+            ('POST', '/containers/prune', self._prune_containers),
+            ('GET', '/containers/json', self._list_containers),
+            ('GET', '/containers/(?P<name>[^/]+)/json', self._inspect_container),
+            ('POST', '/containers/(?P<name>[^/]+)/start', self._start_container),
+            ('POST', '/containers/(?P<name>[^/]+)/(?:stop|kill)', self._stop_container),
+            ('POST', '/containers/(?P<name>[^/]+)/wait', self._wait_container),
+            ('GET', '/containers/(?P<name>[^/]+)/logs', self._container_logs),
+            ('PUT', '/containers/(?P<name>[^/]+)/archive', self._put_archive),
+            ('POST', '/containers/(?P<name>[^/]+)/exec', self._create_exec),
+            ('POST', '/exec/(?P<name>[^/]+)/start', self._start_exec),
+            ('GET', '/exec/(?P<name>[^/]+)/json', self._inspect_exec),
+            ('DELETE', '/containers/(?P<name>[^/]+)', self._remove_container),
+            ('POST', '/networks/create', self._create_network),
+            ('POST', '/networks/prune', self._prune_networks),
+            ('GET', '/networks', self._list_networks),
+            ('GET', '/networks/(?P<name>[^/]+)', self._inspect_network),
+            ('POST', '/networks/(?P<name>[^/]+)/connect', self._connect_network),
+            ('POST', '/networks/(?P<name>[^/]+)/disconnect', self._disconnect_network),
+            ('DELETE', '/networks/(?P<name>[^/]+)', self._remove_network),
+            ('POST', '/volumes/create', self._create_volume),
+            ('POST', '/volumes/prune', self._prune_volumes),
+            ('GET', '/volumes', self._list_volumes),
+            ('GET', '/volumes/(?P<name>[^/]+)', self._inspect_volume),
+            ('DELETE', '/volumes/(?P<name>[^/]+)', self._remove_volume),
+            ('POST', '/swarm/init', self._init_swarm),
+            ('POST', '/swarm/leave', self._leave_swarm),
+            ('GET', '/swarm', self._inspect_swarm),
+            ('POST', '/services/create', self._create_service),
+            ('GET', '/services', self._list_services),
+            ('GET', '/services/(?P<name>[^/]+)', self._inspect_service),
+            ('GET', '/services/(?P<name>[^/]+)/logs', self._service_logs),
+            ('DELETE', '/services/(?P<name>[^/]+)', self._remove_service),
+            ('GET', '/tasks', self._list_tasks),
+        ]]
+
+    @property
+    def base_url(self):
+        return 'unix://' + self.socket_path
+
+    def start(self):
+        """Start serving on a background thread and return the engine.
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.engine = self
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='fake-docker-engine')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def delay(self, method, url):
+        """Return the artificial latency of a request.
+        """
+        with self._lock:
+            self.requests += 1
+        if not self.latencies:
+            return self.latency
+        return self.latencies.get(apistats.endpoint(method, url), self.latency)
+
+    def handle(self, method, path, query, body):
+        """Return status and payload of a request, payload is JSON data, bytes or an iterator of JSON data.
+        """
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match is not None and route_method == method:
+                with self._lock:
+                    return handler(query, body, **match.groupdict())
+        raise EngineError(404, 'page not found: {} {}'.format(method, path))
+
+    def _event(self, kind, action, actor_id, attributes=None):
+        now = time.time()
+        self.events.append({'Type': kind, 'Action': action, 'status': action, 'id': actor_id,
+                            'Actor': {'ID': actor_id, 'Attributes': dict(attributes or {})},
+                            'time': int(now), 'timeNano': int(now * 1000000000)})
+        self._changed.notify_all()
+
+    def _find(self, collection, name, kind):
+        if name in collection:
+            return collection[name]
+        for item in collection.values():
+            names = [item.get('Name', '').lstrip('/'), item.get('Spec', {}).get('Name')]
+            if name in names:
+                return item
+        matches = [item for key, item in collection.items() if key.startswith(name)]
+        if len(matches) == 1:
+            return matches[0]
+        raise EngineError(404, 'No such {}: {}'.format(kind, name))
+
+    # system
+
+    def _ping(self, query, body):
+        return 200, b'OK'
+
+    def _version(self, query, body):
+        return 200, {'ApiVersion': self.api_version, 'MinAPIVersion': '1.12', 'Version': '18.06.0-fake',
+                     'Os': 'linux', 'Arch': 'amd64', 'GoVersion': 'go1.10.3'}
+
+    def _info(self, query, body):
+        return 200, {'Containers': len(self.containers), 'Images': len(self.images), 'ServerVersion': '18.06.0-fake',
+                     'Swarm': {'LocalNodeState': 'active' if self.swarm else 'inactive',
+                               'ControlAvailable': self.swarm is not None},
+                     'Plugins': {'Network': list(self.network_drivers)}}
+
+    def _events(self, query, body):
+        since = float(query.get('since') or 0)
+        until = float(query['until']) if query.get('until') else None
+        filters = _filters(query)
+        return 200, self._stream_events(since, until, filters)
+
+    def _event_matches(self, event, filters):
+        attributes = event['Actor']['Attributes']
+        for key, values in filters.items():
+            if key == 'type' and event['Type'] not in values:
+                return False
+            if key == 'event' and event['Action'] not in values:
+                return False
+            if key in ['container', 'network', 'service', 'volume', 'image']:
+                if event['Type'] != key or not (event['id'] in values or attributes.get('name') in values):
+                    return False
+            if key == 'label' and not _labels_match(attributes, values):
+                return False
+        return True
+
+    def _stream_events(self, since, until, filters):
+        # runs outside of the request lock, events are read under the condition
+        position = 0
+        while True:
+            with self._changed:
+                pending = self.events[position:]
+                position = len(self.events)
+                if not pending:
+                    timeout = None if until is None else until - time.time()
+                    if self._stopped or (timeout is not None and timeout <= 0):
+                        return
+                    self._changed.wait(timeout if timeout is None else min(timeout, 1.0))
+                    continue
+            for event in pending:
+                if event['timeNano'] >= since * 1000000000 and self._event_matches(event, filters):
+                    yield event
+
+    # images
+
+    def add_image(self, repo_tag, attrs=None):
+        """Make image repo_tag available and return its attributes.
+        """
+        image_id = 'sha256:' + _new_id()
+        repository = repo_tag.rpartition(':')[0] if ':' in repo_tag.rpartition('/')[2] else repo_tag
+        image = {'Id': image_id, 'RepoTags': [repo_tag], 'RepoDigests': ['{}@sha256:{}'.format(repository, _new_id())],
+                 'Created': '2018-07-18T00:00:00Z', 'Size': 0,
+                 'Config': {'Volumes': None, 'Healthcheck': None, 'Labels': {}},
+                 'ContainerConfig': {'Healthcheck': {'StartPeriod': 0}}}
+        image.update(attrs or {})
+        self.images[image_id] = image
+        return image
+
+    def _image(self, name):
+        for image in self.images.values():
+            references = [image['Id'], image['Id'].split(':', 1)[1]] + image['RepoTags'] + image['RepoDigests']
+            if name in references or name + ':latest' in image['RepoTags']:
+                return image
+        raise EngineError(404, 'No such image: {}'.format(name))
+
+    def _list_images(self, query, body):
+        filters = _filters(query)
+        images = []
+        for image in self.images.values():
+            labels = (image['Config'] or {}).get('Labels') or {}
+            if 'label' in filters and not _labels_match(labels, filters['label']):
+                continue
+            created = calendar.timegm(time.strptime(image['Created'], '%Y-%m-%dT%H:%M:%SZ'))
+            images.append({'Id': image['Id'], 'RepoTags': image['RepoTags'], 'RepoDigests': image['RepoDigests'],
+                           'Created': created, 'Size': image['Size'], 'Labels': labels})
+        return 200, images
+
+    def _inspect_image(self, query, body, name):
+        return 200, self._image(name)
+
+    def _pull_image(self, query, body):
+        repository, tag = query['fromImage'], query.get('tag') or 'latest'
+        repo_tag = '{}{}{}'.format(repository, '@' if tag.startswith('sha256:') else ':', tag)
+        try:
+            image = self._image(repo_tag)
+        except EngineError:
+            image = self.add_image(repo_tag)
+            self._event('image', 'pull', repo_tag, {'name': repo_tag})
+        digest = image['RepoDigests'][0].split('@', 1)[1]
+        return 200, iter([{'status': 'Pulling from {}'.format(repository), 'id': tag},
+                          {'status': 'Digest: {}'.format(digest)},
+                          {'status': 'Status: Image is up to date for {}'.format(repo_tag)}])
+
+    def _commit(self, query, body):
+        container = self._container(query['container'])
+        parent = self.images[container['Image']]
+        repo_tag = '{}:{}'.format(query['repo'], query.get('tag') or 'latest')
+        for image in self.images.values():
+            if repo_tag in image['RepoTags']:
+                image['RepoTags'].remove(repo_tag)
+        config = dict(container['Config'], Labels=dict(container['Config']['Labels'], **(body or {}).get('Labels', {})))
+        # committed layers are given a fixed size
+        image = self.add_image(repo_tag, {'RepoDigests': [], 'Config': config, 'Size': parent['Size'] + 1048576,
+                                          'Created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                                          'ContainerConfig': parent['ContainerConfig']})
+        return 201, {'Id': image['Id']}
+
+    def _remove_image(self, query, body, name):
+        image = self._image(name)
+        del self.images[image['Id']]
+        return 200, [{'Deleted': image['Id']}]
+
+    # containers
+
+    def _create_container(self, query, body, labels=None):
+        name = query.get('name') or 'fake_' + uuid.uuid4().hex[:12]
+        if any(container['Name'] == '/' + name for container in self.containers.values()):
+            raise EngineError(409, 'Conflict. The container name "/{}" is already in use'.format(name))
+        image = self._image(body['Image'])
+        host_config = body.get('HostConfig') or {}
+        network_mode = host_config.get('NetworkMode') or 'default'
+        network = self._find(self.networks, 'bridge' if network_mode == 'default' else network_mode, 'network')
+        healthcheck = body.get('Healthcheck') or (image['Config'] or {}).get('Healthcheck')
+        container_id = _new_id()
+        container_labels = dict((image['Config'] or {}).get('Labels') or {})
+        container_labels.update(body.get('Labels') or labels or {})
+        self.containers[container_id] = {
+            'Id': container_id, 'Name': '/' + name, 'Created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'Image': image['Id'],
+            'Config': {'Image': body['Image'], 'Cmd': body.get('Cmd'), 'Env': body.get('Env'), 'Tty': body.get('Tty', False),
+                       'Hostname': body.get('Hostname') or container_id[:12], 'Labels': container_labels,
+                       'Healthcheck': healthcheck, 'Volumes': (image['Config'] or {}).get('Volumes')},
+            'State': {'Status': 'created', 'Running': False, 'ExitCode': 0},
+            'HostConfig': dict(host_config, NetworkMode=network_mode),
+            'NetworkSettings': {'Networks': {network['Name']: {'NetworkID': network['Id']}}},
+            'Mounts': [],
+        }
+        self._event('container', 'create', container_id, dict(container_labels, name=name, image=body['Image']))
+        return 201, {'Id': container_id, 'Warnings': None}
+
+    def _container(self, name):
+        return self._find(self.containers, name, 'container')
+
+    def _container_event(self, container, action, **attributes):
+        attributes = dict(container['Config']['Labels'], name=container['Name'].lstrip('/'), **attributes)
+        self._event('container', action, container['Id'], attributes)
+
+    def _list_containers(self, query, body):
+        filters = _filters(query)
+        containers = []
+        for container in self.containers.values():
+            if query.get('all') not in ['1', 'True', 'true'] and not container['State']['Running']:
+                continue
+            if 'label' in filters and not _labels_match(container['Config']['Labels'], filters['label']):
+                continue
+            if 'name' in filters and not any(x in container['Name'] for x in filters['name']):
+                continue
+            if 'id' in filters and not any(container['Id'].startswith(x) for x in filters['id']):
+                continue
+            if 'status' in filters and container['State']['Status'] not in filters['status']:
+                continue
+            created = calendar.timegm(time.strptime(container['Created'], '%Y-%m-%dT%H:%M:%SZ'))
+            containers.append({'Id': container['Id'], 'Names': [container['Name']], 'Image': container['Config']['Image'],
+                               'ImageID': container['Image'], 'Labels': container['Config']['Labels'], 'Created': created,
+                               'State': container['State']['Status'], 'Status': container['State']['Status']})
+        return 200, containers
+
+    def _inspect_container(self, query, body, name):
+        return 200, self._container(name)
+
+    def _start_container(self, query, body, name):
+        container = self._container(name)
+        if container['State']['Running']:
+            return 304, None
+        container['State'].update(Status='running', Running=True, StartedAt=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        self._container_event(container, 'start')
+        healthcheck = container['Config']['Healthcheck']
+        if healthcheck and healthcheck.get('Test') not in [None, ['NONE']]:
+            container['State']['Health'] = {'Status': 'healthy', 'FailingStreak': 0, 'Log': []}
+            self._container_event(container, 'health_status: healthy')
+        return 204, None
+
+    def _stop_container(self, query, body, name):
+        container = self._container(name)
+        if container['State']['Running']:
+            container['State'].update(Status='exited', Running=False, ExitCode=137)
+            self._container_event(container, 'die', exitCode='137')
+        return 204, None
+
+    def _wait_container(self, query, body, name):
+        return 200, {'StatusCode': self._container(name)['State']['ExitCode'], 'Error': None}
+
+    def _container_logs(self, query, body, name):
+        container = self._container(name)
+        if query.get('follow') not in ['1', 'True', 'true']:
+            return 200, _frame(self.log_output)
+        return 200, _Raw(self._follow_logs(self.containers, container['Id'], self.log_output))
+
+    def _follow_logs(self, collection, key, output):
+        # runs outside of the request lock, followed logs end when their container or service is removed
+        if output:
+            yield _frame(output)
+        with self._changed:
+            while key in collection and not self._stopped:
+                self._changed.wait(1.0)
+
+    def _put_archive(self, query, body, name):
+        container = self._container(name)
+        with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+            names = archive.getnames()
+        self.archives.append({'Container': container['Id'], 'Path': query['path'], 'Names': names})
+        return 200, None
+
+    def _remove_container(self, query, body, name):
+        container = self._container(name)
+        if container['State']['Running'] and query.get('force') not in ['1', 'True', 'true']:
+            raise EngineError(409, 'You cannot remove a running container {}. Stop the container before '
+                                   'attempting removal or force remove'.format(container['Id']))
+        if container['State']['Running']:
+            self._stop_container(query, body, name)
+        del self.containers[container['Id']]
+        self._container_event(container, 'destroy')
+        return 204, None
+
+    def _prune_containers(self, query, body):
+        filters = _filters(query)
+        deleted = [container['Id'] for container in list(self.containers.values())
+                   if not container['State']['Running'] and _prunable(container, filters)]
+        for container_id in deleted:
+            self._remove_container({}, None, container_id)
+        return 200, {'ContainersDeleted': deleted or None, 'SpaceReclaimed': 0}
+
+    # exec
+
+    def _create_exec(self, query, body, name):
+        container = self._container(name)
+        if not container['State']['Running']:
+            raise EngineError(409, 'Container {} is not running'.format(container['Id']))
+        exec_id = _new_id()
+        self.execs[exec_id] = {'ID': exec_id, 'ContainerID': container['Id'], 'Running': False, 'ExitCode': None,
+                               'Pid': 0, 'OpenStdin': bool(body.get('AttachStdin')),
+                               'ProcessConfig': {'entrypoint': body['Cmd'][0], 'arguments': body['Cmd'][1:],
+                                                 'tty': bool(body.get('Tty'))}}
+        return 201, {'Id': exec_id}
+
+    def _start_exec(self, query, body, name):
+        instance = self._find(self.execs, name, 'exec instance')
+        if instance['Running'] or instance['ExitCode'] is not None:
+            raise EngineError(409, 'exec {} has already been started'.format(instance['ID']))
+        return 200, _Hijack(lambda rfile, connection: self._run_exec(instance, rfile, connection))
+
+    def _run_exec(self, instance, rfile, connection):
+        config = instance['ProcessConfig']
+        process = subprocess.Popen([config['entrypoint']] + config['arguments'],
+                                   stdin=subprocess.PIPE if instance['OpenStdin'] else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self._lock:
+            instance.update(Running=True, Pid=process.pid)
+        lock = threading.Lock()
+
+        def pump(output, stream):
+            for data in iter(lambda: output.read1(65536), b''):
+                with lock:
+                    try:
+                        connection.sendall(_frame(data, stream))
+                    except OSError:
+                        pass
+
+        def feed():
+            try:
+                for data in iter(lambda: rfile.read1(65536), b''):
+                    process.stdin.write(data)
+                    process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        if instance['OpenStdin']:
+            feeder = threading.Thread(target=feed)
+            feeder.daemon = True
+            feeder.start()
+        pumps = [threading.Thread(target=pump, args=(process.stdout, 1)),
+                 threading.Thread(target=pump, args=(process.stderr, 2))]
+        for thread in pumps:
+            thread.start()
+        for thread in pumps:
+            thread.join()
+        exit_code = process.wait()
+        with self._changed:
+            instance.update(Running=False, ExitCode=exit_code)
+            self._changed.notify_all()
+
+    def _inspect_exec(self, query, body, name):
+        return 200, self._find(self.execs, name, 'exec instance')
+
+    # networks
+
+    def _add_network(self, spec, scope):
+        network_id = _new_id()
+        ipam = spec.get('IPAM') or {}
+        config = ipam.get('Config') or []
+        for subnet in [x['Subnet'] for x in config if x.get('Subnet')]:
+            if any(ipaddress.ip_network(subnet).overlaps(ipaddress.ip_network(x['Subnet']))
+                   for network in self.networks.values() for x in network['IPAM']['Config']):
+                raise EngineError(403, 'Pool overlaps with other one on this address space')
+        if not config and spec.get('Driver', 'bridge') in ['bridge', 'overlay']:
+            self._subnets += 1
+            subnet = '172.{}.0.0/16'.format(16 + self._subnets) if scope == 'local' else \
+                '10.0.{}.0/24'.format(self._subnets)
+            config = [{'Subnet': subnet, 'Gateway': subnet.replace('.0/', '.1/').split('/')[0]}]
+        network = {'Name': spec['Name'], 'Id': network_id, 'Created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'Scope': scope, 'Driver': spec.get('Driver') or 'bridge',
+                   'IPAM': {'Driver': ipam.get('Driver') or 'default', 'Config': config},
+                   'Internal': spec.get('Internal', False), 'Attachable': spec.get('Attachable', False),
+                   'Containers': {}, 'Options': spec.get('Options') or {}, 'Labels': spec.get('Labels') or {}}
+        self.networks[network_id] = network
+        return network
+
+    def _create_network(self, query, body):
+        if any(network['Name'] == body['Name'] for network in self.networks.values()):
+            raise EngineError(409, 'network with name {} already exists'.format(body['Name']))
+        driver = body.get('Driver') or 'bridge'
+        if driver == 'overlay' and self.swarm is None:
+            raise EngineError(503, 'This node is not a swarm manager. Use "docker swarm init" or "docker swarm join" '
+                                   'to connect this node to swarm and try again.')
+        network = self._add_network(body, 'swarm' if driver == 'overlay' else 'local')
+        self._event('network', 'create', network['Id'], {'name': network['Name'], 'type': driver})
+        return 201, {'Id': network['Id'], 'Warning': ''}
+
+    def _list_networks(self, query, body):
+        filters = _filters(query)
+        networks = []
+        for network in self.networks.values():
+            if 'name' in filters and not any(x in network['Name'] for x in filters['name']):
+                continue
+            if 'id' in filters and not any(network['Id'].startswith(x) for x in filters['id']):
+                continue
+            if 'driver' in filters and network['Driver'] not in filters['driver']:
+                continue
+            if 'label' in filters and not _labels_match(network['Labels'], filters['label']):
+                continue
+            networks.append(network)
+        return 200, networks
+
+    def _attached(self, network):
+        return [container for container in self.containers.values()
+                if any(x['NetworkID'] == network['Id'] for x in container['NetworkSettings']['Networks'].values())]
+
+    def _inspect_network(self, query, body, name):
+        network = self._find(self.networks, name, 'network')
+        containers = {container['Id']: {'Name': container['Name'].lstrip('/')} for container in self._attached(network)}
+        return 200, dict(network, Containers=containers)
+
+    def _connect_network(self, query, body, name):
+        network = self._find(self.networks, name, 'network')
+        container = self._container(body['Container'])
+        container['NetworkSettings']['Networks'][network['Name']] = {'NetworkID': network['Id']}
+        self._event('network', 'connect', network['Id'], {'name': network['Name'], 'container': container['Id']})
+        return 200, None
+
+    def _disconnect_network(self, query, body, name):
+        network = self._find(self.networks, name, 'network')
+        container = self._container(body['Container'])
+        if network['Name'] not in container['NetworkSettings']['Networks']:
+            raise EngineError(404, 'container {} is not connected to network {}'.format(container['Id'], name))
+        del container['NetworkSettings']['Networks'][network['Name']]
+        self._event('network', 'disconnect', network['Id'], {'name': network['Name'], 'container': container['Id']})
+        return 200, None
+
+    def _remove_network(self, query, body, name):
+        network = self._find(self.networks, name, 'network')
+        if network['Name'] in ['bridge', 'host', 'none']:
+            raise EngineError(403, '{} is a pre-defined network and cannot be removed'.format(network['Name']))
+        if self._attached(network):
+            raise EngineError(409, 'error while removing network: network {} id {} has active endpoints'.format(
+                network['Name'], network['Id']))
+        del self.networks[network['Id']]
+        self._event('network', 'destroy', network['Id'], {'name': network['Name'], 'type': network['Driver']})
+        return 204, None
+
+    def _prune_networks(self, query, body):
+        filters = _filters(query)
+        deleted = []
+        for network in list(self.networks.values()):
+            if network['Name'] in ['bridge', 'host', 'none'] or not _created_before(network['Created'], filters):
+                continue
+            if not _labels_match(network.get('Labels') or {}, filters.get('label', [])):
+                continue
+            try:
+                self._remove_network({}, None, network['Id'])
+            except EngineError:
+                continue
+            deleted.append(network['Name'])
+        return 200, {'NetworksDeleted': deleted or None}
+
+    # volumes
+
+    def _create_volume(self, query, body):
+        name = body.get('Name') or _new_id()
+        volume = self.volumes.setdefault(name, {
+            'Name': name, 'Driver': body.get('Driver') or 'local', 'Labels': body.get('Labels') or {},
+            'Mountpoint': '/var/lib/docker/volumes/{}/_data'.format(name), 'Scope': 'local',
+            'CreatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'Options': body.get('DriverOpts')})
+        self._event('volume', 'create', name, {'driver': volume['Driver']})
+        return 201, volume
+
+    def _list_volumes(self, query, body):
+        filters = _filters(query)
+        volumes = [volume for volume in self.volumes.values()
+                   if 'label' not in filters or _labels_match(volume['Labels'], filters['label'])]
+        return 200, {'Volumes': volumes, 'Warnings': None}
+
+    def _inspect_volume(self, query, body, name):
+        if name not in self.volumes:
+            raise EngineError(404, 'get {}: no such volume'.format(name))
+        return 200, self.volumes[name]
+
+    def _remove_volume(self, query, body, name):
+        self._inspect_volume(query, body, name)
+        del self.volumes[name]
+        self._event('volume', 'destroy', name)
+        return 204, None
+
+    def _volume_in_use(self, name):
+        for container in self.containers.values():
+            binds = container['HostConfig'].get('Binds') or []
+            if any(bind.split(':', 1)[0] == name for bind in binds):
+                return True
+        return False
+
+    def _prune_volumes(self, query, body):
+        filters = _filters(query)
+        # from api version 1.42 named volumes are only pruned when asked for all volumes
+        newer = tuple(int(part) for part in self.api_version.split('.')) >= (1, 42)
+        if newer and filters.get('all') not in [['true'], ['1']]:
+            return 200, {'VolumesDeleted': None, 'SpaceReclaimed': 0}
+        deleted = [name for name, volume in self.volumes.items()
+                   if _labels_match(volume['Labels'], filters.get('label', [])) and not self._volume_in_use(name)]
+        for name in deleted:
+            self._remove_volume({}, None, name)
+        return 200, {'VolumesDeleted': deleted or None, 'SpaceReclaimed': 0}
+
+    # swarm
+
+    def _init_swarm(self, query, body):
+        if self.swarm is not None:
+            raise EngineError(503, 'This node is already part of a swarm. Use "docker swarm leave" to leave this '
+                                   'swarm and join another one.')
+        node_id = uuid.uuid4().hex[:25]
+        self.swarm = {'ID': uuid.uuid4().hex[:25], 'NodeID': node_id, 'Version': {'Index': 1},
+                      'Spec': (body or {}).get('Spec') or {}, 'JoinTokens': {'Worker': 'SWMTKN-1-worker',
+                                                                             'Manager': 'SWMTKN-1-manager'}}
+        self._add_network({'Name': 'ingress', 'Driver': 'overlay'}, scope='swarm')
+        return 200, node_id
+
+    def _swarm(self):
+        if self.swarm is None:
+            raise EngineError(503, 'This node is not a swarm manager. Use "docker swarm init" or "docker swarm join" '
+                                   'to connect this node to swarm and try again.')
+        return self.swarm
+
+    def _leave_swarm(self, query, body):
+        self._swarm()
+        for service_id in list(self.services):
+            self._remove_service(query, body, service_id)
+        for network in list(self.networks.values()):
+            if network['Scope'] == 'swarm':
+                del self.networks[network['Id']]
+        self.swarm = None
+        return 200, None
+
+    def _inspect_swarm(self, query, body):
+        return 200, self._swarm()
+
+    # services
+
+    def _create_service(self, query, body):
+        self._swarm()
+        if any(service['Spec']['Name'] == body['Name'] for service in self.services.values()):
+            raise EngineError(409, 'rpc error: code = AlreadyExists desc = name conflicts with an existing object')
+        service_id = uuid.uuid4().hex[:25]
+        service = {'ID': service_id, 'Version': {'Index': 1}, 'Spec': body,
+                   'CreatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        self.services[service_id] = service
+        mode = _lower_keys(body.get('Mode'))
+        replicas = (mode.get('replicated') or {}).get('Replicas', 1) if 'global' not in mode else 1
+        container_spec = body['TaskTemplate']['ContainerSpec']
+        labels = dict(container_spec.get('Labels') or {})
+        labels.update({'com.docker.swarm.service.id': service_id, 'com.docker.swarm.service.name': body['Name']})
+        for slot in range(1, replicas + 1):
+            task_id = uuid.uuid4().hex[:25]
+            labels['com.docker.swarm.task.id'] = task_id
+            status, created = self._create_container(
+                {'name': '{}.{}.{}'.format(body['Name'], slot, task_id)},
+                {'Image': container_spec['Image'], 'Env': container_spec.get('Env')}, labels=dict(labels))
+            self._start_container({}, None, created['Id'])
+            self.tasks[task_id] = {
+                'ID': task_id, 'ServiceID': service_id, 'Slot': slot, 'NodeID': self.swarm['NodeID'],
+                'Labels': dict(body.get('Labels') or {}, **(container_spec.get('Labels') or {})),
+                'DesiredState': 'running', 'Spec': body['TaskTemplate'],
+                'Status': {'State': 'running', 'Message': 'started', 'Timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                           'ContainerStatus': {'ContainerID': created['Id']}}}
+        self._event('service', 'create', service_id, {'name': body['Name']})
+        return 201, {'ID': service_id}
+
+    def _list_services(self, query, body):
+        self._swarm()
+        filters = _filters(query)
+        services = []
+        for service in self.services.values():
+            if 'name' in filters and not any(x in service['Spec']['Name'] for x in filters['name']):
+                continue
+            if 'id' in filters and not any(service['ID'].startswith(x) for x in filters['id']):
+                continue
+            if 'label' in filters and not _labels_match(service['Spec'].get('Labels') or {}, filters['label']):
+                continue
+            services.append(service)
+        return 200, services
+
+    def _inspect_service(self, query, body, name):
+        self._swarm()
+        return 200, self._find(self.services, name, 'service')
+
+    def _service_logs(self, query, body, name):
+        service = self._find(self.services, name, 'service')
+        if query.get('follow') not in ['1', 'True', 'true']:
+            return 200, _frame(self.log_output)
+        return 200, _Raw(self._follow_logs(self.services, service['ID'], self.log_output))
+
+    def _remove_service(self, query, body, name):
+        self._swarm()
+        service = self._find(self.services, name, 'service')
+        for task_id, task in list(self.tasks.items()):
+            if task['ServiceID'] == service['ID']:
+                container_id = task['Status']['ContainerStatus']['ContainerID']
+                if container_id in self.containers:
+                    self._remove_container({'force': '1'}, None, container_id)
+                del self.tasks[task_id]
+        del self.services[service['ID']]
+        self._event('service', 'remove', service['ID'], {'name': service['Spec']['Name']})
+        return 200, None
+
+    def _list_tasks(self, query, body):
+        self._swarm()
+        filters = _filters(query)
+        tasks = []
+        for task in self.tasks.values():
+            service = self.services.get(task['ServiceID'])
+            names = [task['ServiceID'], service['Spec']['Name'] if service else None]
+            if 'service' in filters and not any(x in names for x in filters['service']):
+                continue
+            if 'desired-state' in filters and task['DesiredState'] not in filters['desired-state']:
+                continue
+            if 'label' in filters and not _labels_match(task['Labels'], filters['label']):
+                continue
+            tasks.append(task)
+        return 200, tasks
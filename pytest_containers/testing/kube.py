@@ -0,0 +1,409 @@
+import copy
+import http.server
+import json
+import logging
+import re
+import socketserver
+import threading
+import time
+import uuid
+
+from .engine import EngineError, _Handler, _labels_match
+
+log = logging.getLogger(__name__)
+
+
+# resources served, their kind and group version
+RESOURCES = {
+    'namespaces': ('Namespace', 'v1'),
+    'pods': ('Pod', 'v1'),
+    'services': ('Service', 'v1'),
+    'endpoints': ('Endpoints', 'v1'),
+    'deployments': ('Deployment', 'apps/v1'),
+}
+
+_NAMESPACED = r'(?:/api/v1|/apis/apps/v1)/namespaces/(?P<namespace>[^/]+)/(?P<resource>pods|services|endpoints|deployments)'
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _selects(selector, labels):
+    return all(labels.get(key) == value for key, value in selector.items())
+
+
+class FakeKubernetes(object):
+    """In-memory stand-in for the Kubernetes API served over HTTP on localhost.
+
+    Implements what the plugin's fixtures use: namespaces, pods, deployments, services and endpoints,
+    with list and watch. Objects go through the transitions of a cluster: pods become ready start_delay
+    seconds after they were created, deployments create their pods directly and report them available,
+    the endpoints of a service follow the ready pods it selects. A deleted namespace is terminating for
+    termination_delay seconds before it is removed with every object in it.
+
+    Args:
+        start_delay (float): seconds until a pod is ready.
+        termination_delay (float): seconds a deleted namespace terminates.
+        failing_images (list): images which can not be pulled.
+
+    Example:
+        >>> with FakeKubernetes() as cluster:
+        >>>     kubernetes.config.load_kube_config(cluster.write_kubeconfig('/tmp/kubeconfig'))
+
+    """
+
+    def __init__(self, start_delay=0.0, termination_delay=0.0, failing_images=()):
+        self.start_delay = start_delay
+        self.termination_delay = termination_delay
+        self.failing_images = list(failing_images)
+        self.requests = 0
+        self.watches = 0
+        # (resource, namespace, name) of every delete request
+        self.deletions = []
+        # output written by every pod
+        self.log_output = b''
+        # objects keyed by (resource, namespace, name), namespaces have the namespace ''
+        self.objects = {}
+        self._events = []
+        self._version = 0
+        self._compacted = 0
+        self._addresses = 0
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._timers = []
+        self._server = None
+        self._thread = None
+        self._stopped = False
+        self._routes = [(method, re.compile('^{}$'.format(pattern)), handler) for method, pattern, handler in [
+            ('GET', '/version/?', self._get_version),
+            ('POST', '/api/v1/(?P<resource>namespaces)', self._create),
+            ('GET', '/api/v1/(?P<resource>namespaces)', self._list),
+            ('GET', '/api/v1/(?P<resource>namespaces)/(?P<name>[^/]+)', self._get),
+            ('DELETE', '/api/v1/namespaces/(?P<name>[^/]+)', self._delete_namespace),
+            ('GET', '/api/v1/namespaces/(?P<namespace>[^/]+)/pods/(?P<name>[^/]+)/log', self._pod_log),
+            ('POST', _NAMESPACED, self._create),
+            ('GET', _NAMESPACED, self._list),
+            ('GET', _NAMESPACED + '/(?P<name>[^/]+)', self._get),
+            ('DELETE', _NAMESPACED + '/(?P<name>[^/]+)', self._delete),
+        ]]
+
+    @property
+    def host(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def write_kubeconfig(self, path):
+        """Write a kube config whose current context is this API server to path and return path.
+        """
+        config = {'apiVersion': 'v1', 'kind': 'Config', 'current-context': 'fake', 'preferences': {},
+                  'clusters': [{'name': 'fake', 'cluster': {'server': self.host}}],
+                  'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake'}}],
+                  'users': [{'name': 'fake', 'user': {}}]}
+        with open(path, 'w') as kubeconfig:
+            json.dump(config, kubeconfig)
+        return path
+
+    def start(self):
+        """Start serving on a background thread and return the API server.
+        """
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.engine = self
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='fake-kubernetes')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+            for timer in self._timers:
+                timer.cancel()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def delay(self, method, url):
+        with self._lock:
+            self.requests += 1
+        return 0.0
+
+    def handle(self, method, path, query, body):
+        """Return status and payload of a request, payload is JSON data, bytes or an iterator of JSON data.
+        """
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match is not None and route_method == method:
+                with self._lock:
+                    return handler(query, body, **match.groupdict())
+        raise EngineError(404, 'the server could not find the requested resource: {} {}'.format(method, path))
+
+    def compact(self):
+        """Forget the changes recorded so far, watches from older resource versions fail with 410 Gone.
+        """
+        with self._lock:
+            self._compacted = self._version
+            self._events = []
+
+    def get(self, resource, namespace, name):
+        """Return a copy of an object or None.
+        """
+        with self._lock:
+            found = self.objects.get((resource, namespace or '', name))
+            return copy.deepcopy(found)
+
+    def _later(self, delay, function, *args):
+        def _run():
+            with self._lock:
+                if not self._stopped:
+                    function(*args)
+        timer = threading.Timer(delay, _run)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    def _store(self, resource, namespace, item, change):
+        self._version += 1
+        item['metadata']['resourceVersion'] = str(self._version)
+        key = (resource, namespace, item['metadata']['name'])
+        if change == 'DELETED':
+            self.objects.pop(key, None)
+        else:
+            self.objects[key] = item
+        self._events.append((self._version, resource, namespace, change, copy.deepcopy(item)))
+        self._changed.notify_all()
+
+    def _find(self, resource, namespace, name):
+        found = self.objects.get((resource, namespace, name))
+        if found is None:
+            raise EngineError(404, '{} "{}" not found'.format(resource, name))
+        return found
+
+    # system
+
+    def _get_version(self, query, body):
+        # newer clients reject a version without its build fields
+        return 200, {'major': '1', 'minor': '11', 'gitVersion': 'v1.11.0-fake', 'gitCommit': '', 'gitTreeState': 'clean',
+                     'buildDate': '2018-06-27T20:08:34Z', 'goVersion': 'go1.10.2', 'compiler': 'gc',
+                     'platform': 'linux/amd64'}
+
+    # generic object handling
+
+    def _create(self, query, body, resource, namespace=''):
+        if namespace:
+            phase = self._find('namespaces', '', namespace)['status']['phase']
+            if phase == 'Terminating':
+                raise EngineError(403, 'unable to create new content in namespace {} because it is being '
+                                       'terminated'.format(namespace))
+        item = copy.deepcopy(body)
+        metadata = item.setdefault('metadata', {})
+        if (resource, namespace, metadata.get('name')) in self.objects:
+            raise EngineError(409, '{} "{}" already exists'.format(resource, metadata.get('name')))
+        kind, api_version = RESOURCES[resource]
+        item.update(kind=kind, apiVersion=api_version)
+        metadata.update(uid=str(uuid.uuid4()), creationTimestamp=_timestamp(), generation=1)
+        metadata.setdefault('labels', {})
+        if namespace:
+            metadata['namespace'] = namespace
+        if resource == 'namespaces':
+            item['status'] = {'phase': 'Active'}
+        elif resource == 'pods':
+            self._pending(item)
+        elif resource == 'deployments':
+            item['status'] = {}
+        elif resource == 'services':
+            self._addresses += 1
+            item['spec']['clusterIP'] = '10.96.{}.{}'.format(self._addresses // 250, self._addresses % 250 + 1)
+        self._store(resource, namespace, item, 'ADDED')
+        if resource == 'pods':
+            self._later(self.start_delay, self._start_pod, namespace, metadata['name'])
+        elif resource == 'deployments':
+            for _ in range(item['spec'].get('replicas', 1)):
+                self._create_replica(namespace, item)
+        elif resource == 'services':
+            self._store('endpoints', namespace, {'apiVersion': 'v1', 'kind': 'Endpoints', 'subsets': [], 'metadata': {
+                'name': metadata['name'], 'namespace': namespace, 'labels': dict(metadata['labels']),
+                'uid': str(uuid.uuid4()), 'creationTimestamp': _timestamp()}}, 'ADDED')
+        self._reconcile(namespace)
+        return 201, self.objects[(resource, namespace, metadata['name'])]
+
+    def _get(self, query, body, resource, name, namespace=''):
+        return 200, self._find(resource, namespace, name)
+
+    def _matches(self, item, query):
+        metadata = item['metadata']
+        selector = query.get('labelSelector')
+        if selector and not _labels_match(metadata['labels'], selector.split(',')):
+            return False
+        field_selector = query.get('fieldSelector')
+        if field_selector:
+            key, _, value = field_selector.partition('=')
+            if key != 'metadata.name':
+                raise EngineError(400, 'field selector {} is not supported'.format(field_selector))
+            if metadata['name'] != value:
+                return False
+        return True
+
+    def _list(self, query, body, resource, namespace=''):
+        if query.get('watch') in ['true', 'True', '1']:
+            return 200, self._watch(resource, namespace, query)
+        items = [item for (kind, item_namespace, _), item in sorted(self.objects.items())
+                 if kind == resource and item_namespace == namespace and self._matches(item, query)]
+        return 200, {'apiVersion': RESOURCES[resource][1], 'kind': RESOURCES[resource][0] + 'List',
+                     'metadata': {'resourceVersion': str(self._version)}, 'items': items}
+
+    def _watch(self, resource, namespace, query):
+        # runs outside of the request lock, changes are read under the condition
+        deadline = time.time() + float(query.get('timeoutSeconds') or 1800)
+        with self._changed:
+            self.watches += 1
+            resource_version = query.get('resourceVersion')
+            if resource_version and int(resource_version) < self._compacted:
+                pending = [{'type': 'ERROR', 'object': {
+                    'apiVersion': 'v1', 'kind': 'Status', 'status': 'Failure', 'reason': 'Expired', 'code': 410,
+                    'message': 'too old resource version: {} ({})'.format(resource_version, self._compacted)}}]
+                version = None
+            elif resource_version:
+                pending, version = [], int(resource_version)
+            else:
+                # without a resource version the watch starts with the current state
+                pending = [{'type': 'ADDED', 'object': copy.deepcopy(item)}
+                           for (kind, item_namespace, _), item in sorted(self.objects.items())
+                           if kind == resource and item_namespace == namespace and self._matches(item, query)]
+                version = self._version
+        for event in pending:
+            yield event
+        while version is not None:
+            with self._changed:
+                changes = [change for change in self._events if change[0] > version]
+                if not changes:
+                    remaining = deadline - time.time()
+                    if self._stopped or remaining <= 0:
+                        return
+                    self._changed.wait(min(remaining, 1.0))
+                    continue
+                version = changes[-1][0]
+            for _, kind, item_namespace, change, item in changes:
+                if kind == resource and item_namespace == namespace and self._matches(item, query):
+                    yield {'type': change, 'object': item}
+
+    def _delete(self, query, body, resource, name, namespace=''):
+        item = self._find(resource, namespace, name)
+        self.deletions.append((resource, namespace, name))
+        self._store(resource, namespace, item, 'DELETED')
+        # the garbage collector removes the pods of a deployment, the endpoints go with their service
+        for (kind, item_namespace, item_name), dependent in sorted(self.objects.items()):
+            owners = [owner['uid'] for owner in dependent['metadata'].get('ownerReferences', [])]
+            if item_namespace == namespace and (item['metadata']['uid'] in owners or (
+                    resource == 'services' and kind == 'endpoints' and item_name == name)):
+                self._store(kind, namespace, dependent, 'DELETED')
+        self._reconcile(namespace)
+        return 200, item
+
+    # namespaces
+
+    def _delete_namespace(self, query, body, name):
+        namespace = self._find('namespaces', '', name)
+        self.deletions.append(('namespaces', '', name))
+        if namespace['status']['phase'] != 'Terminating':
+            namespace['status']['phase'] = 'Terminating'
+            self._store('namespaces', '', namespace, 'MODIFIED')
+            self._later(self.termination_delay, self._terminate, name)
+        return 200, namespace
+
+    def _terminate(self, name):
+        for (resource, namespace, _), item in sorted(self.objects.items()):
+            if namespace == name:
+                self._store(resource, namespace, item, 'DELETED')
+        self._store('namespaces', '', self.objects[('namespaces', '', name)], 'DELETED')
+
+    # pods
+
+    def _pending(self, pod):
+        pod['status'] = {'phase': 'Pending', 'conditions': [{'type': 'Ready', 'status': 'False'}],
+                         'containerStatuses': [
+                             {'name': container['name'], 'image': container['image'], 'imageID': '',
+                              'ready': False, 'restartCount': 0,
+                              'state': {'waiting': {'reason': 'ContainerCreating'}}}
+                             for container in pod['spec']['containers']]}
+
+    def _start_pod(self, namespace, name):
+        pod = self.objects.get(('pods', namespace, name))
+        if pod is None:
+            return
+        failing = [container for container in pod['status']['containerStatuses']
+                   if container['image'] in self.failing_images]
+        if failing:
+            for container in failing:
+                container['state'] = {'waiting': {'reason': 'ErrImagePull',
+                                                  'message': 'pull access denied for {}'.format(container['image'])}}
+        else:
+            self._addresses += 1
+            pod['status'].update(phase='Running', podIP='10.244.{}.{}'.format(self._addresses // 250,
+                                                                              self._addresses % 250 + 1),
+                                 conditions=[{'type': 'Ready', 'status': 'True'}])
+            for container in pod['status']['containerStatuses']:
+                container.update(ready=True, imageID='docker-pullable://' + container['image'],
+                                 state={'running': {'startedAt': _timestamp()}})
+        self._store('pods', namespace, pod, 'MODIFIED')
+        self._reconcile(namespace)
+
+    def _pod_log(self, query, body, namespace, name):
+        self._find('pods', namespace, name)
+        return 200, self.log_output
+
+    # controllers
+
+    def _create_replica(self, namespace, deployment):
+        template = copy.deepcopy(deployment['spec']['template'])
+        metadata = template.setdefault('metadata', {})
+        metadata.update(name='{}-{}'.format(deployment['metadata']['name'], uuid.uuid4().hex[:10]),
+                        namespace=namespace, uid=str(uuid.uuid4()), creationTimestamp=_timestamp(),
+                        ownerReferences=[{'apiVersion': 'apps/v1', 'kind': 'Deployment',
+                                          'name': deployment['metadata']['name'],
+                                          'uid': deployment['metadata']['uid']}])
+        pod = dict(template, apiVersion='v1', kind='Pod')
+        self._pending(pod)
+        self._store('pods', namespace, pod, 'ADDED')
+        self._later(self.start_delay, self._start_pod, namespace, metadata['name'])
+
+    def _reconcile(self, namespace):
+        pods = [item for (kind, item_namespace, _), item in sorted(self.objects.items())
+                if kind == 'pods' and item_namespace == namespace]
+        ready = [pod for pod in pods if pod['status']['phase'] == 'Running']
+        for (kind, item_namespace, _), item in sorted(self.objects.items()):
+            if item_namespace != namespace:
+                continue
+            if kind == 'deployments':
+                owned = [pod for pod in pods if any(owner['uid'] == item['metadata']['uid']
+                                                    for owner in pod['metadata'].get('ownerReferences', []))]
+                available = len([pod for pod in owned if pod in ready])
+                status = {'observedGeneration': item['metadata']['generation'], 'replicas': len(owned),
+                          'updatedReplicas': len(owned), 'readyReplicas': available, 'availableReplicas': available}
+                if item['status'] != status:
+                    item['status'] = status
+                    self._store(kind, namespace, item, 'MODIFIED')
+            elif kind == 'services':
+                addresses = [{'ip': pod['status']['podIP'], 'targetRef': {'kind': 'Pod',
+                                                                          'name': pod['metadata']['name']}}
+                             for pod in ready if _selects(item['spec'].get('selector') or {},
+                                                          pod['metadata']['labels'])]
+                endpoints = self.objects[('endpoints', namespace, item['metadata']['name'])]
+                subsets = [{'addresses': addresses,
+                            'ports': [{'port': port.get('targetPort', port['port'])}
+                                      for port in item['spec'].get('ports', [])]}] if addresses else []
+                if endpoints['subsets'] != subsets:
+                    endpoints['subsets'] = subsets
+                    self._store('endpoints', namespace, endpoints, 'MODIFIED')
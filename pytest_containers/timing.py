@@ -0,0 +1,187 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+
+Span = namedtuple('Span', 'name category fixture test thread start duration')
+
+# categories of spans recorded by the plugin
+DOCKER = 'docker'
+FIXTURE_SETUP = 'fixture setup'
+FIXTURE_TEARDOWN = 'fixture teardown'
+TEST = 'test'
+
+_active = None
+
+
+@contextlib.contextmanager
+def _nothing():
+    yield
+
+
+class Timeline(object):
+    """Record timed spans attributed to the fixture and test which triggered them.
+
+    The fixture is tracked per thread so work done on background threads is only attributed
+    to a fixture when it runs inside :py:meth:`fixture`. The test is the one currently running
+    and is only attributed to spans recorded on the thread which runs the tests.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.test = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._main = threading.get_ident()
+        self._pending = {}
+
+    def _fixtures(self):
+        fixtures = getattr(self._local, 'fixtures', None)
+        if fixtures is None:
+            fixtures = self._local.fixtures = []
+        return fixtures
+
+    @contextlib.contextmanager
+    def fixture(self, name):
+        """Attribute the spans recorded by the current thread to fixture name.
+        """
+        fixtures = self._fixtures()
+        fixtures.append(name)
+        try:
+            yield
+        finally:
+            fixtures.pop()
+
+    def context(self):
+        """Return the fixture and test the work of the current thread is attributed to.
+        """
+        fixtures = self._fixtures()
+        test = self.test if threading.get_ident() == self._main else None
+        return fixtures[-1] if fixtures else None, test
+
+    def record(self, name, category, start, duration):
+        fixture, test = self.context()
+        span = Span(name, category, fixture, test, threading.current_thread().name, start, duration)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, category=DOCKER):
+        """Time the enclosed block.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.time() - start)
+
+    def begin_teardown(self, fixture, key):
+        """Start timing the teardown of a fixture instance identified by key.
+        """
+        self._fixtures().append(fixture)
+        self._pending[key] = time.time()
+
+    def end_teardown(self, fixture, key):
+        start = self._pending.pop(key, None)
+        if start is None:
+            return
+        fixtures = self._fixtures()
+        self.record(fixture, FIXTURE_TEARDOWN, start, time.time() - start)
+        if fixtures and fixtures[-1] == fixture:
+            fixtures.pop()
+
+    def _totals(self, spans, key):
+        totals = {}
+        for span in spans:
+            count, total, slowest = totals.get(key(span), (0, 0.0, 0.0))
+            totals[key(span)] = (count + 1, total + span.duration, max(slowest, span.duration))
+        return sorted(totals.items(), key=lambda item: (-item[1][1], item[0]))
+
+    def summary(self, limit=5):
+        """Return report lines of the slowest fixtures and docker operations, or [] when docker was not used.
+        """
+        operations = [span for span in self.spans if span.category == DOCKER]
+        if not operations:
+            return []
+        lines = ['slowest fixtures (setup + teardown):']
+        fixtures = [span for span in self.spans if span.category in [FIXTURE_SETUP, FIXTURE_TEARDOWN]]
+        for fixture, (count, total, slowest) in self._totals(fixtures, lambda span: span.name)[:limit]:
+            lines.append('  {:.2f}s {} ({} calls, slowest {:.2f}s)'.format(total, fixture, count, slowest))
+        lines.append('slowest docker operations:')
+        for (name, fixture), (count, total, slowest) in self._totals(
+                operations, lambda span: (span.name, span.fixture or '(background)'))[:limit]:
+            lines.append('  {:.2f}s {} in {} ({} calls, slowest {:.2f}s)'.format(
+                total, name, fixture, count, slowest))
+        return lines
+
+    def to_json(self):
+        """Return the recorded spans as a JSON serializable list of dicts.
+        """
+        with self._lock:
+            return [span._asdict() for span in self.spans]
+
+    def to_trace(self):
+        """Return the recorded spans in the Chrome trace event format.
+
+        Load the file in ``chrome://tracing`` or https://ui.perfetto.dev to see concurrent
+        work of the background threads on a timeline.
+        """
+        pid = os.getpid()
+        threads = {}
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            args = dict((key, value) for key, value in [('fixture', span.fixture), ('test', span.test)] if value)
+            events.append({'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': int(span.start * 1000000), 'dur': int(span.duration * 1000000), 'args': args})
+        for thread, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def activate(timeline):
+    """Make timeline the one :py:func:`span` and :py:func:`fixture` record to, None disables timing.
+    """
+    global _active
+    _active = timeline
+
+
+def span(name, category=DOCKER):
+    """Time the enclosed block on the active timeline.
+
+    Example:
+        >>> with timing.span('container run'):
+        >>>     docker_client.containers.run(...)
+
+    """
+    return _active.span(name, category) if _active is not None else _nothing()
+
+
+def fixture(name):
+    """Attribute spans of the current thread to fixture name on the active timeline.
+    """
+    return _active.fixture(name) if _active is not None else _nothing()
+
+
+def output_path(path, worker):
+    """Return path of the file written by a pytest-xdist worker, path itself for the master.
+    """
+    if worker == 'master':
+        return path
+    base, extension = os.path.splitext(path)
+    return '{}-{}{}'.format(base, worker, extension)
+
+
+def write(path, data):
+    with open(path, 'w') as output:
+        json.dump(data, output)
+    log.info('wrote {}'.format(path))
@@ -1 +1,17 @@
-pytest_plugins = 'pytester'
\ No newline at end of file
+import os
+import tempfile
+
+import pytest
+
+from pytest_containers.testing.engine import FakeEngine
+
+pytest_plugins = 'pytester'
+
+
+@pytest.fixture
+def engine():
+    # unix socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp(prefix='fake-engine')
+    with FakeEngine(os.path.join(directory, 'docker.sock')) as engine:
+        yield engine
+    os.rmdir(directory)
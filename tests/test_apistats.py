@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from pytest_containers import apistats, cleanup, timing
+
+
+@pytest.mark.parametrize('method,url,expected', [
+    ('GET', 'http+docker://localhost/v1.35/containers/json?all=1', 'GET /containers/json'),
+    ('GET', 'http+docker://localhost/v1.35/containers/3f4e2a/json', 'GET /containers/{id}/json'),
+    ('POST', 'http+docker://localhost/v1.35/containers/create?name=x', 'POST /containers/create'),
+    ('DELETE', 'http+docker://localhost/v1.35/networks/pytest_abc', 'DELETE /networks/{id}'),
+    ('GET', 'http+docker://localhost/v1.35/images/google/python-hello:latest/json', 'GET /images/{name}/json'),
+    ('POST', 'http+docker://localhost/v1.35/images/create?fromImage=busybox', 'POST /images/create'),
+    ('GET', 'http://127.0.0.1:2375/version', 'GET /version'),
+])
+def test_endpoint(method, url, expected):
+    assert apistats.endpoint(method, url) == expected
+
+
+def test_requests_are_attributed_to_fixture_and_test():
+    timeline = timing.Timeline()
+    stats = apistats.ApiStats(timeline)
+    timeline.test = 'test_one'
+    with timeline.fixture('container'):
+        stats.add('POST /containers/create', 0.25)
+        stats.add('POST /containers/{id}/start', 0.25)
+    stats.add('GET /containers/{id}/json', 0.5)
+    assert stats.requests('test_one') == {'POST /containers/create': 1, 'POST /containers/{id}/start': 1,
+                                          'GET /containers/{id}/json': 1}
+    lines = stats.summary(limit=1)
+    assert lines[0] == '3 requests, 1.00s total'
+    assert lines[lines.index('most requests by fixtures:') + 1] == '  2 container (0.50s)'
+
+
+class FakeHTTPEngine(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = json.dumps({'ApiVersion': '1.35'} if self.path == '/version' else []).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_engine(monkeypatch):
+    server = HTTPServer(('127.0.0.1', 0), FakeHTTPEngine)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setenv('DOCKER_HOST', 'tcp://127.0.0.1:{}'.format(server.server_address[1]))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_budget_fails_chatty_tests(testdir, http_engine, monkeypatch):
+    # the stale sweep and the session prune are covered by the cleanup tests
+    monkeypatch.setattr(cleanup, 'prune', lambda *args, **kwargs: {})
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.containers_api_budget(2)
+        def test_chatty(docker_client):
+            for _ in range(3):
+                docker_client.containers.list()
+
+        @pytest.mark.containers_api_budget(2)
+        def test_quiet(docker_client):
+            docker_client.containers.list()
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-api-stats')
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(['*docker API budget exceeded: 3 requests made during setup and call, 2 allowed*',
+                                 '*3 GET /containers/json*'])
+    result.stdout.fnmatch_lines(['*containers api requests*', '4 requests, *', 'most requests by endpoints:',
+                                 '  4 GET /containers/json*'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import docker
+import pytest
+
+from pytest_containers import capabilities
+
+
+def _capabilities(**changes):
+    found = {'docker': True, 'api_version': '1.35', 'server_version': '18.06.0', 'swarm': 'inactive',
+             'swarm_manager': True, 'network_drivers': ['bridge', 'host', 'null', 'overlay'], 'kubernetes': False,
+             'clis': {'docker': True, 'docker-compose': False, 'docker compose': True, 'kubectl': False,
+                      'maestro': False}}
+    found.update(changes)
+    return found
+
+
+def test_unsatisfiable():
+    found = _capabilities()
+    assert capabilities.unsatisfiable({'orchestrator': 'swarm', 'network': 'overlay'}, [], found) is None
+    assert capabilities.unsatisfiable({'orchestrator': 'compose'}, [], found) is None
+    assert capabilities.unsatisfiable({'orchestrator': 'kubernetes'}, [], found) == \
+        'orchestrator kubernetes needs a reachable kubernetes API'
+    assert capabilities.unsatisfiable({'orchestrator': 'maestro'}, [], found) == \
+        'orchestrator maestro needs the maestro command'
+    worker = _capabilities(swarm='active', swarm_manager=False)
+    assert capabilities.unsatisfiable({'network': 'overlay'}, [], worker) == \
+        'network overlay needs swarm mode: this docker node can not manage a swarm (active)'
+    assert capabilities.unsatisfiable({}, ['service'], worker).startswith('service needs swarm mode')
+    assert capabilities.unsatisfiable({'network': 'host'}, [], _capabilities(network_drivers=['bridge', 'nat'])) == \
+        'network host needs the host network driver, the daemon has bridge, nat'
+    # nothing is pruned without a daemon
+    assert capabilities.unsatisfiable({'orchestrator': 'maestro'}, [], _capabilities(docker=False)) is None
+    assert capabilities.unsatisfiable({}, ['pod', 'kubernetes_client'], _capabilities(docker=False)) == \
+        'kubernetes fixtures need a reachable kubernetes API'
+
+
+class FakeCache(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def test_cached_probe(engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    clients = []
+
+    def client_factory():
+        clients.append(docker.DockerClient(base_url=engine.base_url, version='auto'))
+        return clients[-1]
+
+    cache = FakeCache()
+    found = capabilities.cached_probe(cache, 'capabilities', client_factory, max_age=60)
+    assert found['docker'] and found['swarm'] == 'inactive' and found['swarm_manager']
+    assert found['api_version'] == '1.35'
+    assert 'overlay' in found['network_drivers']
+    assert capabilities.cached_probe(cache, 'capabilities', client_factory, max_age=60) == found
+    assert len(clients) == 1
+    capabilities.cached_probe(cache, 'capabilities', client_factory, max_age=0)
+    assert len(clients) == 2
+    monkeypatch.setenv('DOCKER_HOST', 'unix:///nonexistent.sock')
+    assert capabilities.cached_probe(cache, 'capabilities', docker.from_env, max_age=60)['docker'] is False
+
+
+@pytest.mark.parametrize('mode', ['skip', 'deselect'])
+def test_plugin_prunes_impossible_parametrizations(testdir, engine, monkeypatch, tmpdir, mode):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    # no orchestrator tools are installed
+    monkeypatch.setenv('PATH', str(tmpdir))
+    engine.network_drivers = ['bridge', 'host', 'null']
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['host', 'overlay'], indirect=True)
+        def test_network(network):
+            pass
+
+        def test_orchestrator(orchestrator):
+            pass
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '-rs',
+                               '--containers-capabilities=' + mode)
+    if mode == 'skip':
+        result.assert_outcomes(passed=3, skipped=4)
+        result.stdout.fnmatch_lines([
+            '*network overlay needs the overlay network driver, the daemon has bridge, host, null',
+            '*orchestrator kubernetes needs a reachable kubernetes API',
+        ])
+    else:
+        result.assert_outcomes(passed=3, deselected=4)
+
+
+def test_plugin_skips_kubernetes_fixtures_without_api(testdir, engine, monkeypatch, tmpdir):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    monkeypatch.setenv('PATH', str(tmpdir))
+    monkeypatch.setenv('KUBECONFIG', str(tmpdir.join('missing-kubeconfig')))
+    monkeypatch.delenv('KUBERNETES_SERVICE_HOST', raising=False)
+    testdir.makepyfile("""
+        def test_pod(pod):
+            pass
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '-rs')
+    result.assert_outcomes(skipped=1)
+    result.stdout.fnmatch_lines(['*kubernetes fixtures need a reachable kubernetes API'])
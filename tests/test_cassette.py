@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import json
+
+from pytest_containers.cassette import request_key
+
+
+def test_request_key():
+    first = request_key('POST', 'http+docker://localhost/v1.35/containers/create?name=pytest_python-hello_3f2a9c0d1e4b5a67',
+                        b'{"Image": "google/python-hello", "Labels": ["pytest_fixture"]}')
+    second = request_key('POST', 'http+docker://localhost/v1.41/containers/create?name=pytest_python-hello_9be01c4d2f3a',
+                         '{"Labels": ["pytest_fixture"], "Image": "google/python-hello"}')
+    assert first == second
+    assert first == ('POST /containers/create?name=pytest_python-hello_{random} '
+                     '{"Image": "google/python-hello", "Labels": ["pytest_fixture"]}')
+    assert request_key('GET', 'http://localhost/events?since=1.5&until=2.5&filters=%7B%7D', None) == \
+        'GET /events?filters={}'
+    assert request_key('GET', 'http://localhost/volumes/pytest_python-hello_data', None) == \
+        'GET /volumes/pytest_python-hello_data'
+
+
+def test_record_and_replay(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        pytestmark = pytest.mark.usefixtures('swarm')
+
+        class TestContainer:
+            def test_client_container(self, client_container, container):
+                assert container.status == 'running'
+    """)
+    cassette_path = str(testdir.tmpdir.join('cassette.json'))
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0',
+                               '--containers-record', cassette_path)
+    result.assert_outcomes(passed=16)
+    # the replay has no daemon to talk to
+    engine.stop()
+    with open(cassette_path) as cassette_file:
+        requests = [interaction['request'] for interaction in json.load(cassette_file)['interactions']]
+    assert any(request.startswith('POST /containers/create?name=pytest_pytest_python-hello_{random}_client_{random} ')
+               for request in requests)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0',
+                               '--containers-replay', cassette_path)
+    result.assert_outcomes(passed=16)
+
+
+def test_record_and_replay_exclusive(testdir):
+    result = testdir.runpytest('--containers-record', 'a.json', '--containers-replay', 'b.json')
+    result.stderr.fnmatch_lines(['*--containers-record and --containers-replay are mutually exclusive*'])
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import docker
+import pytest
+
+from pytest_containers import cleanup
+
+
+class FakeAPI(object):
+    def __init__(self, existing, failing=()):
+        self.existing = existing
+        self.failing = failing
+        self.list_calls = []
+        self.removed = []
+        self.lock = threading.Lock()
+
+    def containers(self, all=False, quiet=False, filters=None):
+        self.list_calls.append(filters)
+        return [{'Id': x} for x in self.existing]
+
+    def remove_container(self, container, v=False, force=False):
+        if container in self.failing:
+            raise docker.errors.APIError('device or resource busy')
+        with self.lock:
+            self.removed.append(container)
+
+
+class FakeClient(object):
+    def __init__(self, api):
+        self.api = api
+
+
+class FakeContainer(object):
+    def __init__(self, id):
+        self.id = id
+        self.name = 'pytest_' + id
+
+
+def test_removes_survivors_with_one_list_call():
+    api = FakeAPI(existing=['a', 'b', 'other'])
+    containers = [FakeContainer(x) for x in ['a', 'b', 'gone']]
+    cleanup.remove_containers(FakeClient(api), containers)
+    assert api.list_calls == [{'label': 'pytest_fixture'}]
+    assert sorted(api.removed) == ['a', 'b']
+
+
+def test_errors_are_aggregated():
+    api = FakeAPI(existing=['a', 'b', 'c'], failing=['a', 'c'])
+    with pytest.raises(cleanup.TeardownError) as excinfo:
+        cleanup.remove_containers(FakeClient(api), [FakeContainer(x) for x in ['a', 'b', 'c']])
+    assert api.removed == ['b']
+    assert [name for name, err in excinfo.value.errors] == ['pytest_a', 'pytest_c']
+
+
+@pytest.mark.parametrize('api_version', ['1.35', '1.42'])
+def test_prune_session(engine, api_version):
+    engine.api_version = api_version
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    client.swarm.init()
+    mine = {'pytest_fixture': '', cleanup.SESSION_LABEL: 'mine'}
+    theirs = {'pytest_fixture': '', cleanup.SESSION_LABEL: 'theirs'}
+    for name, labels in [('mine', mine), ('theirs', theirs)]:
+        network = client.networks.create(name, driver='bridge', labels=labels)
+        client.volumes.create(name, labels=labels)
+        client.containers.run('google/python-hello', name=name, network=network.name, labels=labels,
+                              volumes={name: {'bind': '/data'}}, detach=True)
+        client.containers.create('google/python-hello', name=name + '_data', labels=labels)
+        client.services.create('google/python-hello', name=name, labels=labels)
+    requests = engine.requests
+    removed = cleanup.prune(client, ['{}=mine'.format(cleanup.SESSION_LABEL)])
+    assert removed == {'services': 1, 'containers': 2, 'networks': 1, 'volumes': 1}
+    # one list per kind, one prune per kind, plus a removal per service and a kill per running container
+    assert engine.requests - requests == 7
+    assert sorted(container['Name'] for container in engine.containers.values()
+                  if 'com.docker.swarm.service.name' not in container['Config']['Labels']) == [
+        '/theirs', '/theirs_data']
+    assert sorted(engine.volumes) == ['theirs']
+    assert [service['Spec']['Name'] for service in engine.services.values()] == ['theirs']
+    client.close()
+
+
+def test_prune_stale(engine):
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    labels = {'pytest_fixture': ''}
+    client.containers.run('google/python-hello', name='fresh', labels=labels, detach=True)
+    client.volumes.create('fresh', labels=labels)
+    requests = engine.requests
+    removed = cleanup.prune(client, ['pytest_fixture'], until=time.time() - 3600)
+    assert removed == {'services': 0, 'containers': 0, 'networks': 0, 'volumes': 0}
+    assert len(engine.containers) == 1
+    assert engine.requests - requests == 5
+    requests = engine.requests
+    removed = cleanup.prune(client, ['pytest_fixture'], until=time.time() + 60)
+    assert removed == {'services': 0, 'containers': 1, 'networks': 0, 'volumes': 1}
+    # volumes have no until filter, so they are removed one by one
+    assert engine.requests - requests == 7
+    assert engine.containers == {}
+    assert engine.volumes == {}
+    client.close()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import time
+
+import pytest
+
+from pytest_containers.dockerx.cli.client import CLIClient
+
+
+FAKE_DOCKER = """#!/bin/sh
+case "$1" in
+    sleep) sleep "$2" ;;
+    fail) echo "failed" >&2; exit 3 ;;
+    *) echo "$@" ;;
+esac
+"""
+
+
+@pytest.fixture
+def cli(tmpdir, monkeypatch):
+    executable = tmpdir.join('docker')
+    executable.write(FAKE_DOCKER)
+    executable.chmod(0o755)
+    monkeypatch.setenv('PATH', '{}{}{}'.format(tmpdir, os.pathsep, os.environ['PATH']))
+    client = CLIClient(timeout=5)
+    client.base_dir = str(tmpdir)
+    return client
+
+
+def test_dispatch_returns_output(cli):
+    assert cli.dispatch(['stack', 'ls']).stdout == 'stack ls\n'
+
+
+def test_dispatch_raises_on_unexpected_returncode(cli):
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        cli.dispatch(['fail'])
+    assert excinfo.value.returncode == 3
+    assert excinfo.value.stderr == 'failed\n'
+    assert cli.dispatch(['fail'], returncode=3).stderr == 'failed\n'
+
+
+def test_dispatch_kills_process_after_timeout(cli):
+    cli.timeout = 0.2
+    started = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        cli.dispatch(['sleep', '10'])
+    assert time.time() - started < 5
+
+
+def test_dispatch_many_runs_commands_concurrently(cli):
+    cli.concurrency = 3
+    started = time.time()
+    results = cli.dispatch_many([['sleep', '0.5'], ['sleep', '0.5'], ['stack', 'rm', 'demo']])
+    assert time.time() - started < 1.4
+    assert [x.stdout for x in results] == ['', '', 'stack rm demo\n']
+
+
+def test_dispatch_many_raises_after_all_commands_finish(cli, tmpdir):
+    with pytest.raises(subprocess.CalledProcessError):
+        cli.dispatch_many([['fail'], ['sleep', '0.2']])
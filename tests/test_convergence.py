@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import queue
+
+import pytest
+
+from pytest_containers.dockerx import convergence
+
+
+def _service(service_id, replicas=None):
+    mode = {'Replicated': {'Replicas': replicas}} if replicas is not None else {'Global': {}}
+    return {'ID': service_id, 'Spec': {'Name': 'demo_' + service_id, 'Mode': mode}}
+
+
+def _task(task_id, service_id, state, desired='running', err=None):
+    status = {'State': state, 'Timestamp': task_id}
+    if err:
+        status['Err'] = err
+    return {'ID': task_id, 'ServiceID': service_id, 'Slot': 1, 'DesiredState': desired, 'Status': status}
+
+
+class FakeStream(object):
+    def __init__(self):
+        self.events = queue.Queue()
+        self.closed = False
+
+    def __iter__(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.closed = True
+        self.events.put(None)
+
+
+class FakeAPI(object):
+    """Tasks advance one state per tasks call, container events name the service.
+    """
+
+    def __init__(self, services, states):
+        self._services = services
+        self.states = states
+        self.stream = FakeStream()
+        self.calls = []
+
+    def services(self, filters=None):
+        return self._services
+
+    def tasks(self, filters=None):
+        self.calls.append(filters)
+        tasks = self.states[0] if len(self.states) == 1 else self.states.pop(0)
+        if 'service' in filters:
+            tasks = [task for task in tasks if task['ServiceID'] == filters['service']]
+        return tasks
+
+    def events(self, since, until, filters, decode):
+        self.filters = filters
+        return self.stream
+
+
+class FakeClient(object):
+    def __init__(self, api):
+        self.api = api
+
+
+def test_converges_on_container_events():
+    api = FakeAPI([_service('web', replicas=2), _service('agent')], [
+        [_task('1', 'web', 'running'), _task('2', 'web', 'starting'), _task('3', 'agent', 'running')],
+        [_task('1', 'web', 'running'), _task('2', 'web', 'running'), _task('3', 'agent', 'running')],
+    ])
+    api.stream.events.put({'Type': 'container', 'Actor': {'Attributes': {convergence.SERVICE_ID_LABEL: 'web'}}})
+    waited = convergence.wait_converged(FakeClient(api), 'demo', timeout=5, poll_interval=60)
+    assert waited < 5
+    assert api.filters == {'label': 'com.docker.stack.namespace=demo', 'type': 'container'}
+    assert api.calls[-1] == {'service': 'web'}
+    assert api.stream.closed
+
+
+def test_polls_without_events():
+    api = FakeAPI([_service('web', replicas=1)], [
+        [_task('1', 'web', 'preparing')],
+        [_task('1', 'web', 'running')],
+    ])
+    convergence.wait_converged(FakeClient(api), 'demo', timeout=5, poll_interval=0.01)
+    assert api.calls[-1] == {'label': 'com.docker.stack.namespace=demo'}
+
+
+def test_raises_with_task_errors():
+    api = FakeAPI([_service('web', replicas=1)], [
+        [_task('1', 'web', 'failed', desired='shutdown', err='task: non-zero exit (1)'),
+         _task('2', 'web', 'rejected', err='No such image: missing')],
+    ])
+    with pytest.raises(convergence.StackConvergenceError) as excinfo:
+        convergence.wait_converged(FakeClient(api), 'demo', timeout=0.2, poll_interval=0.05)
+    assert excinfo.value.task_errors == ['demo_web.1 failed: task: non-zero exit (1)',
+                                         'demo_web.1 rejected: No such image: missing']
+    assert 'demo_web' in str(excinfo.value)
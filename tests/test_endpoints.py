@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import collections
+import errno
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from pytest_containers import endpoints
+from pytest_containers.readiness import Backoff
+
+FAST = Backoff(initial=0.01, factor=2, maximum=0.05)
+
+ExecResult = collections.namedtuple('ExecResult', 'exit_code output')
+
+
+class FakeAPI(object):
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+
+class FakeClient(object):
+    def __init__(self, base_url='http+docker://localhost'):
+        self.api = FakeAPI(base_url)
+
+
+class FakeContainer(object):
+    def __init__(self, name, ports=None, network_mode='bridge', ip='', base_url='http+docker://localhost',
+                 exit_codes=()):
+        self.name = name
+        self.client = FakeClient(base_url)
+        self.attrs = {
+            'Config': {'ExposedPorts': {'{}/tcp'.format(port): {} for port in (ports or {})}},
+            'HostConfig': {'NetworkMode': network_mode},
+            'NetworkSettings': {
+                'Ports': {'{}/tcp'.format(port): [{'HostIp': '0.0.0.0', 'HostPort': str(host_port)}]
+                          for port, host_port in (ports or {}).items()},
+                'Networks': {network_mode: {'IPAddress': ip}}},
+        }
+        self.exit_codes = list(exit_codes)
+        self.commands = []
+
+    def exec_run(self, cmd):
+        self.commands.append(cmd)
+        return ExecResult(self.exit_codes.pop(0) if len(self.exit_codes) > 1 else self.exit_codes[0], b'')
+
+
+def _listen(delay=0, responses=None, dropped=0):
+    # returns the port of a server accepting connections after delay, answering HTTP requests with responses,
+    # the first dropped connections are reset right away like the daemon's proxy does when nothing listens
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    held = []
+
+    def serve():
+        time.sleep(delay)
+        server.listen(16)
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            if len(held) < dropped:
+                held.append(None)
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                connection.close()
+            elif responses:
+                connection.recv(4096)
+                status = responses.pop(0) if len(responses) > 1 else responses[0]
+                connection.sendall('HTTP/1.0 {} X\r\nContent-Length: 0\r\n\r\n'.format(status).encode('ascii'))
+                connection.close()
+            else:
+                held.append(connection)
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return server, port
+
+
+def test_host_address():
+    published = FakeContainer('web', ports={80: 32768})
+    assert endpoints.host_address(published, 80) == ('127.0.0.1', 32768)
+    assert endpoints.exposed_ports(published) == [80]
+    remote = FakeContainer('web', ports={80: 32768}, base_url='http://docker.example.com:2375')
+    assert endpoints.host_address(remote, 80) == ('docker.example.com', 32768)
+    assert endpoints.host_address(FakeContainer('web', network_mode='host'), 80) == ('127.0.0.1', 80)
+    assert endpoints.host_address(FakeContainer('web', ip='172.17.0.2'), 80) == ('172.17.0.2', 80)
+    assert endpoints.host_address(FakeContainer('web', ip='172.17.0.2', base_url='http://remote:2375'), 80) is None
+
+
+def test_ports_are_probed_at_once():
+    servers = [_listen(delay=0.3) for _ in range(10)]
+    containers = [FakeContainer('web{}'.format(number), ports={80: port}) for number, (_, port) in enumerate(servers)]
+    started = time.time()
+    endpoints.wait_for_ports(containers, timeout=5, backoff=FAST)
+    assert time.time() - started < 2
+    for server, _ in servers:
+        server.close()
+
+
+def test_per_port_deadlines():
+    server, port = _listen()
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    container = FakeContainer('web', network_mode='host')
+    started = time.time()
+    with pytest.raises(endpoints.EndpointsNotReady) as excinfo:
+        endpoints.wait_for_ports(container, {port: 5, closed.getsockname()[1]: 0.2}, backoff=FAST)
+    assert time.time() - started < 2
+    assert excinfo.value.failures == [('web', closed.getsockname()[1], 'ECONNREFUSED')]
+    server.close()
+    closed.close()
+
+
+def test_published_ports_stay_open():
+    server, port = _listen(dropped=3)
+    started = time.time()
+    endpoints.wait_for_ports(FakeContainer('web', ports={80: port}), timeout=5, backoff=FAST)
+    assert time.time() - started >= 3 * 0.01 + endpoints.PROXY_SETTLE
+    server.close()
+
+
+class UnroutableSocket(socket.socket):
+    def connect_ex(self, address):
+        return errno.EHOSTUNREACH
+
+
+def test_unroutable_container_addresses_are_probed_inside(monkeypatch):
+    monkeypatch.setattr(socket, 'socket', UnroutableSocket)
+    container = FakeContainer('web', ip='172.18.0.2', exit_codes=[0])
+    endpoints.wait_for_ports(container, [80], timeout=5, backoff=FAST)
+    assert container.commands == [['sh', '-c', endpoints.TCP_COMMAND.format(port=80)]]
+
+
+def test_wait_for_http_status():
+    responses = [503, 503, 200]
+    server, port = _listen(responses=responses)
+    endpoints.wait_for_http(FakeContainer('web', ports={8080: port}), 8080, '/health', timeout=5, backoff=FAST)
+    assert responses == [200]
+    server.close()
+    # connections reset before the request is sent are retried
+    server, port = _listen(responses=[200], dropped=5)
+    endpoints.wait_for_http(FakeContainer('web', network_mode='host'), port, '/health', timeout=5, backoff=FAST)
+    server.close()
+
+
+def test_probes_inside_unreachable_containers():
+    container = FakeContainer('web', ip='10.0.0.2', base_url='http://remote:2375', exit_codes=[1, 0])
+    endpoints.wait_for_http([container], 8080, '/health', timeout=5, backoff=FAST)
+    assert len(container.commands) == 2
+    assert 'http://127.0.0.1:8080/health' in container.commands[0][-1]
+    failing = FakeContainer('db', ip='10.0.0.3', base_url='http://remote:2375', exit_codes=[1])
+    with pytest.raises(endpoints.EndpointsNotReady) as excinfo:
+        endpoints.wait_for_ports(failing, [5432], timeout=0.1, backoff=FAST)
+    assert 'db:5432 (probe exited with 1)' in str(excinfo.value)
+
+
+def test_plugin_wait_for_ports(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    server, port = _listen(delay=0.2)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestWeb:
+            def test_listening(self, container, wait_for_ports):
+                assert wait_for_ports(container, [{}]) > 0
+    """.format(port))
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0')
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(['ports: 1 waits*'])
+    server.close()
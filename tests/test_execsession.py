@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import time
+
+import docker
+import pytest
+
+from pytest_containers.execsession import CommandResult, ExecSession, ExecTimeout
+
+
+@pytest.fixture
+def shell_container(engine):
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    yield client.containers.run('google/python-hello', command='top', detach=True)
+    client.close()
+
+
+def test_commands_share_one_exec(engine, shell_container):
+    session = ExecSession(shell_container)
+    assert session.run('echo out; echo err >&2; exit 3') == CommandResult(3, b'out\n', b'err\n')
+    assert session.run(['printf', '%s', 'no newline; $HOME']) == CommandResult(0, b'no newline; $HOME', b'')
+    assert session.run('cat') == CommandResult(0, b'', b'')
+    assert session.commands == 3
+    assert len(engine.execs) == 1
+    session.close()
+    # the engine notices the shell exited once its process is reaped
+    deadline = time.time() + 5
+    while any(instance['Running'] for instance in engine.execs.values()) and time.time() < deadline:
+        time.sleep(0.01)
+    assert not any(instance['Running'] for instance in engine.execs.values())
+
+
+def test_timed_out_command_is_killed(engine, shell_container):
+    session = ExecSession(shell_container, timeout=5)
+    started = time.time()
+    with pytest.raises(ExecTimeout) as excinfo:
+        session.run('echo started; sleep 10', timeout=0.3)
+    assert time.time() - started < 5
+    assert excinfo.value.stdout == b'started\n'
+    assert session.run('echo next') == CommandResult(0, b'next\n', b'')
+    assert session.starts == 1
+    session.close()
+
+
+def test_plugin_client_session(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestWeb:
+            def test_first(self, client_session):
+                assert client_session.run('echo hello').stdout == b'hello\\n'
+
+            def test_second(self, client_session):
+                assert client_session.run('false').exit_code == 1
+                assert client_session.commands == 2
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0')
+    result.assert_outcomes(passed=2)
+    assert len(engine.execs) == 1
+    assert engine.containers == {}
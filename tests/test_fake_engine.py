@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import time
+
+import docker
+import pytest
+
+
+def test_containers_and_networks(engine):
+    engine.latencies['POST /containers/create'] = 0.2
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    network = client.networks.create('fake', driver='bridge', labels={'pytest_fixture': ''})
+    started = time.time()
+    container = client.containers.run(image='google/python-hello', name='web', network='fake',
+                                      labels=['pytest_fixture'], detach=True)
+    assert time.time() - started >= 0.2
+    container.reload()
+    assert container.status == 'running'
+    assert client.api.containers(quiet=True, filters={'label': 'pytest_fixture'}) == [{'Id': container.id}]
+    with pytest.raises(docker.errors.APIError):
+        network.remove()
+    events = client.events(since=started, until=time.time() + 0.1, filters={'container': container.id},
+                           decode=True)
+    assert [event['Action'] for event in events] == ['create', 'start']
+    container.remove(force=True)
+    network.remove()
+    with pytest.raises(docker.errors.NotFound):
+        client.networks.get('fake')
+    client.close()
+
+
+def test_plugin_fixtures(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        pytestmark = pytest.mark.usefixtures('swarm')
+
+        class TestContainer:
+            def test_client_container(self, client_container, container):
+                assert container.status == 'running'
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0')
+    result.assert_outcomes(passed=16)
+    assert engine.containers == {}
+    assert [network['Name'] for network in engine.networks.values()] == ['bridge', 'host', 'none']
+    assert engine.volumes == {}
+    assert engine.swarm is None
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import threading
+
+import docker
+
+from pytest_containers import images
+
+
+class FakeImage(object):
+    def __init__(self, attrs):
+        self.attrs = attrs
+
+
+class FakeImages(object):
+    def __init__(self, local, remote):
+        self.local = dict(local)
+        self.remote = remote
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            self.calls.append(('get', name))
+        if name not in self.local:
+            raise docker.errors.ImageNotFound(name)
+        return FakeImage(self.local[name])
+
+    def pull(self, name):
+        with self.lock:
+            self.calls.append(('pull', name))
+            self.local[name] = self.remote[name]
+        return FakeImage(self.remote[name])
+
+    def prepare_model(self, attrs):
+        return FakeImage(attrs)
+
+
+class FakeClient(object):
+    def __init__(self, images):
+        self.images = images
+
+    def close(self):
+        pass
+
+
+def image_attrs(name):
+    return {'Id': 'sha256:' + name, 'RepoTags': [name + ':latest'], 'RepoDigests': [name + '@sha256:d' + name]}
+
+
+def test_lookups_are_served_from_memory():
+    client = FakeClient(FakeImages({'a:latest': image_attrs('a')}, {}))
+    registry = images.ImageRegistry(client_factory=lambda: client)
+    assert registry.get(client, 'a:latest').attrs['Id'] == 'sha256:a'
+    assert registry.get(client, 'a:latest').attrs['Id'] == 'sha256:a'
+    assert client.images.calls == [('get', 'a:latest')]
+    assert registry.lookup('sha256:da')['Id'] == 'sha256:a'
+    assert registry.lookup('a@sha256:da')['Id'] == 'sha256:a'
+
+
+def test_prefetch_pulls_missing_images_concurrently():
+    remote = {'b:latest': image_attrs('b'), 'c:latest': image_attrs('c')}
+    client = FakeClient(FakeImages({}, remote))
+    registry = images.ImageRegistry(client_factory=lambda: client, parallelism=2)
+    registry.prefetch(['b:latest', 'c:latest', 'b:latest'])
+    assert registry.get(client, 'c:latest').attrs['Id'] == 'sha256:c'
+    registry.close()
+    assert sorted(x for x in client.images.calls if x[0] == 'pull') == [('pull', 'b:latest'), ('pull', 'c:latest')]
+
+
+def test_prefetch_holds_the_pull_lock():
+    remote = {'d:latest': image_attrs('d')}
+    client = FakeClient(FakeImages({}, remote))
+    held = []
+
+    @contextlib.contextmanager
+    def lock(name):
+        held.append(name)
+        yield
+
+    registry = images.ImageRegistry(client_factory=lambda: client, parallelism=1, lock=lock)
+    registry.prefetch(['d:latest'])
+    registry.close()
+    assert held == ['image d:latest']
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import functools
+import time
+
+import pytest
+
+kubernetes = pytest.importorskip('kubernetes')
+
+from pytest_containers import kube  # noqa: E402
+from pytest_containers.testing.kube import FakeKubernetes  # noqa: E402
+
+
+@pytest.fixture
+def cluster(tmpdir, monkeypatch):
+    monkeypatch.delenv('KUBERNETES_SERVICE_HOST', raising=False)
+    with FakeKubernetes(start_delay=0.2, failing_images=['example/missing:latest']) as cluster:
+        monkeypatch.setenv('KUBECONFIG', cluster.write_kubeconfig(str(tmpdir.join('kubeconfig'))))
+        yield cluster
+
+
+@pytest.fixture
+def core(cluster):
+    client = kube.api_client()
+    kube.create_namespace(kubernetes.client.CoreV1Api(client), 'test', {'pytest_fixture': ''})
+    yield kubernetes.client.CoreV1Api(client)
+    client.close()
+
+
+def test_object_name():
+    assert kube.object_name('pytest_session_5fe2a1') == 'pytest-session-5fe2a1'
+    assert kube.object_name('pytest_My.Service_' + 'a' * 80) == 'pytest-my-service-' + 'a' * 45
+
+
+def test_wait_for_pod_watches(cluster, core):
+    core.create_namespaced_pod('test', kube.pod_manifest('web', 'google/python-hello:latest', {}, {'A': 1}, 8080))
+    requests = cluster.requests
+    started = time.time()
+    pod, waited = kube.wait_for_pod(core, 'test', 'web', timeout=5)
+    assert 0.1 < waited < 2 and time.time() - started < 2
+    assert pod.status.phase == 'Running'
+    assert pod.spec.containers[0].env[0].value == '1'
+    # a single watch request instead of polling
+    assert cluster.requests - requests == 1 and cluster.watches == 1
+
+
+def test_wait_for_failing_pod(cluster, core):
+    core.create_namespaced_pod('test', kube.pod_manifest('web', 'example/missing:latest', {}))
+    with pytest.raises(kube.KubernetesNotReady) as excinfo:
+        kube.wait_for_pod(core, 'test', 'web', timeout=5)
+    assert str(excinfo.value) == 'pod web not ready: container web ErrImagePull: ' \
+                                 'pull access denied for example/missing:latest'
+    core.create_namespaced_pod('test', kube.pod_manifest('slow', 'google/python-hello:latest', {}))
+    with pytest.raises(kube.KubernetesNotReady) as excinfo:
+        kube.wait_for_pod(core, 'test', 'slow', timeout=0.1)
+    assert 'not ready after 0.1 seconds (phase Pending)' in str(excinfo.value)
+
+
+def test_wait_after_expired_resource_version(cluster, core):
+    core.create_namespaced_pod('test', kube.pod_manifest('web', 'google/python-hello:latest', {}))
+    calls = []
+
+    @functools.wraps(core.list_namespaced_pod)
+    def list_function(*args, **kwargs):
+        calls.append(kwargs.get('resource_version'))
+        if len(calls) == 1:
+            # the first watch ends before the pod is ready, the changes it saw are then compacted
+            kwargs['timeout_seconds'] = 0
+            try:
+                return core.list_namespaced_pod(*args, **kwargs)
+            finally:
+                core.create_namespaced_pod('test', kube.pod_manifest('other', 'google/python-hello:latest', {}))
+                cluster.compact()
+        return core.list_namespaced_pod(*args, **kwargs)
+
+    pod, _ = kube.wait_for('pod', list_function, 'test', 'web', kube._pod_pending, timeout=5)
+    assert pod.status.phase == 'Running'
+    assert calls[0] is None and calls[1] is not None and calls[-1] is None
+
+
+def test_deployment_and_service(cluster, core):
+    apps = kubernetes.client.AppsV1Api(core.api_client)
+    apps.create_namespaced_deployment('test', kube.deployment_manifest('web', 'google/python-hello:latest', {},
+                                                                       replicas=2, port=8080))
+    core.create_namespaced_service('test', kube.service_manifest('web', 'web', {}, 8080))
+    deployment, _ = kube.wait_for_deployment(apps, 'test', 'web', timeout=5)
+    assert deployment.status.available_replicas == 2
+    endpoints, _ = kube.wait_for_endpoints(core, 'test', 'web', timeout=5)
+    assert len(endpoints.subsets[0].addresses) == 2
+
+
+def test_delete_object(cluster, core):
+    apps = kubernetes.client.AppsV1Api(core.api_client)
+    apps.create_namespaced_deployment('test', kube.deployment_manifest('web', 'google/python-hello:latest', {}))
+    kube.wait_for_deployment(apps, 'test', 'web', timeout=5)
+    kube.delete_object('deployment', apps.delete_namespaced_deployment, 'test', 'web')
+    # already gone
+    kube.delete_object('deployment', apps.delete_namespaced_deployment, 'test', 'web')
+    assert cluster.deletions == [('deployments', 'test', 'web')]
+    assert [key for key in cluster.objects if key[1] == 'test'] == []
+
+
+def test_prune_namespaces(cluster, core):
+    kube.create_namespace(core, 'other', {})
+    assert kube.prune_namespaces(core, 'pytest_fixture', until=time.time() - 3600) == []
+    assert kube.prune_namespaces(core, 'pytest_fixture', until=time.time() + 3600) == ['test']
+    assert cluster.deletions == [('namespaces', '', 'test')]
+
+
+def test_plugin_kubernetes_fixtures(testdir, cluster):
+    testdir.makepyfile("""
+        import pytest
+
+        class TestPod:
+            def test_running(self, pod, kubernetes_namespace):
+                assert pod.status.phase == 'Running'
+                assert pod.metadata.namespace == kubernetes_namespace
+
+        @pytest.mark.parametrize('deployment', [2], indirect=True)
+        class TestService:
+            def test_available(self, deployment):
+                assert deployment.status.available_replicas == 2
+
+            def test_endpoints(self, kubernetes_service):
+                assert kubernetes_service.spec.ports[0].port == 8080
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(['deployment: 1 waits*', 'kubernetes service: 1 waits*', 'pod: 1 waits*'])
+    # each class deletes its objects, the session then deletes its namespace
+    assert [resource for resource, _, _ in cluster.deletions] == ['pods', 'services', 'deployments', 'namespaces']
+    assert cluster.deletions[-1][2].startswith('pytest-session-')
+    time.sleep(0.1)
+    assert cluster.objects == {}
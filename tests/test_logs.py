@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from pytest_containers.logs import LogBuffer, LogCollector
+
+
+def test_ring_buffer_keeps_the_end():
+    buffer = LogBuffer(limit=16)
+    for number in range(10):
+        buffer.write('line {}\n'.format(number).encode('utf-8'))
+    assert buffer.dropped == 70 - 16
+    # the cut first line is left out
+    assert buffer.tail() == 'line 8\nline 9\n'
+    buffer.write(b'line 10\n')
+    assert buffer.tail() == 'line 9\nline 10\n'
+    assert buffer.tail(lines=1) == 'line 10\n'
+
+
+def test_spill_to_file(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    buffer = LogBuffer(limit=8, path=path)
+    buffer.write(b'first\n')
+    buffer.write(b'second\n')
+    buffer.close()
+    assert buffer.tail() == 'second\n'
+    assert tmpdir.join('web.log').read() == 'first\nsecond\n'
+
+
+def test_collector_keeps_finished_captures_until_discarded(tmpdir):
+    collector = LogCollector(limit=1024, directory=str(tmpdir.join('logs')))
+    release = threading.Event()
+
+    def running():
+        yield b'started\n'
+        release.wait(5)
+
+    finished = collector.capture('pytest/done', lambda: iter([b'done\n']))
+    collector.capture('web', running)
+    finished.stop()
+    assert [title for title, _ in collector.sections()] == ['container log pytest/done', 'container log web']
+    collector.discard_finished()
+    sections = collector.sections()
+    assert [title for title, _ in sections] == ['container log web']
+    assert sections[0][1].startswith('started\n(whole log in ')
+    assert tmpdir.join('logs', 'pytest_done.log').read() == 'done\n'
+    release.set()
+    collector.close()
+
+
+def test_failing_reports_show_container_logs(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    engine.log_output = b'booting\nlistening on 8080\n'
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestWeb:
+            def test_passes(self, container):
+                pass
+
+            def test_fails(self, client_container):
+                assert False
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-log-tail=1')
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(['*- container log pytest_python-hello_* -*', 'listening on 8080',
+                                 '*- container log pytest_pytest_python-hello_*_client_* -*', 'listening on 8080'])
+    assert 'booting' not in result.stdout.str()
+    assert engine.containers == {}
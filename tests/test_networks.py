@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import docker
+import pytest
+
+import pytest_containers
+from pytest_containers import networks
+
+
+@pytest.fixture
+def client(engine):
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    yield client
+    client.close()
+
+
+def test_worker_range():
+    assert str(networks.worker_range('10.199.0.0/16')) == '10.199.0.0/16'
+    assert str(networks.worker_range('10.199.0.0/16', 'gw0', 3)) == '10.199.0.0/18'
+    assert str(networks.worker_range('10.199.0.0/16', 'gw2', 3)) == '10.199.128.0/18'
+
+
+def test_allocator_skips_used_subnets_and_reuses_released(client):
+    client.networks.create('other', ipam=docker.types.IPAMConfig(
+        pool_configs=[docker.types.IPAMPool(subnet='10.199.0.0/25')]))
+    subnets = networks.SubnetAllocator('10.199.0.0/23', prefixlen=24)
+    assert subnets.allocate(client) == '10.199.1.0/24'
+    with pytest.raises(networks.SubnetsExhausted):
+        subnets.allocate(client)
+    subnets.release('10.199.1.0/24')
+    subnets.release('192.168.0.0/24')
+    assert subnets.allocate(client) == '10.199.1.0/24'
+
+
+class FakeConfig(object):
+    def __init__(self, subnets):
+        self._containers_subnets = subnets
+
+
+def test_failed_network_removal_releases_subnet(client):
+    subnets = networks.SubnetAllocator('10.199.0.0/24', prefixlen=25)
+    config = FakeConfig(subnets)
+    subnet = subnets.allocate(client)
+    network = client.networks.create('busy', ipam=docker.types.IPAMConfig(
+        pool_configs=[docker.types.IPAMPool(subnet=subnet)]))
+    client.containers.run('google/python-hello', network=network.name, detach=True)
+    network.reload()
+    with pytest.raises(docker.errors.APIError):
+        pytest_containers._remove_network(config, network)
+    assert subnets.allocate(client) == subnet
+
+
+def test_pool_reuses_detached_networks(engine, client):
+    subnets = networks.SubnetAllocator('10.199.0.0/24', prefixlen=26)
+    created = []
+
+    def create(driver):
+        subnet = subnets.allocate(client)
+        created.append(client.networks.create('pool{}'.format(len(created)), driver=driver,
+                                              ipam=docker.types.IPAMConfig(pool_configs=[docker.types.IPAMPool(subnet=subnet)])))
+        return created[-1]
+
+    network_pool = networks.NetworkPool(2, create, lambda network: network.remove())
+    network = network_pool.acquire('bridge')
+    assert network_pool.owns(network)
+    # a container the test forgot to remove keeps its endpoint
+    container = client.containers.run('google/python-hello', network=network.name, detach=True)
+    network_pool.release(network)
+    assert not network_pool.owns(network)
+    assert container.id not in client.networks.get(network.id).attrs['Containers']
+    again = network_pool.acquire('bridge')
+    assert again.id in [x.id for x in created]
+    network_pool.release(again)
+    network_pool.close()
+    assert len(created) == 2
+    assert sorted(x['Name'] for x in engine.networks.values()) == ['bridge', 'host', 'none']
+
+
+def test_plugin_network_pool(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestFirst:
+            def test_network(self, container, network):
+                assert network.attrs['IPAM']['Config'][0]['Subnet'].startswith('10.199.')
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestSecond:
+            def test_network(self, container, network):
+                assert network.attrs['IPAM']['Config'][0]['Subnet'].startswith('10.199.')
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestThird:
+            def test_network(self, container, network):
+                assert network.attrs['IPAM']['Config'][0]['Subnet'].startswith('10.199.')
+    """)
+    # the classes take turns on a single network
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0',
+                               '--containers-network-range=10.199.0.0/24', '--containers-network-pool-size=1')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(['network bridge: 1 waits*'])
+    # without the pool removed networks hand their subnet to the next class
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0',
+                               '--containers-network-range=10.199.0.0/24')
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(['network bridge: 3 waits*'])
+    assert sorted(x['Name'] for x in engine.networks.values()) == ['bridge', 'host', 'none']
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+
+from pytest_containers import pool
+
+
+class FakeContainer(object):
+    counter = itertools.count()
+
+    def __init__(self):
+        self.id = self.short_id = self.name = 'c{}'.format(next(self.counter))
+        self.removed = threading.Event()
+
+    def remove(self, v=False, force=False):
+        self.removed.set()
+
+
+def test_config_key_is_stable():
+    assert pool.config_key({'a': 1, 'b': [1, 2]}) == pool.config_key({'b': [1, 2], 'a': 1})
+    assert pool.config_key({'a': 1}) != pool.config_key({'a': 2})
+
+
+def test_acquire_keeps_warm_containers_and_recycles():
+    container_pool = pool.ContainerPool(size=2)
+    created = []
+
+    def factory():
+        created.append(FakeContainer())
+        return created[-1]
+
+    first = container_pool.acquire('key', factory)
+    assert container_pool.owns(first)
+    second = container_pool.acquire('key', factory)
+    assert second in created and second is not first
+    container_pool.release(first, reset=lambda container: None)
+    assert not first.removed.is_set()
+    container_pool.release(second)
+    assert second.removed.wait(1)
+    container_pool.close()
+    assert all(container.removed.is_set() for container in created if container is not second)
+
+
+def test_failed_reset_discards_container():
+    container_pool = pool.ContainerPool(size=0)
+    container = container_pool.acquire('key', FakeContainer)
+
+    def reset(container):
+        raise RuntimeError('dirty')
+
+    container_pool.release(container, reset=reset)
+    assert container.removed.wait(1)
+    container_pool.close()
+
+
+def test_close_removes_leased_containers():
+    container_pool = pool.ContainerPool(size=0)
+    container = container_pool.acquire('key', FakeContainer)
+    container_pool.close()
+    assert container.removed.is_set()
+    assert not container_pool.owns(container)
+
+
+def test_plugin_pool_keys_by_readiness_probes(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        probed = []
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestPlain:
+            def test_plain(self, container):
+                pass
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestProbed:
+            @pytest.fixture(scope='class')
+            def readiness_probes(self):
+                return [lambda container: probed.append(container.id) or True]
+
+            def test_probed(self, container):
+                # the warm container of TestPlain never ran this probe
+                assert container.id in probed
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-pool-size=1')
+    result.assert_outcomes(passed=2)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from pytest_containers import provision
+
+
+class FakeClient(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_provisioner(lookahead):
+    provisioner = provision.Provisioner(lookahead, client_factory=FakeClient)
+    provisioner.created = []
+    provisioner.destroyed = []
+    lock = threading.Lock()
+
+    def create(client, spec):
+        with lock:
+            provisioner.created.append(spec)
+        return 'network-' + spec
+
+    provisioner.register('network', create, lambda client, resource: provisioner.destroyed.append(resource))
+    return provisioner
+
+
+def needs(item):
+    return [('network', item[0], item[0]), ('unknown', item, None)]
+
+
+def test_provisions_ahead_and_hands_off():
+    provisioner = make_provisioner(lookahead=2)
+    items = ['a1', 'a2', 'b1', 'c1', 'd1']
+    provisioner.plan(items, needs)
+    provisioner.advance('a1')
+    assert provisioner.take('network', 'a') is None
+    assert provisioner.take('network', 'b') == 'network-b'
+    provisioner.advance('a2')
+    provisioner.advance('b1')
+    assert provisioner.take('network', 'c') == 'network-c'
+    provisioner.close()
+    assert sorted(provisioner.created) == ['b', 'c', 'd']
+    assert provisioner.destroyed == ['network-d']
+    assert provisioner._client.closed
+
+
+def test_close_before_any_test_does_not_create_client():
+    provisioner = make_provisioner(lookahead=1)
+    provisioner.plan(['a1'], needs)
+    provisioner.close()
+    provisioner.advance('a1')
+    assert provisioner.created == []
+    assert provisioner._client is None
+
+
+def test_plugin_does_not_provision_for_skipped_tests(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        class TestFirst:
+            def test_network(self, network):
+                pass
+
+        @pytest.mark.skip(reason='not today')
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        class TestSkipped:
+            def test_network(self, network):
+                pass
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        class TestSkippedIf:
+            @pytest.mark.skipif('sys.platform != "nowhere"', reason='not here')
+            def test_network(self, network):
+                pass
+
+        @pytest.mark.parametrize('network', ['bridge'], indirect=True)
+        class TestLast:
+            def test_network(self, network):
+                pass
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-lookahead=2')
+    result.assert_outcomes(passed=2, skipped=2)
+    created = [event for event in engine.events if event['Type'] == 'network' and event['Action'] == 'create']
+    assert len(created) == 2
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from pytest_containers import readiness
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.watched = []
+
+    def events(self, since=None, until=None, filters=None, decode=False):
+        self.watched.append(filters)
+        return iter([{'status': 'health_status: healthy'}])
+
+
+class FakeContainer(object):
+    """Container whose state advances one step on every reload."""
+    name = 'pytest_fake'
+    id = short_id = 'f00'
+
+    def __init__(self, states, logs=b''):
+        self.client = FakeClient()
+        self.states = list(states)
+        self._logs = logs
+        self.attrs = {}
+
+    def reload(self):
+        self.attrs = {'State': self.states.pop(0) if len(self.states) > 1 else self.states[0]}
+
+    def logs(self, tail=None):
+        return self._logs
+
+
+FAST = readiness.Backoff(initial=0.01, factor=2, maximum=0.01)
+
+
+def test_ready_when_running_without_healthcheck():
+    container = FakeContainer([{'Status': 'running'}])
+    readiness.wait_for_container(container, timeout=1, backoff=FAST)
+    assert container.client.watched == []
+
+
+def test_waits_for_healthy_transition():
+    container = FakeContainer([
+        {'Status': 'running', 'Health': {'Status': 'starting'}},
+        {'Status': 'running', 'Health': {'Status': 'healthy'}},
+    ])
+    readiness.wait_for_container(container, timeout=1, backoff=FAST)
+    assert len(container.client.watched) == 1
+    assert 'health_status' in container.client.watched[0]['event']
+
+
+def test_fails_fast_with_exit_code_and_logs():
+    container = FakeContainer([{'Status': 'exited', 'ExitCode': 3}], logs=b'boom\n')
+    with pytest.raises(readiness.ContainerNotReady) as excinfo:
+        readiness.wait_for_container(container, timeout=10, backoff=FAST)
+    assert excinfo.value.exit_code == 3
+    assert 'boom' in str(excinfo.value)
+
+
+def test_probes_and_deadline():
+    container = FakeContainer([{'Status': 'running'}])
+    with pytest.raises(readiness.ContainerNotReady):
+        readiness.wait_for_container(container, timeout=0.05, backoff=FAST, probes=[lambda c: False])
+    calls = []
+    readiness.wait_for_container(container, timeout=1, backoff=FAST, probes=[lambda c: calls.append(c) or len(calls) > 2])
+    assert len(calls) == 3
+
+
+def test_parse_backoff():
+    assert readiness.parse_backoff('0.1,3,2') == readiness.Backoff(0.1, 3.0, 2.0)
+    with pytest.raises(ValueError):
+        readiness.parse_backoff('fast')
+
+
+class FakeNetwork(object):
+    name = 'pytest_fake'
+    id = short_id = 'n00'
+
+    def __init__(self, configs):
+        self.client = FakeClient()
+        self.configs = list(configs)
+        self.attrs = {}
+
+    def reload(self):
+        config = self.configs.pop(0) if len(self.configs) > 1 else self.configs[0]
+        self.attrs = {'Driver': 'overlay', 'IPAM': {'Config': config}}
+
+
+def test_network_confirmed_by_inspection():
+    network = FakeNetwork([[], [{'Subnet': '10.0.0.0/24'}]])
+    readiness.wait_for_network(network, timeout=1, backoff=FAST)
+    assert network.client.watched[0]['type'] == 'network'
+    with pytest.raises(readiness.NetworkNotReady):
+        readiness.wait_for_network(FakeNetwork([[]]), timeout=0.05, backoff=FAST)
+
+
+def test_readiness_report():
+    report = readiness.ReadinessReport()
+    report.record('container', 0.5)
+    report.record('container', 1.5)
+    assert report.summary() == ['container: 2 waits, 2.00s total, 1.00s average']
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import json
+
+from pytest_containers import scheduling
+
+
+CONFTEST = """
+    import pytest
+
+    @pytest.fixture(scope='session', params=['a', 'b'])
+    def orch(request):
+        return request.param
+
+    @pytest.fixture(scope='module')
+    def image(request):
+        return request.module.__name__
+
+    @pytest.fixture(scope='class', params=['x', 'y'])
+    def net(request):
+        return request.param
+"""
+
+TESTS = """
+    class TestA:
+        def test_1(self, orch, image, net):
+            pass
+
+        def test_2(self, image, net):
+            pass
+
+    def test_3(orch, image):
+        pass
+"""
+
+
+def test_reorder_keeps_default_order_when_it_is_cheapest(testdir):
+    testdir.makeconftest(CONFTEST)
+    testdir.makepyfile(test_one=TESTS, test_two=TESTS)
+    result = testdir.runpytest('--containers-reorder', '-p', 'no:cacheprovider')
+    result.stdout.fnmatch_lines(['kept default order: * fixture setups*'])
+    assert result.ret == 0
+
+
+def test_reorder_reduces_expensive_setups(testdir):
+    testdir.makeconftest(CONFTEST)
+    testdir.makepyfile(test_one=TESTS, test_two=TESTS)
+    costs = testdir.makefile('.json', costs=json.dumps({'orch': 1.0, 'image': 3.0, 'net': 0.3}))
+    result = testdir.runpytest('--containers-reorder', '--containers-cost-model={}'.format(costs), '-p', 'no:cacheprovider')
+    result.stdout.fnmatch_lines(['reordered tests: * fixture setups instead of *, estimated *s saved'])
+    assert result.ret == 0
+
+
+def test_cost_model_prefers_measured_timings():
+    model = scheduling.CostModel({'network[bridge]': 2.0})
+    assert model.cost('network', 'bridge') == 2.0
+    assert model.cost('network', 'overlay') == scheduling.DEFAULT_COSTS['network[overlay]']
+    assert model.cost('unknown') == scheduling.DEFAULT_COST
+    model.observe('unknown', None, 1.0)
+    model.observe('unknown', None, 2.0)
+    assert model.cost('unknown') == 0.7 * 1.0 + 0.3 * 2.0
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from pytest_containers import shared
+
+
+def test_last_user_destroys_shared_resource(tmpdir):
+    created, destroyed = [], []
+    gw0 = shared.SharedResources(tmpdir, worker='gw0')
+    gw1 = shared.SharedResources(tmpdir, worker='gw1')
+
+    def create():
+        created.append(True)
+        return {'preexist': False}
+
+    assert gw0.acquire('swarm', create) == {'preexist': False}
+    assert gw1.acquire('swarm', create) == {'preexist': False}
+    assert len(created) == 1
+    gw0.release('swarm', destroyed.append)
+    assert destroyed == []
+    gw1.release('swarm', destroyed.append)
+    assert destroyed == [{'preexist': False}]
+    # a later user creates the resource again
+    gw0.acquire('swarm', create)
+    assert len(created) == 2
+
+
+def test_dead_workers_are_forgotten(tmpdir):
+    resources = shared.SharedResources(tmpdir, worker='gw0')
+    resources._write('swarm', {'value': 1, 'users': {'gw9': 2 ** 22 + 1}})
+    destroyed = []
+    resources.acquire('swarm', lambda: 2)
+    resources.release('swarm', destroyed.append)
+    assert destroyed == [1]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import time
+
+import docker
+
+from pytest_containers.snapshots import KEY_LABEL, SnapshotCache, snapshot_key
+
+
+class FakeImage(object):
+    id = 'sha256:1234'
+
+
+def migrate(container):
+    container.exec_run('migrate')
+
+
+def warmup(container):
+    container.exec_run('warmup')
+
+
+def test_snapshot_key():
+    key = snapshot_key(FakeImage(), migrate, {'DEBUG': '1'})
+    assert len(key) == 16
+    assert key == snapshot_key(FakeImage(), migrate, {'DEBUG': '1'})
+    assert key != snapshot_key(FakeImage(), migrate, {'DEBUG': '0'})
+    assert key != snapshot_key(FakeImage(), warmup, {'DEBUG': '1'})
+    warmup.snapshot_key = 'v1'
+    assert snapshot_key(FakeImage(), warmup) != snapshot_key(FakeImage(), migrate)
+
+
+def _created(seconds_ago):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - seconds_ago))
+
+
+def test_evict(engine):
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    snapshots = {}
+    for name, age in [('new', 60), ('recent', 120), ('old', 600), ('expired', 7200)]:
+        snapshots[name] = engine.add_image('pytest-containers-snapshot:' + name, {
+            'Created': _created(age), 'Size': 100, 'Config': {'Labels': {KEY_LABEL: name}}})['Id']
+    cache = SnapshotCache(max_age=3600, max_size=250)
+    cache.lookup(client, 'old')
+    assert cache.hits == 1
+    assert cache.lookup(client, 'missing') is None
+    assert cache.misses == 1
+    evicted = cache.evict(client)
+    # old is kept as it was used, which leaves room for new only
+    assert sorted(evicted) == sorted([snapshots['recent'], snapshots['expired']])
+    assert sorted(image['RepoTags'][0] for image in engine.images.values()) == [
+        'google/python-hello:latest', 'pytest-containers-snapshot:new', 'pytest-containers-snapshot:old']
+    client.close()
+
+
+def test_plugin_snapshot(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.fixture(scope='class')
+        def container_init():
+            def init(container):
+                with open('init.log', 'a') as init_log:
+                    init_log.write(container.name + '\\n')
+            return init
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestFirst:
+            def test_container(self, container):
+                assert container.status == 'running'
+
+        @pytest.mark.parametrize('network', ['host'], indirect=True)
+        @pytest.mark.parametrize('volumes', ['anonymous'], indirect=True)
+        class TestSecond:
+            def test_container(self, container):
+                assert container.status == 'running'
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-snapshot')
+    result.assert_outcomes(passed=2)
+    assert len(testdir.tmpdir.join('init.log').readlines()) == 1
+    snapshots = [image for image in engine.images.values() if KEY_LABEL in (image['Config'].get('Labels') or {})]
+    assert len(snapshots) == 1
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-snapshot')
+    result.assert_outcomes(passed=2)
+    assert len(testdir.tmpdir.join('init.log').readlines()) == 1
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0')
+    result.assert_outcomes(passed=2)
+    assert len(testdir.tmpdir.join('init.log').readlines()) == 3
+    assert engine.containers == {}
+
+
+def test_plugin_evicts_from_last_xdist_worker(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw0')
+    engine.add_image('pytest-containers-snapshot:expired', {
+        'Created': _created(7200), 'Size': 100, 'Config': {'Labels': {KEY_LABEL: 'expired'}}})
+    testdir.makepyfile("""
+        def test_snapshots(snapshot_cache):
+            assert snapshot_cache is not None
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-snapshot',
+                               '--containers-snapshot-max-age=1')
+    result.assert_outcomes(passed=1)
+    assert ['google/python-hello:latest'] == [image['RepoTags'][0] for image in engine.images.values()]
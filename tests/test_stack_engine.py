@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import docker
+import pytest
+
+from pytest_containers.dockerx import compose, engine
+
+
+COMPOSE = """
+version: '3.4'
+services:
+  web:
+    image: nginx:${NGINX_TAG:-latest}
+    command: nginx -g 'daemon off;'
+    environment:
+      - MODE=test
+    ports:
+      - "8080:80"
+      - "443"
+    networks:
+      backend:
+        aliases: [www]
+    secrets:
+      - source: token
+        target: api_token
+        mode: "0400"
+    deploy:
+      replicas: 2
+      labels:
+        tier: front
+  worker:
+    image: busybox
+networks:
+  backend:
+    attachable: true
+secrets:
+  token:
+    file: ./token.txt
+"""
+
+
+class FakeModel(object):
+    def __init__(self, name, attrs=None):
+        self.name = self.id = name
+        self.attrs = attrs or {}
+        self.removed = False
+
+    def remove(self):
+        self.removed = True
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.created = []
+        self.items = []
+
+    def list(self, filters=None):
+        return self.items
+
+    def create(self, **kwargs):
+        self.created.append(kwargs)
+        model = FakeModel(kwargs['name'], kwargs)
+        self.items.append(model)
+        return model
+
+    def get(self, name):
+        return FakeModel(name)
+
+
+class FakeCLI(object):
+    base_dir = 'fixtures'
+
+
+class FakeAPI(object):
+    def __init__(self):
+        # task lists returned by successive calls, the last one repeats
+        self.task_lists = [[]]
+        self.task_calls = 0
+
+    def tasks(self, filters=None):
+        self.task_calls += 1
+        return self.task_lists.pop(0) if len(self.task_lists) > 1 else self.task_lists[0]
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.api = FakeAPI()
+        self.cli = FakeCLI()
+        self.services = FakeCollection()
+        self.networks = FakeCollection()
+        self.secrets = FakeCollection()
+
+
+@pytest.fixture
+def compose_file(tmpdir):
+    tmpdir.join('token.txt').write('s3cret')
+    path = tmpdir.join('compose.yml')
+    path.write(COMPOSE)
+    return str(path)
+
+
+def test_interpolation():
+    environment = {'SET': 'value', 'EMPTY': ''}
+    assert compose.interpolate('${SET}-$SET-$${SET}', environment) == 'value-value-${SET}'
+    assert compose.interpolate('${EMPTY:-default}/${EMPTY-default}/${UNSET}', environment) == 'default//'
+    with pytest.raises(compose.ComposeError):
+        compose.interpolate('${UNSET?must be set}', environment)
+    assert compose.parse_duration('1m30s') == 90 * 10 ** 9
+    assert compose.parse_bytes('50M') == 50 * 1024 ** 2
+
+
+def test_deploy_creates_labelled_objects(compose_file):
+    client = FakeClient()
+    resp = engine.StackEngine(client).deploy('demo', compose_file)
+    assert resp == {'Name': 'demo', 'Services': 2}
+    namespace = {engine.NAMESPACE_LABEL: 'demo'}
+    assert [x['name'] for x in client.networks.created] == ['demo_backend', 'demo_default']
+    assert all(x['labels'] == namespace for x in client.networks.created)
+    assert client.secrets.created == [{'name': 'demo_token', 'data': b's3cret', 'labels': namespace}]
+    web, worker = client.services.created
+    assert web['name'] == 'demo_web'
+    assert web['image'] == 'nginx:latest'
+    assert web['args'] == ['nginx', '-g', 'daemon off;']
+    assert web['env'] == ['MODE=test']
+    assert web['labels'] == dict(namespace, tier='front', **{engine.IMAGE_LABEL: 'nginx:latest'})
+    assert web['container_labels'] == namespace
+    assert web['networks'] == [{'Target': 'demo_backend', 'Aliases': ['web', 'www']}]
+    assert web['mode']['replicated'] == {'Replicas': 2}
+    assert web['endpoint_spec']['Ports'] == [
+        {'TargetPort': 80, 'PublishedPort': 8080, 'Protocol': 'tcp', 'PublishMode': 'ingress'},
+        {'TargetPort': 443, 'Protocol': 'tcp', 'PublishMode': 'ingress'}]
+    assert web['secrets'][0]['File']['Name'] == 'api_token'
+    assert web['secrets'][0]['File']['Mode'] == 0o400
+    assert worker['networks'] == [{'Target': 'demo_default', 'Aliases': ['worker']}]
+
+
+def test_remove_removes_services_secrets_and_networks(compose_file):
+    client = FakeClient()
+    engine.StackEngine(client).deploy('demo', compose_file)
+    engine.StackEngine(client).remove('demo')
+    assert all(x.removed for x in client.services.items + client.secrets.items + client.networks.items)
+
+
+class BusyNetwork(FakeModel):
+    def __init__(self, name, busy):
+        super(BusyNetwork, self).__init__(name)
+        self.busy = busy
+
+    def remove(self):
+        if self.busy > 0:
+            self.busy -= 1
+            raise docker.errors.APIError('error while removing network: network {} has active endpoints'.format(
+                self.name))
+        self.removed = True
+
+
+def test_remove_waits_for_tasks_and_retries_networks_in_use(compose_file):
+    client = FakeClient()
+    engine.StackEngine(client).deploy('demo', compose_file)
+    client.api.task_lists = [[{'ID': 'task1'}], [{'ID': 'task1'}], []]
+    client.networks.items = [BusyNetwork('demo_backend', busy=2)]
+    engine.StackEngine(client).remove('demo', poll_interval=0.01)
+    assert client.api.task_calls == 3
+    assert client.networks.items[0].removed
+    client.networks.items = [BusyNetwork('demo_backend', busy=100)]
+    with pytest.raises(docker.errors.APIError):
+        engine.StackEngine(client).remove('demo', timeout=0.05, poll_interval=0.01)
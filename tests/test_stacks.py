@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+from docker import errors
+
+from pytest_containers.dockerx import DockerClient
+
+
+class FakeCLI(object):
+    base_dir = 'fixtures'
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def stacks(self, filters=None):
+        self.calls += 1
+        return {'Stacks': [{'Name': name, 'Services': '1'} for name in self.names]}
+
+
+@pytest.fixture
+def client():
+    client = DockerClient(base_url='unix:///nonexistent.sock', version='1.35')
+    client.cli = FakeCLI(['web', 'db'])
+    yield client
+    client.close()
+
+
+def test_lookups_are_served_from_the_index(client):
+    assert client.stacks.get('web').name == 'web'
+    assert client.stacks.get('db').name == 'db'
+    assert [x.name for x in client.stacks.list()] == ['db', 'web']
+    assert client.cli.calls == 1
+
+
+def test_list_filters_by_names(client):
+    assert [x.name for x in client.stacks.list(names=['web', 'missing'])] == ['web']
+
+
+def test_get_reloads_before_not_found(client):
+    client.stacks.list()
+    client.cli.names.append('late')
+    assert client.stacks.get('late').name == 'late'
+    with pytest.raises(errors.NotFound):
+        client.stacks.get('missing')
+    assert client.cli.calls == 3
+
+
+def test_index_expires_and_is_invalidated(client):
+    client.stack_index.ttl = 0
+    client.stacks.list()
+    client.stacks.list()
+    assert client.cli.calls == 2
+    client.stack_index.ttl = 60
+    client.stack_index.invalidate()
+    client.stacks.list()
+    client.stacks.list()
+    assert client.cli.calls == 3
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+import tarfile
+
+import docker
+import pytest
+
+from pytest_containers.templates import TemplateStore
+
+
+@pytest.fixture
+def template(tmpdir):
+    source = tmpdir.mkdir('template')
+    source.join('users.csv').write('id,name\n1,hello\n')
+    source.mkdir('media').join('logo.png').write_binary(b'\x89PNG')
+    return str(source)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        TemplateStore('copy')
+    # the daemon may not see the filesystem of this process
+    assert TemplateStore().strategy == 'tar'
+
+
+@pytest.mark.parametrize('strategy', ['auto', 'overlay', 'tar'])
+def test_clone_directory(tmpdir, template, strategy):
+    store = TemplateStore(strategy)
+    for name in ['first', 'second']:
+        store.clone_directory(template, str(tmpdir.mkdir(name)))
+        assert tmpdir.join(name, 'users.csv').read() == 'id,name\n1,hello\n'
+        assert tmpdir.join(name, 'media', 'logo.png').read_binary() == b'\x89PNG'
+    assert ('reflink' in store._probed) == (strategy == 'auto')
+    store.close()
+
+
+def test_clone_directory_from_tar(tmpdir, template):
+    archive_path = str(tmpdir.join('template.tar.gz'))
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        archive.add(os.path.join(template, 'users.csv'), arcname='users.csv')
+    store = TemplateStore('auto')
+    store.clone_directory(archive_path, str(tmpdir.mkdir('clone')))
+    assert tmpdir.join('clone', 'users.csv').read() == 'id,name\n1,hello\n'
+    assert store.template(archive_path).seed() == store.template(archive_path).seed()
+    store.close()
+
+
+def test_clone_volume(engine, template):
+    client = docker.DockerClient(base_url=engine.base_url, version='auto')
+    image = client.images.get('google/python-hello')
+    store = TemplateStore('tar')
+    store.clone_volume(client, template, 'seeded', {'pytest_fixture': ''}, image, '/data')
+    store.clone_volume(client, template, 'seeded2', {'pytest_fixture': ''}, image, '/data')
+    assert sorted(engine.volumes) == ['seeded', 'seeded2']
+    assert engine.containers == {}
+    assert len(engine.archives) == 2
+    assert sorted(engine.archives[0]['Names']) == ['media', 'media/logo.png', 'users.csv']
+    assert engine.archives[0]['Path'] == '/data'
+    store.strategy = 'overlay'
+    store.clone_volume(client, template, 'overlay', {'pytest_fixture': ''}, image, '/data')
+    options = engine.volumes['overlay']['Options']
+    assert options['type'] == 'overlay'
+    assert options['o'].startswith('lowerdir={},upperdir='.format(template))
+    store.close()
+    client.close()
+
+
+def test_plugin_volume_templates(testdir, engine, monkeypatch):
+    monkeypatch.setenv('DOCKER_HOST', engine.base_url)
+    testdir.mkdir('data').join('users.csv').write('id,name\n')
+    testdir.makepyfile("""
+        import os
+
+        import pytest
+
+        @pytest.fixture(scope='class')
+        def volume_templates():
+            return {'/data': 'data'}
+
+        @pytest.mark.parametrize('volumes', ['bind', 'container', 'named'], indirect=True)
+        def test_seeded(volumes, docker_client):
+            volume, = volumes
+            if volume['type'] == 'bind':
+                assert os.path.exists(os.path.join(str(volume['source']), 'users.csv'))
+            elif volume['type'] == 'named':
+                assert docker_client.volumes.get(volume['source']).attrs['Options']['type'] == 'overlay'
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-durations=0', '--containers-volume-clone',
+                               'overlay')
+    result.assert_outcomes(passed=3)
+    assert [(archive['Path'], archive['Names']) for archive in engine.archives] == [('/data', ['users.csv'])]
+    assert engine.volumes == {}
+    assert engine.containers == {}
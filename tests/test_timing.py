@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+from pytest_containers import timing
+
+
+def test_spans_are_attributed_to_fixture_and_test():
+    timeline = timing.Timeline()
+    timeline.test = 'test_one'
+    with timeline.fixture('network'):
+        with timeline.span('network create'):
+            pass
+
+    def pull():
+        with timeline.span('image pull'):
+            pass
+    background = threading.Thread(target=pull)
+    with timeline.span('image pull'):
+        background.start()
+        background.join()
+    spans = dict(((span.name, span.thread == 'MainThread'), span) for span in timeline.spans)
+    assert spans[('network create', True)][2:4] == ('network', 'test_one')
+    assert spans[('image pull', True)][2:4] == (None, 'test_one')
+    # work on other threads is not attributed to the running test
+    assert spans[('image pull', False)][2:4] == (None, None)
+
+
+def test_summary_and_trace():
+    timeline = timing.Timeline()
+    timeline.record('container', timing.FIXTURE_SETUP, 10.0, 2.0)
+    timeline.record('container', timing.FIXTURE_TEARDOWN, 20.0, 1.0)
+    timeline.record('network', timing.FIXTURE_SETUP, 9.0, 0.5)
+    assert timeline.summary() == []
+    with timeline.fixture('container'):
+        timeline.record('container run', timing.DOCKER, 10.0, 1.5)
+    lines = timeline.summary(limit=1)
+    assert lines == ['slowest fixtures (setup + teardown):',
+                     '  3.00s container (2 calls, slowest 2.00s)',
+                     'slowest docker operations:',
+                     '  1.50s container run in container (1 calls, slowest 1.50s)']
+    trace = timeline.to_trace()
+    complete = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    assert len(complete) == 4
+    assert complete[-1]['ts'] == 10000000 and complete[-1]['dur'] == 1500000
+    assert complete[-1]['args'] == {'fixture': 'container'}
+    assert [event['args']['name'] for event in trace['traceEvents'] if event['ph'] == 'M'] == ['MainThread']
+
+
+def test_output_path():
+    assert timing.output_path('trace.json', 'master') == 'trace.json'
+    assert timing.output_path('trace.json', 'gw1') == 'trace-gw1.json'
+
+
+def test_plugin_reports_and_exports_spans(testdir):
+    testdir.makeconftest("""
+        import pytest
+        from pytest_containers import timing
+
+        @pytest.fixture(scope='module')
+        def thing():
+            with timing.span('thing create'):
+                pass
+            yield 'thing'
+            with timing.span('thing rm'):
+                pass
+    """)
+    testdir.makepyfile("""
+        def test_thing(thing):
+            assert thing == 'thing'
+    """)
+    result = testdir.runpytest('-p', 'no:cacheprovider', '--containers-trace=trace.json',
+                               '--containers-timing-json=spans.json')
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(['*containers slowest durations*', '*thing create in thing (1 calls*'])
+    result.stdout.fnmatch_lines(['*containers slowest durations*', '*thing rm in thing (1 calls*'])
+    spans = json.loads(testdir.tmpdir.join('spans.json').read())
+    by_name = dict((span['name'], span) for span in spans)
+    assert by_name['thing create']['test'].endswith('::test_thing')
+    assert by_name['thing rm']['fixture'] == 'thing'
+    assert set(span['category'] for span in spans) == set(
+        [timing.DOCKER, timing.FIXTURE_SETUP, timing.FIXTURE_TEARDOWN, timing.TEST])
+    trace = json.loads(testdir.tmpdir.join('trace.json').read())
+    assert any(event['name'] == 'thing create' for event in trace['traceEvents'])